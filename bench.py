@@ -0,0 +1,363 @@
+#! python3
+import argparse
+import collections
+import itertools
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+""" Benchmarks of the collect -> parse -> convert -> render pipeline of zfs-pool-stats.py, and of its startup.
+
+Fake `zpool` and `zfs` executables are put first on PATH, which print synthetic output (or output
+recorded with --record) instantly, so only the cost of zfs-pool-stats.py itself is measured: starting
+the commands, parsing their output, converting values and rendering rows. Every stage is measured
+for a range of pool, dataset and column counts.
+
+Startup is measured as the time for a new Python process to import the package, to print --help,
+and to collect() a single sample, since cron jobs and health checks start a new process every time.
+
+    python3 bench.py --save bench_baseline.json        Measure, and store the results as the baseline.
+    python3 bench.py --baseline bench_baseline.json    Measure, and flag any stage slower than the baseline.
+"""
+
+#####  Accept arguments  #####
+
+parser = argparse.ArgumentParser(description="Benchmark the collect, parse, convert and render pipeline of zfs-pool-stats.py.")
+
+parser.add_argument('--pools', dest="POOLS", type=lambda string: [int(count) for count in string.split(',')],
+                    default=[1, 10, 100],
+                    help='A comma-separated list of pool counts to measure. For example:  --pools 1,10,100 ')
+
+parser.add_argument('--datasets', dest="DATASETS", type=lambda string: [int(count) for count in string.split(',')],
+                    default=[10, 1000],
+                    help='A comma-separated list of dataset counts per pool to measure. The snapshot source lists \
+                          every dataset (and the space used by its snapshots), so this is what it scales with. \
+                          For example:  --datasets 10,1000,10000 ')
+
+parser.add_argument('--recorded', dest="RECORDED", default=None,
+                    help='Instead of synthetic output, have the fake commands print the output recorded by \
+                          zfs-pool-stats.py --record. For example:  --recorded incident.log.gz ')
+
+parser.add_argument('--time', dest="TIME", type=float, default=0.5,
+                    help='The time (in seconds) to spend measuring each stage. For example:  --time 2 ')
+
+parser.add_argument('--save', dest="SAVE", default=None,
+                    help='Store the results in this file, as the baseline for later runs. For example:  --save bench_baseline.json ')
+
+parser.add_argument('--baseline', dest="BASELINE", default=None,
+                    help='Compare the results against a baseline stored with --save, and exit with status 1 if \
+                          any stage is slower by more than --threshold. For example:  --baseline bench_baseline.json ')
+
+parser.add_argument('--threshold', dest="THRESHOLD", type=float, default=0.2,
+                    help='The slowdown (as a fraction) at which a stage is flagged as a regression. For example:  --threshold 0.1 ')
+
+args = parser.parse_args()
+
+
+#####  Define functions  #####
+
+
+def load_package(directory):
+    """Import the zfs_pool_stats package from directory.
+
+    Returns:
+        A dictionary of the global names of every module of the package, such as get_stats and ColumnPlan.
+    """
+    sys.path.insert(0, directory)
+    import zfs_pool_stats.cli
+    import zfs_pool_stats.replay
+
+    namespace = {}
+    for name, module in sorted(sys.modules.items()):
+        if name.startswith("zfs_pool_stats."):
+            namespace.update(vars(module))
+    return namespace
+
+
+# The fake executables. Each prints the output stored in $ZFS_BENCH_DATA for the command it was run as.
+fake_zpool = """#!/bin/sh
+case "$1" in
+iostat) exec cat "$ZFS_BENCH_DATA/iostat.txt";;
+status) exec cat "$ZFS_BENCH_DATA/status.txt";;
+list) case "$*" in *name,*) exec cat "$ZFS_BENCH_DATA/health.txt";; *) exec cat "$ZFS_BENCH_DATA/pools.txt";; esac;;
+esac
+"""
+fake_zfs = """#!/bin/sh
+case "$1" in
+get) exec cat "$ZFS_BENCH_DATA/capacity.txt";;
+list) exec cat "$ZFS_BENCH_DATA/snaps.txt";;
+esac
+"""
+
+# The data file which holds the output of each command, by the start of its command line.
+#   "zpool list -H -o name," (with more properties) must come before "zpool list -H -o name" (pools only),
+#   and the `zfs list` of --datasets (which lists more properties) isn't taken for the snapshot source.
+command_files = {"zpool iostat": "iostat.txt", "zfs get": "capacity.txt", "zfs list -Hp -r -t filesystem,volume -o name,usedbysnapshots ": "snaps.txt",
+                 "zpool list -H -o name,": "health.txt", "zpool list -H -o name": "pools.txt", "zpool status": "status.txt"}
+
+
+def install_fakes(directory):
+    """Write the fake `zpool` and `zfs` executables into directory, and put it first on PATH."""
+    for name, script in (("zpool", fake_zpool), ("zfs", fake_zfs)):
+        path = os.path.join(directory, name)
+        with open(path, "w") as file:
+            file.write(script)
+        os.chmod(path, 0o755)
+    os.environ["PATH"] = directory + os.pathsep + os.environ["PATH"]
+
+
+def synthetic_output(pools, datasets):
+    """Generate the output of every command, for a number of pools with a number of datasets each.
+
+    Returns:
+        A dictionary of data file names (as in {command_files}) to their contents.
+    """
+    names = [f"pool{i}" for i in range(pools)]
+    iostat, capacity, snaps, health, status = [], [], [], [], []
+    for i, name in enumerate(names):
+        iostat.append("\t".join([name, str(51567724367872 + i), "16344298516480", "16", "312", "8468325", "40960512",
+                                 "15682379", "2048", "15682379", "1024", "3532", "-", "3510", "810", "-", "-", "-"]))
+        capacity.extend([f"{name}\tused\t{54866186481664 + i}", f"{name}\tavailable\t12908397449216",
+                         f"{name}\tcompressratio\t1.45", f"{name}\tusedbychildren\t54700434006016"])
+        snaps.append(f"{name}\t0")
+        snaps.extend(f"{name}/dataset{j}\t{(j * 7919) % 1000003 * 4096}" for j in range(datasets))
+        health.append(f"{name}\tONLINE\t{i % 100}%")
+        status.append(f"  pool: {name}\n state: ONLINE\n  scan: scrub repaired 0B in 1 days 12:59:37 with 0 errors "
+                      f"on Sat Jan 27 22:59:39 2024\nconfig:\n\n\tNAME        STATE     READ WRITE CKSUM\n"
+                      f"\t{name}      ONLINE       0     0     0\n\nerrors: No known data errors\n")
+    return {"pools.txt": "\n".join(names) + "\n", "iostat.txt": "\n".join(iostat) + "\n",
+            "capacity.txt": "\n".join(capacity) + "\n", "snaps.txt": "\n".join(snaps) + "\n",
+            "health.txt": "\n".join(health) + "\n", "status.txt": "\n".join(status)}
+
+
+def recorded_output(path, zfs_pool_stats):
+    """Take the output of every command from a log recorded by zfs-pool-stats.py --record.
+
+    The latest recorded output of each command (of the first host recorded) is used. Lines recorded
+    from a streamed `zpool iostat` are reduced to the latest line of each pool.
+
+    Returns:
+        A dictionary of data file names (as in {command_files}) to their contents.
+    """
+    log = zfs_pool_stats["ReplayLog"](path, speed=0)
+    host = log.hosts[0] if log.hosts else None
+    output = {}
+    for (run_host, cmdline), runs in log.runs.items():
+        name = next((name for prefix, name in command_files.items() if cmdline.startswith(prefix)), None)
+        if run_host != host or name is None or not runs:
+            continue
+        run = runs[-1]
+        text = run["out"] if run["out"] is not None else "".join(line for recorded_time, line in run["lines"])
+        if name == "iostat.txt":
+            latest = {line.split('\t')[0]: line for line in text.splitlines() if '\t' in line}
+            text = "\n".join(latest.values()) + "\n"
+        output[name] = text
+    if "pools.txt" not in output and "health.txt" in output:  # The pools were named, rather than listed.
+        output["pools.txt"] = "".join(line.split('\t')[0] + "\n" for line in output["health.txt"].splitlines())
+    return output
+
+
+def write_output(directory, output):
+    """Write the output of every command into directory, where the fake executables read it from."""
+    for name in set(command_files.values()):
+        with open(os.path.join(directory, name), "w") as file:
+            file.write(output.get(name, ""))
+
+
+def measure(func, min_time=0.5, rounds=5):
+    """Measure how long func takes to run.
+
+    func is run in {rounds} rounds, each of as many calls as fit in {min_time} / {rounds} seconds.
+
+    Returns:
+        The median time in seconds (float) of one call, across the rounds.
+    """
+    func()  # Warm up, and estimate how many calls fit in a round.
+    start = time.perf_counter()
+    func()
+    number = max(int(min_time / rounds / max(time.perf_counter() - start, 1e-9)), 1)
+
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - start) / number)
+    return statistics.median(times)
+
+
+class CachedCollector:
+    """Stand in for a SourceCollector, returning the same collected values every time, so get_stats() can be
+    measured without running any commands."""
+
+    def __init__(self, results):
+        self.results = results
+
+    def collect(self, pools):
+        return self.results
+
+
+def bench_scenario(zfs_pool_stats, pools, columns, min_time):
+    """Measure every stage of the pipeline against the output currently in the data directory.
+
+    Args:
+        zfs_pool_stats: The global names of the package, as returned by load_package().
+        pools: A list of the pool names to collect.
+        columns: A dictionary of columns, as returned by parse_complex_arg().
+        min_time: The time in seconds (float) to spend measuring each stage.
+
+    Returns:
+        A dictionary of stage names to the median time in seconds (float) of one pass of that stage over every pool.
+    """
+    transport = zfs_pool_stats["LocalTransport"]()
+    timeouts = {name: 60.0 for name in zfs_pool_stats["zpool_source_keys"]}
+    collector = zfs_pool_stats["SourceCollector"](zfs_pool_stats["make_sources"](1, transport), timeouts)
+    plan = zfs_pool_stats["ColumnPlan"](columns)
+    get_stats, conv_float = zfs_pool_stats["get_stats"], zfs_pool_stats["conv_float"]
+    conv_bytes, conv_microseconds = zfs_pool_stats["conv_bytes"], zfs_pool_stats["conv_microseconds"]
+    conv_dict_notation, get_keys_width = zfs_pool_stats["conv_dict_notation"], zfs_pool_stats["get_keys_width"]
+    conv_column, conv_dicts_notation = zfs_pool_stats["conv_column"], zfs_pool_stats["conv_dicts_notation"]
+    Sample, format_samples = zfs_pool_stats["Sample"], zfs_pool_stats["format_samples"]
+
+    # Collect once up front, for the stages which start from already collected (or parsed) values.
+    results = collector.collect(pools)
+    stats = get_stats(pools, CachedCollector(results))
+    raw_values = [value for sources in results.values() for values in sources.values() if values for value in values]
+    sizes = [value for zpool in stats.values() for key, value in zpool.items() if key[1] == 'size' and value]
+    times = [value for zpool in stats.values() for key, value in zpool.items() if key[1] == 'time' and value]
+    formatted = [conv_dict_notation(zpool, columns) for zpool in stats.values()]
+    samples = [Sample(None, pool, 0, zpool) for pool, zpool in stats.items()]
+    sample_columns = {name: notation for name, notation in columns.items() if name in Sample.fields}
+
+    # Two passes of `zfs list` for --datasets, built from the datasets listed by the snapshot source. Every
+    # other dataset differs between them, so each update re-parses half of the datasets and ranks them all.
+    with open(os.path.join(os.environ["ZFS_BENCH_DATA"], "snaps.txt")) as file:
+        listed = [line.rstrip("\n").split("\t") for line in file if "\t" in line]
+    passes = [[f"{name}\t{int(used) + i * (j % 2)}\t{int(used) // 7 + i * (j % 2)}\t{used}\t{used}\n"
+               for j, (name, used) in enumerate(listed)] for i in range(2)]
+    dataset_index = zfs_pool_stats["DatasetIndex"](10, "written")
+    dataset_ticks = itertools.count(1)
+
+    def datasets():
+        tick = next(dataset_ticks)
+        dataset_index.update(passes[tick % 2], float(tick))
+
+    def tick():
+        plan.render_rows(list(get_stats(pools, collector).values()))
+
+    stages = {
+        "collect": lambda: collector.collect(pools),
+        "get_stats": lambda: get_stats(pools, CachedCollector(results)),
+        "conv_float": lambda: [conv_float(value) for value in raw_values],
+        "conv_bytes": lambda: [conv_bytes(value) for value in sizes],
+        "conv_microseconds": lambda: [conv_microseconds(value) for value in times],
+        "conv_column": lambda: (conv_column(sizes, 'size'), conv_column(times, 'time')),
+        "conv_dict_notation": lambda: [conv_dict_notation(zpool, columns) for zpool in stats.values()],
+        "conv_dicts_notation": lambda: conv_dicts_notation(list(stats.values()), columns),
+        "get_keys_width": lambda: [get_keys_width(output) for output in formatted],
+        "render": lambda: [plan.render(zpool) for zpool in stats.values()],
+        "render_rows": lambda: plan.render_rows(list(stats.values())),
+        "samples": lambda: [Sample(None, pool, 0, zpool) for pool, zpool in stats.items()],
+        "format_samples": lambda: format_samples(samples, sample_columns),
+        "datasets": datasets,
+        "tick": tick,
+    }
+    try:
+        return {name: measure(func, min_time) for name, func in stages.items()}
+    finally:
+        collector.stop()
+
+
+def bench_startup(directory, min_time):
+    """Measure how long a new Python process takes to start zfs-pool-stats.py, against the output currently in the data directory.
+
+    Args:
+        directory: The directory of zfs-pool-stats.py and the zfs_pool_stats package.
+        min_time: The time in seconds (float) to spend measuring each stage.
+
+    Returns:
+        A dictionary of stage names to the median time in seconds (float) of one start. "python" is the
+        interpreter starting on its own, which every other stage includes.
+    """
+    script = os.path.join(directory, "zfs-pool-stats.py")
+    commands = {
+        "python": [sys.executable, "-c", "pass"],
+        "import": [sys.executable, "-c", "import zfs_pool_stats"],
+        "help": [sys.executable, script, "--help"],
+        "collect": [sys.executable, "-c", "import zfs_pool_stats; zfs_pool_stats.collect(interval=0)"],
+    }
+    return {name: measure(lambda: subprocess.run(command, cwd=directory, stdout=subprocess.DEVNULL, check=True), min_time)
+            for name, command in commands.items()}
+
+
+def conv_seconds(seconds):
+    """Format a duration in seconds with the most readable unit, such as '1.25ms'."""
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f}{unit}"
+    return f"{seconds / 1e-9:.0f}ns"
+
+
+#####  Run benchmarks  #####
+
+root = os.path.dirname(os.path.abspath(__file__))
+zfs_pool_stats = load_package(root)
+default_columns = zfs_pool_stats["make_parser"]().parse_args(["--pool", "all"]).COLUMNS
+all_columns = {name: None for name in zfs_pool_stats["zpool_keys_index"]}
+
+baseline = {}
+if args.BASELINE:
+    with open(args.BASELINE) as file:
+        baseline = json.load(file)
+
+with tempfile.TemporaryDirectory(prefix="zfs-pool-stats-bench-") as directory:
+    install_fakes(directory)
+    os.environ["ZFS_BENCH_DATA"] = directory
+
+    # Each scenario is (name, output of the commands, columns).
+    scenarios = []
+    if args.RECORDED:
+        scenarios.append(("recorded", recorded_output(args.RECORDED, zfs_pool_stats), default_columns))
+    else:
+        for datasets in args.DATASETS:
+            for pools in args.POOLS:
+                scenarios.append((f"pools={pools},datasets={datasets},columns={len(default_columns)}",
+                                  synthetic_output(pools, datasets), default_columns))
+        # Scale the columns too, at the middle pool count.
+        pools = args.POOLS[len(args.POOLS) // 2]
+        scenarios.append((f"pools={pools},datasets={args.DATASETS[0]},columns={len(all_columns)}",
+                          synthetic_output(pools, args.DATASETS[0]), all_columns))
+
+    results = collections.OrderedDict()
+    regressions = []
+    print(f"{'scenario':<40}{'stage':<20}{'time':>10}{'baseline':>10}{'change':>9}")
+    for name, output, columns in [("startup", scenarios[0][1], None)] + scenarios:
+        write_output(directory, output)
+        pools = output["pools.txt"].split()
+        stages = bench_startup(root, args.TIME) if name == "startup" else bench_scenario(zfs_pool_stats, pools, columns, args.TIME)
+        for stage, seconds in stages.items():
+            key = f"{name}/{stage}"
+            results[key] = seconds
+            line = f"{name:<40}{stage:<20}{conv_seconds(seconds):>10}"
+            if key in baseline:
+                change = seconds / baseline[key] - 1
+                line += f"{conv_seconds(baseline[key]):>10}{change:>+9.0%}"
+                if change > args.THRESHOLD:
+                    line += "  REGRESSION"
+                    regressions.append(key)
+            print(line)
+        if name != "startup":
+            print(f"{name:<40}{'ticks per second':<20}{1 / results[f'{name}/tick']:>10.1f}")
+
+if args.SAVE:
+    with open(args.SAVE, "w") as file:
+        json.dump(results, file, indent=2)
+
+if regressions:
+    print(f"\n{len(regressions)} stage(s) slower than the baseline by more than {args.THRESHOLD:.0%}: {', '.join(regressions)}")
+    sys.exit(1)
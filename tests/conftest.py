@@ -0,0 +1,5 @@
+""" Make the zfs_pool_stats package importable when pytest is run from any directory. """
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,77 @@
+""" Tests of collect() and Sample, with fake `zpool` and `zfs` commands on the PATH. """
+import os
+import stat
+
+import pytest
+
+from zfs_pool_stats import Sample, collect, format_samples
+
+ZPOOL = """#!/bin/sh
+case "$*" in
+"list -H -o name") printf 'tank\\n';;
+"list -H -o name,health,frag tank") printf 'tank\\tONLINE\\t12%%\\n';;
+*) echo "cannot open pool" >&2; exit 1;;
+esac
+"""
+
+ZFS = """#!/bin/sh
+echo "dataset does not exist" >&2
+exit 1
+"""
+
+
+@pytest.fixture
+def fake_path(tmp_path, monkeypatch):
+    for name, script in (("zpool", ZPOOL), ("zfs", ZFS)):
+        path = tmp_path / name
+        path.write_text(script)
+        path.chmod(path.stat().st_mode | stat.S_IXUSR)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+
+
+def test_collect_leaves_failed_sources_unset(fake_path):
+    samples = collect(sources=("health", "capacity", "status"), transport="ssh", timeout=5.0)
+    assert [sample.pool for sample in samples] == ["tank"]
+    sample = samples[0]
+    assert sample.host is None
+    assert sample.StateHealth == "ONLINE"
+    assert sample.StateFragPerc == pytest.approx(0.12)
+    # `zfs get` and `zpool status` failed, so their keys (and the keys derived from them) aren't zeros, but unset.
+    for name in ("VirtCapUsed", "VirtCapTot", "VirtCapUsedPerc", "StateText"):
+        with pytest.raises(AttributeError):
+            getattr(sample, name)
+    assert sample.as_dict() == {"PoolName": "tank", "StateHealth": "ONLINE", "StateFragPerc": pytest.approx(0.12)}
+    assert sample.format("VirtCapTot") == "-"
+
+
+def test_collect_rejects_unknown_sources(fake_path):
+    with pytest.raises(ValueError, match="nope"):
+        collect(pools=["tank"], sources=("health", "nope"))
+
+
+def test_sample_slots():
+    sample = Sample("host", "tank", 1.5, {("PoolName", "label"): "tank", ("BwWrite", "size"): 2048.0}, {"iostat": 0.0})
+    assert sample.BwWrite == 2048.0
+    assert sample.format("BwWrite") == "2K"
+    assert sample.as_dict() == {"PoolName": "tank", "BwWrite": 2048.0}
+    assert sample.values()[Sample.fields.index("BwWrite")] == 2048.0
+    assert sample.values().count(None) == len(Sample.fields) - 2
+    with pytest.raises(AttributeError):
+        sample.BwRead
+    # Every key has a slot, so there is no dictionary to add stray attributes to.
+    with pytest.raises(AttributeError):
+        sample.Unknown = 1
+
+
+def test_format_samples():
+    samples = [Sample(None, "tank", 1.0, {("PoolName", "label"): "tank", ("BwWrite", "size"): 1023.6 * 1024,
+                                          ("TotalwaitBoth", "time"): 59.7e6, ("VirtCapUsedPerc", "perc"): 0.5}),
+               Sample(None, "backup", 1.0, {("PoolName", "label"): "backup", ("BwWrite", "size"): 0.0})]
+    assert format_samples(samples, {"PoolName": None, "BwWrite": None, "TotalwaitBoth": None, "VirtCapUsedPerc": None}) == [
+        {"PoolName": "tank", "BwWrite": "1M", "TotalwaitBoth": "1m", "VirtCapUsedPerc": "50%"},
+        {"PoolName": "backup", "BwWrite": 0.0, "TotalwaitBoth": "-", "VirtCapUsedPerc": "-"}]
+    assert format_samples(samples, {"BwWrite": ["K"], "TotalwaitBoth": ["ms"]}) == [
+        {"BwWrite": "1024K", "TotalwaitBoth": "59700ms"}, {"BwWrite": 0.0, "TotalwaitBoth": "-"}]
+    assert format_samples([], {"BwWrite": None}) == []
+    with pytest.raises(ValueError):
+        format_samples(samples, {"BwWrite": ["X"]})
@@ -0,0 +1,165 @@
+""" Tests of SourceCollector, which runs every source at once and caches their values, and of its flags. """
+import threading
+
+import pytest
+
+from zfs_pool_stats.sources import SourceCollector, parse_refresh, parse_timeouts
+
+
+class FakeClock:
+    """A clock which only moves when told to."""
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeSource:
+    """A source which counts its runs, and returns them as its values. It can be held until released, or made to fail."""
+
+    def __init__(self, blocked=False):
+        self.runs = 0
+        self.release = threading.Event()
+        if not blocked:
+            self.release.set()
+        self.fail = False
+
+    def __call__(self, pools):
+        self.runs += 1
+        run = self.runs
+        self.release.wait()
+        if self.fail:
+            raise RuntimeError("the command failed")
+        return {pool: [f"{pool}{run}"] for pool in pools}
+
+
+@pytest.fixture
+def collectors():
+    made = []
+    yield made
+    for collector in made:
+        collector.stop()
+
+
+def make_collector(collectors, sources, timeouts=None, refresh=None, clock=None):
+    collector = SourceCollector(sources, timeouts or dict.fromkeys(sources, 5.0), refresh, clock or FakeClock())
+    collectors.append(collector)
+    return collector
+
+
+def test_slow_source_times_out(collectors):
+    fast, slow = FakeSource(), FakeSource(blocked=True)
+    collector = make_collector(collectors, {"fast": fast, "slow": slow}, {"fast": 5.0, "slow": 0.05})
+
+    assert collector.collect(["tank"]) == {"tank": {"fast": ["tank1"], "slow": None}}
+    assert collector.ages() == {"fast": 0.0, "slow": None}
+
+    # A source which is still running isn't started again, so a slow command never piles up.
+    assert collector.collect(["tank"])["tank"]["slow"] is None
+    assert slow.runs == 1
+    assert fast.runs == 2
+
+    slow.release.set()
+    collector.timeouts["slow"] = 5.0
+    assert collector.collect(["tank"])["tank"] == {"fast": ["tank3"], "slow": ["tank1"]}
+
+
+def test_failed_source_keeps_its_last_values(collectors):
+    source = FakeSource()
+    collector = make_collector(collectors, {"health": source})
+    clock = collector.clock
+    assert collector.collect(["tank", "backup"]) == {"tank": {"health": ["tank1"]}, "backup": {"health": ["backup1"]}}
+
+    source.fail = True
+    clock.now += 3
+    assert collector.collect(["tank"]) == {"tank": {"health": ["tank1"]}}
+    assert collector.ages() == {"health": 3.0}
+    assert "health" in collector.durations
+
+    # It's tried again on the next tick.
+    source.fail = False
+    assert collector.collect(["tank"]) == {"tank": {"health": ["tank3"]}}
+
+
+def test_parse_timeouts():
+    defaults = {"iostat": 2.0, "status": 1.0}
+    assert parse_timeouts({}, defaults) == defaults
+    assert parse_timeouts({"status": ["10"]}, defaults) == {"iostat": 2.0, "status": 10.0}
+    assert parse_timeouts({"iostat": ["0.5"], "status": ["3"]}, defaults) == {"iostat": 0.5, "status": 3.0}
+
+
+@pytest.mark.parametrize("timeouts", [{"datasets": ["5"]}, {"status": None}, {"status": [""]}, {"status": ["soon"]},
+                                      {"status": ["-1"]}, {"status": ["0"]}, {"status": ["nan"]}, {"status": ["inf"]}])
+def test_parse_timeouts_invalid(timeouts):
+    with pytest.raises(ValueError, match="Invalid --timeouts entry 'status|datasets'.*iostat, status"):
+        parse_timeouts(timeouts, {"iostat": 2.0, "status": 1.0})
+
+
+def test_refresh_tiers(collectors):
+    tick, slow, manual = FakeSource(), FakeSource(), FakeSource()
+    collector = make_collector(collectors, {"tick": tick, "slow": slow, "manual": manual},
+                               refresh={"tick": 0, "slow": 10, "manual": None})
+    clock = collector.clock
+
+    # Every source runs on the first tick, since none has any values yet.
+    assert collector.collect(["tank"])["tank"] == {"tick": ["tank1"], "slow": ["tank1"], "manual": ["tank1"]}
+    clock.now += 9.5
+    assert collector.collect(["tank"])["tank"] == {"tick": ["tank2"], "slow": ["tank1"], "manual": ["tank1"]}
+    assert collector.ages() == {"tick": 0.0, "slow": 9.5, "manual": 9.5}
+    clock.now += 0.5
+    assert collector.collect(["tank"])["tank"] == {"tick": ["tank3"], "slow": ["tank2"], "manual": ["tank1"]}
+    clock.now += 1000
+    collector.collect(["tank"])
+    assert (tick.runs, slow.runs, manual.runs) == (4, 3, 1)
+
+
+def test_demand(collectors):
+    sources = {"slow": FakeSource(), "manual": FakeSource()}
+    collector = make_collector(collectors, sources, refresh={"slow": 10, "manual": None})
+    clock = collector.clock
+    collector.collect(["tank"])
+
+    clock.now += 1
+    collector.demand()
+    clock.now += 1
+    assert collector.collect(["tank"])["tank"] == {"slow": ["tank2"], "manual": ["tank2"]}
+    # Only once: the demand is met by the values which finished after it.
+    clock.now += 1
+    assert collector.collect(["tank"])["tank"] == {"slow": ["tank2"], "manual": ["tank2"]}
+
+
+def test_invalidate(collectors):
+    status, health = FakeSource(blocked=True), FakeSource()
+    collector = make_collector(collectors, {"status": status, "health": health}, {"status": 0.05, "health": 5.0},
+                               refresh={"status": None, "health": None})
+    collector.collect(["tank"])
+    assert status.runs == 1
+
+    # A source which is running when invalidated is run again once it finishes, since it may have missed the change.
+    collector.invalidate(["status", "datasets"])
+    assert collector.invalidated == {"status"}
+    status.release.set()
+    collector.timeouts["status"] = 5.0
+    assert collector.collect(["tank"])["tank"] == {"status": ["tank1"], "health": ["tank1"]}
+    assert collector.collect(["tank"])["tank"] == {"status": ["tank2"], "health": ["tank1"]}
+    assert collector.collect(["tank"])["tank"] == {"status": ["tank2"], "health": ["tank1"]}
+    assert (status.runs, health.runs) == (2, 1)
+
+
+def test_parse_refresh():
+    defaults = {"iostat": 0, "capacity": 10, "status": 15}
+    assert parse_refresh({}, defaults) == defaults
+    assert parse_refresh({"status": ["demand"], "capacity": ["TICK"], "iostat": ["2.5"]}, defaults) == \
+        {"iostat": 2.5, "capacity": 0, "status": None}
+    # Columns stand for their source. If several columns of one source are given, the most frequent refresh wins.
+    assert parse_refresh({"VirtCapTot": ["30"], "VirtCapUsed": ["20"], "VirtCapFree": ["demand"]}, defaults)["capacity"] == 20.0
+    assert parse_refresh({"VirtCapUsed": ["demand"], "VirtCapFree": ["tick"]}, defaults)["capacity"] == 0
+
+
+@pytest.mark.parametrize("refresh", [{"nope": ["5"]}, {"status": None}, {"status": [""]}, {"status": ["often"]},
+                                     {"status": ["-1"]}, {"status": ["nan"]}, {"status": ["inf"]}])
+def test_parse_refresh_invalid(refresh):
+    with pytest.raises(ValueError, match="Invalid --refresh entry"):
+        parse_refresh(refresh, {"iostat": 0, "status": 15})
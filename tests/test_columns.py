@@ -0,0 +1,54 @@
+""" Tests of parsing --columns, and of the ColumnPlan compiled from it. """
+import pytest
+
+from zfs_pool_stats.cli import parse_columns
+from zfs_pool_stats.convert import ColumnPlan
+
+
+def test_parse_columns():
+    assert parse_columns("PoolName, BwRead:M,BwWrite:") == {"PoolName": None, "BwRead": ["M"], "BwWrite": [""]}
+    # A column can be listed both with and without an aggregate, with or without a notation.
+    assert parse_columns("BwWrite:M,BwWrite:avg5m,BwWrite:K:max1h,BwWrite::p95_30s") == {
+        "BwWrite": ["M"], "BwWrite:avg5m": ["", "avg5m"], "BwWrite:max1h": ["K", "max1h"], "BwWrite:p95_30s": ["", "p95_30s"]}
+    # An aggregate without a window is still an aggregate (and rejected by ColumnPlan), never a notation.
+    assert parse_columns("TotalwaitBoth:max,TotalwaitBoth:min,TotalwaitBoth:m") == {
+        "TotalwaitBoth:max": ["", "max"], "TotalwaitBoth:min": ["", "min"], "TotalwaitBoth": ["m"]}
+
+
+def test_plan():
+    plan = ColumnPlan(parse_columns("PoolName,BwWrite:M,BwWrite:avg5m,TotalwaitBoth,VirtCapUsedPerc"))
+    assert plan.names == ["PoolName", "BwWrite", "BwWrite:avg5m", "TotalwaitBoth", "VirtCapUsedPerc"]
+    assert [(key, notation, source) for key, func, notation, source in plan.columns] == [
+        (("PoolName", "label"), None, "iostat"), (("BwWrite", "size"), ["M"], "iostat"),
+        (("BwWrite:avg5m", "size"), None, "iostat"), (("TotalwaitBoth", "time"), None, "iostat"),
+        (("VirtCapUsedPerc", "perc"), None, "capacity")]
+    assert plan.aggregates == [(("BwWrite", "size"), ("BwWrite:avg5m", "size"), "avg", 300.0)]
+    assert plan.keys["BwWrite:avg5m"] == ("BwWrite:avg5m", "size")
+    assert plan.header.split() == plan.names
+
+
+def test_render():
+    plan = ColumnPlan(parse_columns("PoolName,BwWrite:M,TotalwaitBoth,StateHealth"))
+    sample = {("PoolName", "label"): "tank", ("BwWrite", "size"): 3 * 1024 ** 2, ("TotalwaitBoth", "time"): 1500.0}
+    row = plan.render(sample, {"iostat": 0.2, "health": None})
+    assert row.split() == ["tank", "3M", "2ms", "-"]
+    # Values reused from an earlier tick have their age appended, and the columns widen to fit.
+    rows = plan.render_rows([sample, {("PoolName", "label"): "backup"}], [{"iostat": 12.0}, {}])
+    assert [row.split() for row in rows] == [["tank", "3M~12s", "2ms~12s", "-"], ["backup", "-", "-", "-"]]
+    assert len(plan.header) == len(rows[0])
+
+
+@pytest.mark.parametrize("columns, error", [
+    ("Nope", "Invalid column 'Nope'"),
+    ("BwWrite:X", "Invalid notation 'X' for column 'BwWrite'"),
+    ("TotalwaitBoth:M", "Invalid notation 'M' for column 'TotalwaitBoth'"),
+    ("VirtCapUsedPerc:M", "Column 'VirtCapUsedPerc' has no notations"),
+    ("StateHealth:K", "Column 'StateHealth' has no notations"),
+    ("VirtCapUsedPerc:G:avg5m", "Column 'VirtCapUsedPerc:avg5m' has no notations"),
+    ("BwWrite:max", "Invalid aggregate 'max'"),
+    ("BwWrite:avg5x", "Invalid"),
+    ("StateHealth:avg5m", "isn't a number"),
+])
+def test_plan_invalid(columns, error):
+    with pytest.raises(ValueError, match=error):
+        ColumnPlan(parse_columns(columns))
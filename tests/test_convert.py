@@ -0,0 +1,44 @@
+""" Tests of converting values to readable notations, one value or a whole column at a time. """
+import random
+
+import pytest
+
+from zfs_pool_stats.convert import conv_bytes, conv_column, conv_microseconds, conv_perc
+
+
+@pytest.mark.parametrize("value, expected", [
+    (512, "512B"), (1023.4, "1023B"), (1023.6, "1K"), (1024, "1K"),
+    (1023.4 * 1024, "1023K"), (1023.6 * 1024, "1M"), (1.5 * 1024 ** 3, "2G"), (3 * 1024 ** 7, "3072E"),
+    (0, 0), ("-", "-")])
+def test_sizes(value, expected):
+    assert conv_column([value], "size") == [expected]
+    assert conv_bytes(value) == expected
+
+
+@pytest.mark.parametrize("value, expected", [
+    (0.3, "0us"), (0.7, "1us"), (999.4, "999us"), (999.6, "1ms"),
+    (59.4e6, "59s"), (59.7e6, "1m"), (90e6, "2m"), (23.4 * 3600e6, "23h"), (23.7 * 3600e6, "1d"), (400 * 86400e6, "400d"),
+    (0, 0), ("-", "-")])
+def test_times(value, expected):
+    assert conv_column([value], "time") == [expected]
+    assert conv_microseconds(value) == expected
+
+
+def test_notations():
+    assert conv_column([1024 ** 2, 512, 0, "-"], "size", ["K"]) == ["1024K", "0K", 0, "-"]
+    assert conv_column([1024 ** 3], "size", ["g"]) == ["1g"]
+    assert conv_column([1500000, 0.3], "time", ["ms"]) == ["1500ms", "0ms"]
+    assert conv_column([0.25, "-"], "perc") == ["25%", "-"]
+    assert conv_column([1.01, "ONLINE"], "label") == ["1.01", "ONLINE"]
+    with pytest.raises(ValueError, match="Invalid notation 'X'"):
+        conv_column([1], "size", ["X"])
+    with pytest.raises(ValueError, match="Invalid notation 'M'"):  # Times are case sensitive: 'm' is minutes.
+        conv_column([1], "time", ["M"])
+
+
+def test_columns_match_single_values():
+    rng = random.Random(4)
+    for key_type, convert in (("size", conv_bytes), ("time", conv_microseconds), ("perc", conv_perc)):
+        values = [rng.choice([0, "-", rng.uniform(0, 2), rng.uniform(0, 1e18), float(rng.randrange(1 << 40))])
+                  for _ in range(500)]
+        assert conv_column(values, key_type) == [convert(value) for value in values]
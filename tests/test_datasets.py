@@ -0,0 +1,108 @@
+""" Tests of ranking the top datasets of each pool, for --datasets. """
+import random
+import subprocess
+
+import pytest
+
+from zfs_pool_stats.datasets import DatasetIndex, make_dataset_sources, render_dataset_panel
+
+
+def lines(datasets):
+    """Return `zfs list -Hp -o name,used,written,usedbysnapshots,logicalused` output for {name: (used, written, snaps)}."""
+    return [f"{name}\t{used}\t{written}\t{snaps}\t{used * 2}\n" for name, (used, written, snaps) in datasets.items()]
+
+
+def test_rates_need_two_passes():
+    index = DatasetIndex(top=5, by="written")
+    index.update(lines({"tank/a": (100, 10, 0)}), 0.0)
+    assert index.ranked == {}
+    index.update(lines({"tank/a": (300, 50, 0)}), 10.0)
+    assert index.ranked == {"tank": [(4.0, "tank/a", 20.0, 4.0, 0, 300, 600)]}
+
+
+def test_written_resets_on_snapshot():
+    index = DatasetIndex(by="written")
+    index.update(lines({"tank/a": (100, 1000, 0)}), 0.0)
+    index.update(lines({"tank/a": (100, 30, 0)}), 10.0)  # A snapshot was taken, then 30 bytes written.
+    assert index.ranked["tank"][0][3] == 3.0
+
+
+def test_unchanged_lines_have_no_rates():
+    index = DatasetIndex(by="written")
+    index.update(lines({"tank/a": (100, 10, 0)}), 0.0)
+    index.update(lines({"tank/a": (100, 20, 0)}), 1.0)
+    assert index.ranked["tank"][0][3] == 10.0
+    for now in (2.0, 3.0):
+        index.update(lines({"tank/a": (100, 20, 0)}), now)
+        assert index.ranked["tank"][0][2:4] == (0.0, 0.0)
+
+
+def test_snaps_are_ranked_on_the_first_pass():
+    index = DatasetIndex(top=2, by="snaps")
+    index.update(lines({"tank": (0, 0, 5), "tank/a": (0, 0, 50), "tank/b": (0, 0, 500), "backup/c": (0, 0, 1)}), 0.0)
+    assert [entry[1] for entry in index.ranked["tank"]] == ["tank/b", "tank/a"]
+    assert [entry[1] for entry in index.ranked["backup"]] == ["backup/c"]
+
+
+def test_top_matches_a_full_sort():
+    rng = random.Random(20)
+    datasets = {f"tank/d{i}": (rng.randrange(1 << 30), rng.randrange(1 << 20), 0) for i in range(2000)}
+    index = DatasetIndex(top=10, by="growth")
+    index.update(lines(datasets), 0.0)
+    previous = dict(datasets)
+    for name in rng.sample(sorted(datasets), 500):
+        used, written, snaps = datasets[name]
+        datasets[name] = (used + rng.randrange(-1 << 20, 1 << 20), written, snaps)
+    index.update(lines(datasets), 2.0)
+    growth = sorted(((datasets[name][0] - previous[name][0]) / 2, name) for name in datasets)
+    assert [(value, name) for value, name, *rest in index.ranked["tank"]] == growth[::-1][:10]
+
+
+def test_garbled_lines_and_prune():
+    index = DatasetIndex()
+    seen = index.update(["tank/a\t1\t2\t3\t4\n", "\n", "tank/b\t-\t-\t-\t-\n"], 0.0)
+    assert seen == {"tank/a"}
+    index.prune(index.update(["tank/c\t1\t2\t3\t4\n"], 1.0))
+    assert list(index.datasets) == ["tank/c"]
+
+
+class FakeProcess:
+    def __init__(self, text, returncode):
+        self.stdout = iter(text)
+        self.returncode = returncode
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeTransport:
+    def __init__(self, text, returncode=0):
+        self.text, self.returncode = text, returncode
+        self.cmdlines = []
+
+    def popen(self, cmdline):
+        self.cmdlines.append(cmdline)
+        return FakeProcess(self.text, self.returncode)
+
+
+def test_source_keeps_datasets_of_a_failed_pass():
+    index = DatasetIndex(by="snaps")
+    make_dataset_sources(FakeTransport(lines({"tank/a": (1, 1, 10), "tank/b": (1, 1, 20)})), index)["datasets"](("tank",))
+    failed = FakeTransport(lines({"tank/a": (1, 1, 10)}), returncode=1)
+    with pytest.raises(subprocess.CalledProcessError):
+        make_dataset_sources(failed, index)["datasets"](("tank",))
+    assert failed.cmdlines == ["zfs list -Hp -r -t filesystem,volume -o name,used,written,usedbysnapshots,logicalused tank"]
+    assert set(index.datasets) == {"tank/a", "tank/b"}
+
+
+def test_render_dataset_panel():
+    panel = render_dataset_panel([[(2048.0, "tank/a", 1024.0, 2048.0, 0, 4096, 8192)],
+                                  [(1024.0, "backup/b", None, 1024.0, 0, 1, 2)]], 3, "written")
+    assert len(panel) == 4
+    assert panel[0] == "Top 3 datasets by bytes written"
+    assert panel[1].split()[:5] == ["tank/a", "grow", "1K/s", "write", "2K/s"]
+    assert panel[2].split()[:3] == ["backup/b", "grow", "-"]
+    assert panel[3] == ""
@@ -0,0 +1,85 @@
+""" Tests of following `zpool events`, and invalidating the sources each event affects. """
+import time
+
+from zfs_pool_stats.sources import EventFollower, SourceCollector
+
+events = """\
+Jan  8 2024 10:00:00.123456789 sysevent.fs.zfs.scrub_start
+        version = 0x0
+        class = "sysevent.fs.zfs.scrub_start"
+        pool = "tank"
+        pool_guid = 0x1234
+
+Jan  8 2024 10:00:01.000000000 sysevent.fs.zfs.statechange
+        class = "sysevent.fs.zfs.statechange"
+        pool = "other"
+
+Jan  8 2024 10:00:02.000000000 ereport.fs.zfs.checksum
+        class = "ereport.fs.zfs.checksum"
+        pool = "tank"
+
+Jan  8 2024 10:00:03.000000000 sysevent.fs.zfs.history_event
+        class = "sysevent.fs.zfs.history_event"
+        pool = "tank"
+
+Jan  8 2024 10:00:04.000000000 sysevent.fs.zfs.vdev_add
+        class = "sysevent.fs.zfs.vdev_add"
+        pool = "tank"
+"""
+
+
+class FakeProcess:
+    def __init__(self, text):
+        self.stdout = iter(text.splitlines(keepends=True))
+        self.returncode = None
+
+    def wait(self):
+        self.returncode = 0
+
+    def poll(self):
+        return self.returncode
+
+    def terminate(self):
+        pass
+
+
+class FakeTransport:
+    """Print the events once, then fail to start `zpool events` again."""
+
+    def __init__(self, text):
+        self.text = text
+        self.started = 0
+
+    def popen(self, cmdline):
+        self.started += 1
+        if self.started > 1:
+            raise OSError("zpool events can't be restarted")
+        return FakeProcess(self.text)
+
+
+def follow(text, pools=("tank",)):
+    """Return the tuples of sources passed to on_event() for every event of text."""
+    received = []
+    follower = EventFollower(pools, FakeTransport(text), received.append, restart_delay=60)
+    deadline = time.monotonic() + 5
+    while (follower.process is None or follower.process.returncode is None) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    follower.stop()
+    return received
+
+
+def test_events_of_followed_pools():
+    assert follow(events) == [("status",), ("status",), ("capacity", "status", "tree")]
+
+
+def test_events_of_other_pools_are_ignored():
+    assert follow(events, pools=("other",)) == [("health", "status", "tree")]
+
+
+def test_events_invalidate_sources():
+    collector = SourceCollector({"status": lambda pools: {}, "health": lambda pools: {}}, {"status": 1, "health": 1})
+    try:
+        collector.invalidate(("status", "tree"))
+        assert collector.invalidated == {"status"}
+    finally:
+        collector.stop()
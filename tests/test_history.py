@@ -0,0 +1,100 @@
+""" Tests of the rolling-window aggregates of --columns, such as 'BwWrite:avg5m'. """
+import math
+import random
+
+import pytest
+
+from zfs_pool_stats.history import HistoryStore, parse_aggregate, parse_duration
+
+bw = ('BwWrite', 'size')
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_store(*aggregates, interval=1.0):
+    """Return a HistoryStore of the aggregates of BwWrite (such as 'avg5s'), and its clock."""
+    clock = FakeClock()
+    parsed = [(bw, (f"BwWrite:{aggregate}", 'size'), *parse_aggregate(aggregate)) for aggregate in aggregates]
+    return HistoryStore(parsed, interval, clock), clock
+
+
+def add(store, clock, value, pool="tank"):
+    """Add one sample a second, and return the aggregates filled into it."""
+    clock.now += 1
+    sample = {bw: value}
+    store.add(pool, sample)
+    return {key[0].partition(':')[2]: value for key, value in sample.items() if key != bw}
+
+
+def test_parse_duration():
+    assert parse_duration("30s") == 30
+    assert parse_duration("5m") == 300
+    assert parse_duration("1.5h") == 5400
+    for string in ("", "5", "5d", "m"):
+        with pytest.raises(ValueError):
+            parse_duration(string)
+
+
+def test_parse_aggregate():
+    assert parse_aggregate("avg5m") == ("avg", 300)
+    assert parse_aggregate("p95_1m") == ("p95", 60)
+    assert parse_aggregate("max30s") == ("max", 30)
+    with pytest.raises(ValueError):
+        parse_aggregate("median5m")
+
+
+def test_aggregates_over_a_window():
+    store, clock = make_store("avg3s", "min3s", "max3s", "p95_3s")
+    assert add(store, clock, 10.0) == {"avg3s": 10.0, "min3s": 10.0, "max3s": 10.0, "p95_3s": 10.0}
+    assert add(store, clock, 30.0) == {"avg3s": 20.0, "min3s": 10.0, "max3s": 30.0, "p95_3s": 30.0}
+    assert add(store, clock, 20.0) == {"avg3s": 20.0, "min3s": 10.0, "max3s": 30.0, "p95_3s": 30.0}
+    # The first sample has now left the window.
+    assert add(store, clock, 40.0) == {"avg3s": 30.0, "min3s": 20.0, "max3s": 40.0, "p95_3s": 40.0}
+
+
+def test_values_which_arent_numbers_are_left_out():
+    store, clock = make_store("avg5s", "max5s")
+    add(store, clock, 10.0)
+    assert add(store, clock, "-") == {"avg5s": 10.0, "max5s": 10.0}
+    assert add(store, clock, 20.0) == {"avg5s": 15.0, "max5s": 20.0}
+
+
+def test_empty_window():
+    store, clock = make_store("avg2s")
+    assert add(store, clock, "-") == {"avg2s": "-"}
+
+
+def test_pools_are_kept_apart():
+    store, clock = make_store("avg5s")
+    add(store, clock, 10.0, pool=("host1", "tank"))
+    assert add(store, clock, 50.0, pool=("host2", "tank")) == {"avg5s": 50.0}
+
+
+def test_buffer_is_bounded():
+    store, clock = make_store("max10s", interval=1.0)
+    for value in range(1000):
+        add(store, clock, float(value))
+    times, values, counter, windows = store.pools["tank"]
+    assert len(times) == store.size == 12
+    assert counter == [1000]
+
+
+def test_matches_brute_force():
+    rng = random.Random(4)
+    aggregates = ("avg7s", "min7s", "max7s", "p95_7s")
+    store, clock = make_store(*aggregates)
+    history = []
+    for _ in range(300):
+        value = rng.choice([rng.uniform(0, 100), "-"])
+        history.append((clock.now + 1, value))
+        aggregated = add(store, clock, value)
+        window = sorted(value for time, value in history if time > clock.now - 7 and not isinstance(value, str))
+        expected = {"avg7s": sum(window) / len(window), "min7s": window[0], "max7s": window[-1],
+                    "p95_7s": window[math.ceil(0.95 * len(window)) - 1]} if window else dict.fromkeys(aggregates, "-")
+        assert aggregated == pytest.approx(expected) if window else aggregated == expected
@@ -0,0 +1,120 @@
+""" Tests of reading the kstat counters of ZFS on Linux, against the fixture tree in fixtures/kstat. """
+import os
+import shutil
+import threading
+
+import pytest
+
+from zfs_pool_stats.keys import zpool_source_keys
+from zfs_pool_stats.sources import KstatReader, list_pools, parse_kstat
+
+fixtures = os.path.join(os.path.dirname(__file__), "fixtures", "kstat")
+
+
+class FakeClock:
+    """A clock which only moves when told to."""
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def kstat_root(tmp_path):
+    """A copy of the fixture tree, whose counters can be changed by a test."""
+    root = tmp_path / "kstat"
+    shutil.copytree(fixtures, root)
+    return root
+
+
+def write_counter(path, name, value):
+    """Change one counter of a named kstat file."""
+    lines = path.read_text().splitlines()
+    lines = [f"{name:<32}4    {value}" if line.split()[:1] == [name] else line for line in lines]
+    path.write_text("\n".join(lines) + "\n")
+
+
+def test_parse_kstat_io():
+    with open(os.path.join(fixtures, "tank", "io")) as file:
+        values = parse_kstat(file.read())
+    assert values["nread"] == "8192000"
+    assert values["nwritten"] == "4096000"
+    assert values["reads"] == "1000"
+    assert values["writes"] == "500"
+
+
+def test_parse_kstat_named():
+    with open(os.path.join(fixtures, "backup", "objset-0x85")) as file:
+        values = parse_kstat(file.read())
+    assert values["dataset_name"] == "backup/home"
+    assert values["writes"] == "70"
+    assert values["nread"] == "368640"
+    assert "name" not in values
+
+
+@pytest.mark.parametrize("text", ["", "12 3 0x00 1 80 2353464582 9912837465\n",
+                                  "12 3 0x00 1 80 2353464582 9912837465\nnread nwritten\n"])
+def test_parse_kstat_empty(text):
+    assert parse_kstat(text) == {}
+
+
+def test_list_pools():
+    assert list_pools(None, KstatReader(fixtures)) == ["backup", "tank"]
+
+
+def test_read_counters_io():
+    assert KstatReader(fixtures).read_counters("tank") == [1000, 500, 8192000, 4096000]
+
+
+def test_read_counters_objsets_are_summed():
+    assert KstatReader(fixtures).read_counters("backup") == [100, 100, 409600, 409600]
+
+
+def test_sample_first_call_has_no_rates():
+    values = KstatReader(fixtures, FakeClock()).sample("tank")
+    assert len(values) == len(zpool_source_keys["iostat"])
+    assert values[:7] == ["tank", "-", "-", "0", "0", "0", "0"]
+    assert set(values[7:]) == {"-"}
+
+
+def test_sample_rates(kstat_root):
+    clock = FakeClock()
+    reader = KstatReader(str(kstat_root), clock)
+    reader.sample("backup")
+
+    write_counter(kstat_root / "backup" / "objset-0x85", "writes", 90)
+    write_counter(kstat_root / "backup" / "objset-0x85", "nwritten", 286720 + 819200)
+    clock.now += 2
+    assert reader.sample("backup")[3:7] == ["0", "10", "0", "409600"]
+
+
+def test_totals(kstat_root):
+    reader = KstatReader(str(kstat_root), FakeClock())
+    assert reader.totals("backup") == ["100", "100", "409600", "409600"]
+
+    # The totals are current even when sample() hasn't run since the counters changed.
+    write_counter(kstat_root / "backup" / "objset-0x36", "reads", 60)
+    assert reader.totals("backup") == ["150", "100", "409600", "409600"]
+    assert reader.previous == {}
+
+
+def test_sample_and_totals_from_threads(kstat_root):
+    reader = KstatReader(str(kstat_root))
+    errors = []
+
+    def run(function):
+        try:
+            for _ in range(200):
+                function("backup")
+        except Exception as error:  # Collected, since an exception in a thread doesn't fail the test.
+            errors.append(error)
+
+    threads = [threading.Thread(target=run, args=(function,)) for function in (reader.sample, reader.totals, reader.sample)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert reader.totals("backup") == ["100", "100", "409600", "409600"]
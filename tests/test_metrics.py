@@ -0,0 +1,41 @@
+""" Tests of the metrics served by --serve. """
+from zfs_pool_stats.metrics import StatsCache, format_metrics, metric_name
+
+
+def sample_lines(text):
+    return [line for line in text.splitlines() if not line.startswith("#")]
+
+
+def test_metric_name():
+    assert metric_name("TotalwaitRead") == "zfs_pool_totalwait_read"
+    assert metric_name("StateFragPerc") == "zfs_pool_state_frag_perc"
+
+
+def test_collected_keys():
+    zpool = {("PoolName", "label"): "tank", ("BwWrite", "size"): 2048.0, ("TotalwaitRead", "time"): 1500000.0,
+             ("StateHealth", "label"): "ONLINE", ("VirtCompRatio", "label"): 1.5,
+             ("StateText", "label"): "scan: scrub in progress, 25.00% done, 01:23:45 to go"}
+    lines = sample_lines(format_metrics([(None, "tank", zpool, {"iostat": 0.5})], StatsCache(None, 1.0)))
+    assert 'zfs_pool_bw_write{pool="tank"} 2048.0' in lines
+    assert 'zfs_pool_totalwait_read_seconds{pool="tank"} 1.5' in lines
+    assert 'zfs_pool_state_health_info{pool="tank",state_health="ONLINE"} 1' in lines
+    assert 'zfs_pool_virt_comp_ratio{pool="tank"} 1.5' in lines
+    assert 'zfs_pool_progress_ratio{pool="tank",activity="scrub"} 0.25' in lines
+    assert 'zfs_pool_stats_source_age_seconds{source="iostat"} 0.500' in lines
+    assert not any(line.startswith(("zfs_pool_state_text", "zfs_pool_pool_name")) for line in lines)
+
+
+def test_missing_keys_are_omitted():
+    # Before `zfs get` and `zpool status` have answered, the pool only has the keys of `zpool iostat`.
+    zpool = {("PoolName", "label"): "tank", ("BwRead", "size"): 0.0}
+    text = format_metrics([("host1", "tank", zpool, {})], StatsCache(None, 1.0), openmetrics=True)
+    lines = sample_lines(text)
+    assert 'zfs_pool_bw_read{host="host1",pool="tank"} 0.0' in lines
+    assert not any(line.startswith(("zfs_pool_state", "zfs_pool_virt", "zfs_pool_bw_write")) for line in lines)
+    assert text.endswith("# EOF\n")
+
+
+def test_label_keys_are_never_numbers():
+    zpool = {("PoolName", "label"): "tank", ("StateHealth", "label"): 0}
+    lines = sample_lines(format_metrics([(None, "tank", zpool, {})], StatsCache(None, 1.0)))
+    assert not any(line.startswith("zfs_pool_state_health") for line in lines)
@@ -0,0 +1,67 @@
+""" Tests of the records written by --output, in each format, and the rotation of --output-file. """
+import csv
+import json
+
+import pytest
+
+from zfs_pool_stats.output import OutputWriter
+
+# A pool before `zpool status` has answered: StateText is unset, not 0.
+PENDING = {("PoolName", "label"): "tank", ("BwWrite", "size"): 2048.0, ("StateFragPerc", "perc"): 0.25,
+           ("StateHealth", "label"): "ONLINE", ("VirtCompRatio", "label"): 1.0}
+COMPLETE = {**PENDING, ("StateText", "label"): 'scan: "scrub" repaired 0B'}
+
+
+def write(tmp_path, kind, records, **kwargs):
+    path = tmp_path / f"out.{kind}"
+    writer = OutputWriter(kind, str(path), flush_interval=0, **kwargs)
+    for timestamp, zpool, formatted in records:
+        writer.write(timestamp, None, "tank", zpool, formatted)
+    writer.close()
+    return path.read_text()
+
+
+def test_csv_columns_are_fixed_by_the_fields(tmp_path):
+    text = write(tmp_path, "csv", [(1.0, PENDING, {"BwWrite": "2K"}), (2.0, COMPLETE, {"BwWrite": "2K", "StateText": "x"})],
+                 raw_fields=["PoolName", "BwWrite", "StateText"], formatted_fields=["BwWrite", "StateText"])
+    rows = list(csv.reader(text.splitlines()))
+    assert rows == [["time", "host", "pool", "PoolName", "BwWrite", "StateText", "BwWrite_fmt", "StateText_fmt"],
+                    ["1.000", "", "tank", "tank", "2048", "", "2K", ""],
+                    ["2.000", "", "tank", "tank", "2048", 'scan: "scrub" repaired 0B', "2K", "x"]]
+
+
+def test_csv_header_is_written_once_per_file(tmp_path):
+    write(tmp_path, "csv", [(1.0, PENDING, {})])
+    text = write(tmp_path, "csv", [(2.0, PENDING, {})])
+    rows = list(csv.reader(text.splitlines()))
+    assert [row[0] for row in rows] == ["time", "1.000", "2.000"]
+    assert rows[0][3:] == ["PoolName", "BwWrite", "StateFragPerc", "StateHealth", "VirtCompRatio"]
+
+
+def test_jsonl_omits_missing_keys(tmp_path):
+    record = json.loads(write(tmp_path, "jsonl", [(1.5, PENDING, {"BwWrite": "2K"})]))
+    assert record == {"time": 1.5, "host": None, "pool": "tank", "formatted": {"BwWrite": "2K"},
+                      "raw": {"PoolName": "tank", "BwWrite": 2048, "StateFragPerc": 0.25, "StateHealth": "ONLINE", "VirtCompRatio": 1}}
+
+
+def test_influx_field_types():
+    line = OutputWriter.format_influx(1.5, "host 1", "tank", COMPLETE)
+    assert line == ('zfs_pool,pool=tank,host=host\\ 1 PoolName="tank",BwWrite=2048,StateFragPerc=0.25,StateHealth="ONLINE",'
+                    'VirtCompRatio=1,StateText="scan: \\"scrub\\" repaired 0B" 1500000000\n')
+    # Labels are always strings, and values which don't fit their key (such as a pending aggregate) are left out.
+    line = OutputWriter.format_influx(1.5, None, "tank", {("StateHealth", "label"): 0, ("BwWrite:avg5m", "size"): "-"})
+    assert line == 'zfs_pool,pool=tank StateHealth="0" 1500000000\n'
+
+
+@pytest.mark.parametrize("keep", [1, 3])
+def test_rotation(tmp_path, keep):
+    path = tmp_path / "out.jsonl"
+    writer = OutputWriter("jsonl", str(path), flush_interval=0, rotate_size=150, keep=keep)
+    for timestamp in range(10):
+        writer.write(float(timestamp), None, "tank", PENDING, {})
+    writer.close()
+    assert sorted(file.name for file in tmp_path.iterdir()) == ["out.jsonl"] + [f"out.jsonl.{i}" for i in range(1, keep + 1)]
+    # Each record is larger than the rotation size, so each file holds one, with the newest in FILE.
+    times = [json.loads(path.with_name(name).read_text())["time"] for name in ["out.jsonl.1", "out.jsonl.2", "out.jsonl.3"][:keep]]
+    assert times == [9.0, 8.0, 7.0][:keep]
+    assert path.read_text() == ""
@@ -0,0 +1,91 @@
+""" Tests of recording the output of commands (--record), and replaying it (--replay). """
+import os
+import subprocess
+
+import pytest
+
+from zfs_pool_stats.replay import CommandLog, RecordingTransport, ReplayFinished, ReplayLog, ReplayTransport
+from zfs_pool_stats.transports import LocalTransport
+
+
+def record(path, host=None, flush_interval=10.0):
+    """Record a few commands, and return the (still open) log."""
+    log = CommandLog(str(path), flush_interval)
+    transport = RecordingTransport(LocalTransport(), log, host)
+    assert transport.run("echo one") == "one\n"
+    with pytest.raises(subprocess.CalledProcessError):
+        transport.run("echo partial; exit 3")
+    with transport.popen("printf 'a\\nb\\n'") as process:
+        assert list(process.stdout) == ["a\n", "b\n"]
+    return log
+
+
+def replay(path, host=None):
+    log = ReplayLog(str(path), speed=0)
+    return log, ReplayTransport(log, host)
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / "log.gz"
+    record(path, "host1").close()
+
+    log, transport = replay(path, "host1")
+    assert log.hosts == ["host1"]
+    assert transport.run("echo one") == "one\n"
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        transport.run("echo partial; exit 3")
+    assert (error.value.returncode, error.value.output) == (3, "partial\n")
+    with transport.popen("printf 'a\\nb\\n'") as process:
+        assert list(process.stdout) == ["a\n", "b\n"]
+    assert process.returncode == 0
+
+    assert not log.finished
+    with pytest.raises(ReplayFinished):
+        transport.run("echo one")
+    assert log.finished
+    with pytest.raises(OSError):
+        transport.popen("printf 'a\\nb\\n'")
+
+
+def test_appended_recordings(tmp_path):
+    path = tmp_path / "log.gz"
+    record(path).close()
+    record(path).close()
+
+    log, transport = replay(path)
+    assert [transport.run("echo one") for _ in range(2)] == ["one\n", "one\n"]
+    with pytest.raises(ReplayFinished):
+        transport.run("echo one")
+
+
+def test_log_without_trailer(tmp_path):
+    # The recorder was killed after flushing, but before closing the log.
+    path = tmp_path / "log.gz"
+    log = record(path, flush_interval=0)
+    data = path.read_bytes()
+    log.close()
+    (tmp_path / "killed.gz").write_bytes(data)
+
+    log, transport = replay(tmp_path / "killed.gz")
+    assert transport.run("echo one") == "one\n"
+    with transport.popen("printf 'a\\nb\\n'") as process:
+        assert list(process.stdout) == ["a\n", "b\n"]
+
+
+@pytest.mark.parametrize("damage", [lambda data, cut: data[:cut],  # Cut part way through a block.
+                                    lambda data, cut: data[:cut] + b"\xff" * 8 + data[cut + 8:],  # Corrupt compressed data.
+                                    lambda data, cut: data[:cut] + bytes([data[cut] ^ 0x40]) + data[cut + 1:],  # A flipped bit.
+                                    lambda data, cut: data + b"garbage after the end"])  # Not another gzip member.
+def test_damaged_log(tmp_path, damage):
+    path = tmp_path / "log.gz"
+    log = record(path, flush_interval=0)
+    # Enough output which doesn't compress, that the damage is well past what's read (and decompressed) at once.
+    for number in range(100, 400):
+        log.write({"n": number, "host": None, "cmd": "head -c 1024 /dev/urandom", "out": os.urandom(1024).hex(), "rc": 0})
+    log.close()
+    data = path.read_bytes()
+    path.write_bytes(damage(data, len(data) * 3 // 4))
+
+    # Whatever was read before the damage is kept, and the replay ends where it starts.
+    log, transport = replay(path)
+    assert transport.run("echo one") == "one\n"
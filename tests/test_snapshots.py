@@ -0,0 +1,32 @@
+""" Tests of keeping the space used by snapshots of every dataset, across passes of `zfs list`. """
+from zfs_pool_stats.sources import SnapshotIndex
+
+
+def test_totals_per_pool():
+    index = SnapshotIndex()
+    seen = index.update(["tank\t0\n", "tank/a\t1000\n", "tank/b\t24\n", "backup\t5\n", "backup/c\t7\n"])
+    assert seen == {"tank", "tank/a", "tank/b", "backup", "backup/c"}
+    assert index.totals == {"tank": 1024, "backup": 12}
+
+
+def test_only_changes_are_applied():
+    index = SnapshotIndex()
+    index.update(["tank\t0\n", "tank/a\t1000\n", "tank/b\t24\n"])
+    index.update(["tank\t0\n", "tank/a\t3000\n", "tank/b\t24\n"])
+    assert index.datasets == {"tank": 0, "tank/a": 3000, "tank/b": 24}
+    assert index.totals == {"tank": 3024}
+
+
+def test_garbled_lines_are_ignored():
+    index = SnapshotIndex()
+    seen = index.update(["tank\t0\n", "\n", "tank/a\t-\n", "cannot open 'nope': dataset does not exist\n"])
+    assert seen == {"tank"}
+    assert index.totals == {"tank": 0}
+
+
+def test_prune_forgets_destroyed_datasets():
+    index = SnapshotIndex()
+    index.update(["tank\t0\n", "tank/a\t1000\n", "tank/b\t24\n"])
+    index.prune(index.update(["tank\t0\n", "tank/b\t24\n"]))
+    assert index.datasets == {"tank": 0, "tank/b": 24}
+    assert index.totals == {"tank": 24}
@@ -0,0 +1,103 @@
+""" Tests of condensing `zpool status` output into one line per pool. """
+from zfs_pool_stats.sources import in_progress, parse_progress, parse_status, progress_done
+
+two_pools = """\
+  pool: tank
+ state: DEGRADED
+status: One or more devices could not be used because the label is missing or
+\tinvalid.  Sufficient replicas exist for the pool to continue
+\tfunctioning in a degraded state.
+action: Replace the device using 'zpool replace'.
+  scan: resilvered 1.21G in 00:01:02 with 0 errors on Mon Jan  8 10:00:00 2024
+config:
+
+\tNAME        STATE     READ WRITE CKSUM
+\ttank        DEGRADED     0     0     0
+\t  sda       ONLINE       0     0     0
+\t  sdb       UNAVAIL      0     0     0
+
+errors: No known data errors
+
+  pool: backup
+ state: ONLINE
+  scan: scrub repaired 0B in 1 days 12:59:37 with 0 errors on Sat Jan 27 22:59:39 2024
+config:
+
+\tNAME        STATE     READ WRITE CKSUM
+\tbackup      ONLINE       0     0     0
+
+errors: No known data errors
+"""
+
+
+def test_one_line_per_pool():
+    statuses = parse_status(two_pools)
+    assert list(statuses) == ["tank", "backup"]
+    assert statuses["backup"] == "scan: scrub repaired 0B in 1 days 12:59:37 with 0 errors on Sat Jan 27 22:59:39 2024"
+
+
+def test_sections_are_joined():
+    status = parse_status(two_pools)["tank"]
+    assert status.startswith("status: One or more devices could not be used because the label is missing or invalid.  "
+                             "Sufficient replicas exist for the pool to continue functioning in a degraded state. ")
+    assert "action: Replace the device using 'zpool replace'." in status
+    assert status.endswith("scan: resilvered 1.21G in 00:01:02 with 0 errors on Mon Jan  8 10:00:00 2024")
+
+
+def test_state_and_config_are_left_out():
+    for status in parse_status(two_pools).values():
+        assert "state:" not in status
+        assert "NAME" not in status
+        assert "errors:" not in status
+
+
+def test_no_pools():
+    assert parse_status("") == {}
+    assert parse_status("no pools available\n") == {}
+
+
+scrub_in_progress = """\
+  pool: tank
+ state: ONLINE
+  scan: scrub in progress since Sun Jul 25 16:07:49 2021
+\t1.23T scanned at 1.2G/s, 345G issued at 345M/s, 2.00T total
+\t0B repaired, 16.85% done, 01:23:45 to go
+remove: Evacuation of mirror in progress since Tue Jan  9 08:30:58 2024
+\t1.50G copied out of 10.0G at 12.3M/s, 15.00% done, 0h11m to go
+config:
+
+\tNAME        STATE     READ WRITE CKSUM
+\ttank        ONLINE       0     0     0
+"""
+
+
+def test_progress_is_shortened():
+    assert parse_status(scrub_in_progress)["tank"] == ("scan: scrub in progress, 16.85% done, 01:23:45 to go "
+                                                       "remove: Evacuation of mirror in progress, 15.00% done, 0h11m to go")
+
+
+def test_parse_progress():
+    assert parse_progress(["scan: resilver in progress since Sun Jul 25 16:07:49 2021",
+                           "1.23T scanned at 1.2G/s, 345G issued at 345M/s, 2.00T total",
+                           "2.1G resilvered, 0.52% done, no estimated completion time"]) == \
+        "scan: resilver in progress, 0.52% done, no estimated completion time"
+
+
+def test_parse_progress_finished_or_not_started():
+    finished = "scan: scrub repaired 0B in 1 days 12:59:37 with 0 errors on Sat Jan 27 22:59:39 2024"
+    assert parse_progress([finished]) == finished
+    # Right after a scan starts, its counters are still being calculated.
+    assert parse_progress(["scan: scrub in progress since Sun Jul 25 16:07:49 2021",
+                           "0B scanned, 0B issued, 0B total"]) == "scan: scrub in progress"
+
+
+def test_in_progress():
+    assert in_progress(parse_status(scrub_in_progress)["tank"])
+    assert not in_progress(parse_status(two_pools)["backup"])
+    assert in_progress("scan: scrub in progress")
+
+
+def test_progress_done():
+    assert progress_done(parse_status(scrub_in_progress)["tank"]) == {"scrub": 0.1685, "removal": 0.15}
+    assert progress_done(parse_status(two_pools)["backup"]) == {}
+    assert progress_done("scan: scrub in progress") == {}
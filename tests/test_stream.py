@@ -0,0 +1,122 @@
+""" Tests of IostatStream, which keeps one `zpool iostat` running and reads its latest line per pool. """
+import queue
+import time
+
+import pytest
+
+from zfs_pool_stats.sources import IostatStream
+
+
+def iostat_line(pool, bw_write):
+    """A line of `zpool iostat -Hypl`, with every latency column."""
+    return "\t".join([pool, "100", "200", "1", "2", "3", str(bw_write)] + ["5"] * 10 + ["-"]) + "\n"
+
+
+class FakeClock:
+    """A clock which only moves when told to."""
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeProcess:
+    """Print each line put in {lines} as `zpool iostat` would, until None is put (when it exits)."""
+
+    def __init__(self):
+        self.lines = queue.Queue()
+        self.stdout = iter(self.lines.get, None)
+        self.returncode = None
+        self.terminated = False
+
+    def wait(self):
+        self.returncode = 0
+
+    def poll(self):
+        return self.returncode
+
+    def terminate(self):
+        self.terminated = True
+        self.lines.put(None)
+
+
+class FakeTransport:
+    def __init__(self):
+        self.processes = queue.Queue()  # Each process started, for the test to feed.
+        self.cmdlines = []
+
+    def popen(self, cmdline):
+        self.cmdlines.append(cmdline)
+        process = FakeProcess()
+        self.processes.put(process)
+        return process
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def stream():
+    transport = FakeTransport()
+    clock = FakeClock()
+    stream = IostatStream(["tank", "backup"], 1.0, transport, restart_delay=0.01, clock=clock)
+    yield stream, transport, clock
+    stream.stop()
+
+
+def test_latest_line_per_pool(stream):
+    stream, transport, clock = stream
+    process = transport.processes.get(timeout=5)
+    assert transport.cmdlines == ["zpool iostat -Hypl tank backup 1"]
+    assert stream.latest("tank") is None
+
+    process.lines.put(iostat_line("tank", 10))
+    process.lines.put("\n")  # Blank and garbled lines are ignored.
+    process.lines.put("cannot open 'gone'\n")
+    process.lines.put(iostat_line("backup", 20))
+    wait_for(lambda: "backup" in stream.samples)
+    assert stream.latest("tank") == iostat_line("tank", 10).rstrip("\n").split("\t")
+    assert stream.latest("backup")[6] == "20"
+    assert stream.latest("gone") is None
+
+    process.lines.put(iostat_line("tank", 11))
+    wait_for(lambda: stream.latest("tank")[6] == "11")
+
+
+def test_stale_lines_are_not_returned(stream):
+    stream, transport, clock = stream
+    process = transport.processes.get(timeout=5)
+    process.lines.put(iostat_line("tank", 10))
+    wait_for(lambda: "tank" in stream.samples)
+
+    clock.now += 2  # Up to {max_intervals} intervals old, it's still the latest.
+    assert stream.latest("tank")[6] == "10"
+    clock.now += 0.5
+    assert stream.latest("tank") is None
+
+    process.lines.put(iostat_line("tank", 12))
+    wait_for(lambda: stream.latest("tank") is not None)
+    assert stream.latest("tank")[6] == "12"
+
+
+def test_restarted_when_the_process_exits(stream):
+    stream, transport, clock = stream
+    first = transport.processes.get(timeout=5)
+    first.lines.put(iostat_line("tank", 10))
+    first.lines.put(None)  # `zpool iostat` exits (or the SSH connection drops).
+
+    second = transport.processes.get(timeout=5)
+    assert first.returncode == 0
+    assert transport.cmdlines == ["zpool iostat -Hypl tank backup 1"] * 2
+    assert stream.latest("tank")[6] == "10"  # The line read before it exited is kept until it's stale.
+    second.lines.put(iostat_line("tank", 13))
+    wait_for(lambda: stream.latest("tank")[6] == "13")
+
+    stream.stop()
+    assert second.terminated
@@ -0,0 +1,89 @@
+""" Tests of running commands through transports, including agent sessions run on this machine. """
+import subprocess
+import threading
+import time
+
+import pytest
+
+from zfs_pool_stats.transports import AgentSession, AgentTransport, LocalTransport
+
+
+@pytest.fixture
+def session():
+    session = AgentSession(LocalTransport())
+    yield session
+    session.close()
+
+
+def test_local_run():
+    transport = LocalTransport()
+    assert transport.run("printf 'a\\tb\\n'") == "a\tb\n"
+    with pytest.raises(subprocess.CalledProcessError):
+        transport.run("exit 3")
+
+
+def test_session_framing(session):
+    assert session.request("printf 'one\\ntwo\\n'") == "one\ntwo\n"
+    assert session.request("printf 'no newline'") == "no newline"
+    assert session.request("true") == ""
+    # Blank lines, and lines which only look like the end marker, are part of the output.
+    assert session.request("printf '\\n\\nx\\n'") == "\n\nx\n"
+    assert session.request("echo 0 0") == "0 0\n"
+
+
+def test_session_is_reused_after_a_failure(session):
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        session.request("echo partial; exit 4")
+    assert error.value.returncode == 4
+    assert error.value.output == "partial\n"
+    assert session.request("echo still here") == "still here\n"
+
+
+def test_session_rejects_multiple_lines(session):
+    with pytest.raises(ValueError):
+        session.request("echo a\necho b")
+
+
+def test_session_ended(session):
+    session.close()
+    with pytest.raises(ConnectionError):
+        session.request("echo gone")
+
+
+def test_agent_transport_pools_sessions():
+    transport = AgentTransport(LocalTransport(), max_idle=2)
+    try:
+        outputs = []
+        threads = [threading.Thread(target=lambda i=i: outputs.append(transport.run(f"sleep 0.2; echo {i}")))
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(outputs) == [f"{i}\n" for i in range(4)]
+        assert len(transport.idle) == 2
+        assert transport.run("echo again") == "again\n"
+    finally:
+        transport.close()
+
+
+@pytest.mark.parametrize("make", [LocalTransport, lambda: AgentTransport(LocalTransport())])
+def test_close_kills_running_commands(make):
+    transport = make()
+    errors = []
+
+    def run():
+        try:
+            transport.run("sleep 30")
+        except (subprocess.CalledProcessError, OSError) as error:
+            errors.append(error)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    time.sleep(0.3)
+    start = time.monotonic()
+    transport.close()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert time.monotonic() - start < 5
+    assert errors
@@ -0,0 +1,91 @@
+""" Tests of the per-vdev and per-disk tree of --vdevs. """
+from zfs_pool_stats.vdevs import histogram_percentiles, parse_latency_histograms, parse_vdev_iostat, parse_vdev_tree, \
+    render_vdev_rows
+
+status = """\
+  pool: tank
+ state: DEGRADED
+config:
+
+\tNAME             STATE     READ WRITE CKSUM
+\ttank             DEGRADED     0     0     0
+\t  raidz1-0       DEGRADED     0     0     0
+\t    sda          ONLINE       0     0     0
+\t    12345678901  UNAVAIL      0     0     0  was /dev/sdx
+\tlogs
+\t  sdc            ONLINE       0     0     0
+
+errors: No known data errors
+
+  pool: backup
+ state: ONLINE
+config:
+
+\tNAME        STATE     READ WRITE CKSUM
+\tbackup      ONLINE       0     0     0
+\t  sdd       ONLINE       0     0     0
+
+errors: No known data errors
+"""
+
+
+def histogram(devices, counts):
+    """Return `zpool iostat -w -v -Hyp` output, with disk_wait_read counts of the buckets from 1023ns to 4194303ns."""
+    lines = []
+    for device, device_counts in zip(devices, counts):
+        lines.append(device)
+        for j, count in zip(range(9, 22), device_counts):
+            lines.append("\t".join([str((1 << (j + 1)) - 1), "0", "0", str(count)] + ["0"] * 7))
+    return "\n".join(lines) + "\n"
+
+
+def test_parse_vdev_tree():
+    trees = parse_vdev_tree(status)
+    assert trees == {"tank": [(1, "raidz1-0"), (2, "sda"), (2, "12345678901"), (1, "logs"), (1, "sdc")],
+                     "backup": [(1, "sdd")]}
+
+
+def test_parse_vdev_iostat():
+    text = ("tank\t100\t200\t1\t2\t3\t4\t5\t6\t7\t8\t9\t10\t11\t12\t13\t14\t15\n"
+            "raidz1-0\t100\t200\t1\t2\t3\t4\t5\t6\t7\t8\t9\t10\t11\t12\t13\t14\t15\n"
+            "logs\t-\t-\t-\t-\t-\t-\t-\t-\t-\t-\t-\t-\t-\t-\t-\t-\t-\n"
+            "sdc\t1\t2\t3\t4\t5\t6\t7\t8\t9\t10\t11\t12\t13\t14\t15\t16\t17\n")
+    devices = parse_vdev_iostat(text, ["tank"])
+    assert list(devices["tank"]) == ["raidz1-0", "sdc"]
+    assert devices["tank"]["sdc"] == ["sdc"] + [str(value) for value in range(1, 18)]
+
+
+def test_parse_latency_histograms():
+    counts = [[0] * 13, [0] * 13]
+    counts[1][10] = 5  # sda: 5 reads in the bucket up to 1048575ns.
+    histograms = parse_latency_histograms(histogram(["tank", "sda"], counts), ["tank"])
+    names, bounds, packed = histograms["tank"]
+    assert names == ["tank", "sda"]
+    assert bounds[0] == 1.023  # Microseconds.
+    assert bounds[10] == 1048.575
+    assert len(packed) == 2 * 13
+    assert packed[13 + 10] == 5
+
+
+def test_histogram_percentiles():
+    counts = [0] * 13
+    counts[2] = 50  # Up to 4.095us
+    counts[10] = 49  # Up to 1048.575us
+    counts[12] = 1  # Up to 4194.303us
+    names, bounds, packed = parse_latency_histograms(histogram(["tank", "sda"], [[0] * 13, counts]), ["tank"])["tank"]
+    assert histogram_percentiles(packed, bounds) == [[0, 0], [4.095, 1048.575]]
+    assert histogram_percentiles(packed, bounds, quantiles=(1.0,))[1] == [4194.303]
+
+
+def test_render_vdev_rows():
+    tree = parse_vdev_tree(status)["tank"]
+    latency = {"sda": (4.095, 1048.575)}
+    rows = render_vdev_rows(tree, {}, latency)
+    assert [row.split()[0] for row in rows] == ["raidz1-0", "sda", "12345678901", "logs", "sdc"]
+    assert rows[1].endswith("p50 4us  p99 1ms")
+    assert rows[3].strip() == "logs"
+
+
+def test_render_vdev_rows_without_status():
+    rows = render_vdev_rows(None, {"sdc": ["sdc"] + ["0"] * 16})
+    assert rows[0].split()[0] == "sdc"
@@ -0,0 +1,62 @@
+""" Collect ZFS pool statistics from Python, without the command-line interface of zfs-pool-stats.py.
+
+    import zfs_pool_stats
+
+    for sample in zfs_pool_stats.collect(["tank"], sources=("iostat", "health")):
+        print(sample.pool, sample.BwWrite, sample.StateHealth)
+
+Importing the package doesn't parse any arguments, run any commands, or import curses or argparse.
+"""
+import time
+
+from .keys import zpool_keys_index, zpool_source_keys
+from .records import Sample, format_samples, zpool_record_keys
+from .sources import SourceCollector, get_stats, list_pools, make_sources
+from .transports import make_transport
+
+__all__ = ["Sample", "collect", "format_samples", "list_pools", "make_sources", "make_transport", "get_stats", "SourceCollector",
+           "zpool_source_keys", "zpool_keys_index", "zpool_record_keys"]
+
+
+def collect(pools=None, sources=None, host=None, interval=1.0, timeout=10.0, transport="ssh"):
+    """Collect one sample of each pool.
+
+    Args:
+        pools: A list of the ZFS pools to collect statistics on, or None for every imported pool.
+        sources: A list of the source names to run (see {zpool_source_keys}), or None for every source.
+                 For example, ("iostat", "health") skips the slower `zfs list` and `zpool status`.
+        host: An SSH destination to collect statistics from, or None for this machine.
+        interval: The delay in seconds (float) over which `zpool iostat` samples the pool.
+        timeout: The time in seconds (float) to wait for each source, on top of the interval for `zpool iostat`.
+                 Sources which haven't finished by then are missing from the samples.
+        transport: How commands are run on the host, either "ssh" or "agent". See make_transport().
+
+    Returns:
+        A list of Sample, one per pool.
+
+    Raises:
+        ValueError if a source doesn't exist.
+    """
+    connection = make_transport(host, transport)
+    try:
+        if pools is None:
+            pools = list_pools(connection)
+        functions = make_sources(interval, connection)
+        unknown = set(sources or ()) - set(functions)
+        if unknown:
+            raise ValueError(f"ERROR: Invalid source(s) {', '.join(sorted(unknown))}. Choose from: {', '.join(functions)}")
+        if sources is not None:
+            functions = {name: func for name, func in functions.items() if name in sources}
+
+        timeouts = {name: timeout + (interval if name == "iostat" else 0) for name in functions}
+        collector = SourceCollector(functions, timeouts)
+        try:
+            stats = get_stats(pools, collector)
+            ages = collector.ages()
+        finally:
+            collector.stop()
+    finally:
+        connection.close()
+
+    collected = time.time()
+    return [Sample(host, pool, collected, zpool, ages) for pool, zpool in stats.items()]
@@ -0,0 +1,4 @@
+""" Run the command-line interface with `python3 -m zfs_pool_stats`. """
+from .cli import main
+
+main()
@@ -0,0 +1,514 @@
+""" The command-line interface. See zfs-pool-stats.py. """
+import argparse
+import signal
+import sys
+import time
+
+from .convert import ColumnPlan, conv_dicts_notation
+from .datasets import DatasetIndex, make_dataset_sources, render_dataset_panel
+from .history import HistoryStore, aggregate_functions
+from .keys import zpool_derived_keys, zpool_event_refresh, zpool_profile_keys, zpool_source_keys, zpool_source_refresh
+from .metrics import StatsCache, serve_metrics
+from .output import OutputWriter, write_records
+from .profiler import Profiler
+from .replay import CommandLog, RecordingTransport, ReplayFinished, ReplayLog, ReplayTransport
+from .sources import EventFollower, IostatStream, KstatReader, SourceCollector, get_stats, in_progress, list_pools, \
+    make_sources, parse_refresh, parse_timeouts
+from .transports import make_transport
+from .vdevs import make_vdev_sources, render_vdev_rows
+
+
+#####  Accept arguments  #####
+
+
+def parse_complex_arg(string):
+    """Parse a flag argument in format 'Main:SubArg1:SubArg2' and intelligently split into a dictionary.
+    Used by the parser module to handle complex/structured flags.
+
+    Args:
+        string: The raw flag (string) to be parsed and split.
+                Primary arguments are split by ',' and Sub-arguments are split by ':'.
+
+    Returns:
+        A dictionary comprised of Primary arguments (as keys) and Sub-arguments (as a list of values).
+        If no Sub-arguments were passed, then value is a list containing an empty string.
+    """
+    arguments = {}
+    try:
+        sub_args = string.split(',')  # Iterate over Primary arguments
+        for i in sub_args:
+            # If ':' separators, split Sub-arguments and stuff them into a list.
+            if ':' in i:
+                key, *value = i.split(':')
+            # If no ':' separators, don't attempt to split non-existent Sub-arguments.
+            else:
+                key, value = i, None
+            arguments[key] = value
+        # Return a dictionary of Primary arguments (as keys) and Sub-arguments (as a list of values).
+        return arguments
+    except ValueError:
+        raise argparse.ArgumentTypeError("ERROR: Invalid format for --columns. Use Column1,Column2, ... ")
+
+
+def parse_columns(string):
+    """Parse the --columns flag in format 'Column:Notation:Aggregate,...' into a dictionary.
+
+    The same as parse_complex_arg(), except that a column with an aggregate (such as 'BwWrite:M:avg5m')
+    is keyed as 'Column:Aggregate' ('BwWrite:avg5m'), so a column can be listed both with and without one.
+    Without a notation, the aggregate may take its place ('BwWrite:avg5m' is the same as 'BwWrite::avg5m').
+
+    Args:
+        string: The raw flag (string) to be parsed and split.
+
+    Returns:
+        A dictionary of column names (as keys) and Sub-arguments (as a list of values, or None).
+    """
+    columns = {}
+    for column in string.split(','):
+        name, *sub_args = column.strip().split(':')
+        # No notation starts with the name of an aggregate function, so 'BwWrite:max' is an (invalid) aggregate.
+        if len(sub_args) == 1 and sub_args[0].startswith(aggregate_functions):
+            sub_args = ["", sub_args[0]]
+        if len(sub_args) > 1 and sub_args[1]:
+            name = f"{name}:{sub_args[1]}"
+        columns[name] = sub_args or None
+    return columns
+
+
+def parse_size(string):
+    """Parse a size such as '100M' into bytes. Uses powers of 1024, the same as `zfs get`.
+
+    Args:
+        string: A whole number, optionally followed by one of 'K', 'M', 'G' or 'T'.
+
+    Returns:
+        The size in bytes (int).
+    """
+    string = string.strip().upper()
+    multiplier = 1024 ** ("KMGT".index(string[-1]) + 1) if string and string[-1] in "KMGT" else 1
+    try:
+        return int(string.rstrip("KMGT")) * multiplier
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"ERROR: Invalid size '{string}'. For example: 500K, 100M, 2G ")
+
+
+def parse_address(string):
+    """Parse a listening address such as ':9100' or '127.0.0.1:9100'.
+
+    Args:
+        string: An optional address or hostname, followed by ':' and a port number.
+
+    Returns:
+        A tuple of (address, port). An empty address listens on every interface.
+    """
+    address, _, port = string.rpartition(':')
+    if not port.isdigit() or int(port) > 65535:
+        raise argparse.ArgumentTypeError(f"ERROR: Invalid address '{string}'. For example: :9100, 127.0.0.1:9100 ")
+    return address.strip('[]'), int(port)
+
+
+def make_parser():
+    """Construct the parser of every flag."""
+    # Assign arguments parser
+    parser = argparse.ArgumentParser()
+
+    # Construct args.COLUMNS dictionary from --columns (-c) flag
+    parser.add_argument('--columns', '-c', dest="COLUMNS", type=parse_columns,
+                        # Default columns if none specified:
+                        # TODO: VirtCapUsedPerc,VirtCompPerc are being ignored?
+                        default="PoolName,VirtCapUsed,VirtCapFree,VirtCapTot,VirtCapUsedPerc,BwRead:M,BwWrite:M,TotalwaitBoth,StateFragPerc,VirtCompPerc,VirtCapUsedBySnaps:G",
+                        help='A comma-separated list of columns to output. Optionally specify :scale, and :aggregate \
+                              to show the min, max, avg or p95 of a column over a rolling window instead, such as avg5m \
+                              or p95_1m. For example:  --columns PoolName,StateHealth,VirtCapFree:T,BwWrite:M:avg5m,TotalwaitBoth::p95_1m ')
+
+    # Construct args.INTERVAL dictionary from --interval (-t) flag
+    parser.add_argument('--interval', '-t', dest="INTERVAL", type=float,
+                        default=1.0,  # Default delay interval of 1 second, if not specified.
+                        help='The frequency of time (in seconds) to output statistics. Accepts whole or decimal numbers. \
+                              This also affects the sampling of some delay measurements; the recommendation is 1 second \
+                              or more, to allow a sufficient sampling window for collecting i/o timing statistics. \
+                              For example:  --interval 1.5 ')
+
+    # Construct args.POOL list from --pool (-p) flag
+    parser.add_argument('--pool', '-p', dest="POOL", type=lambda string: [pool.strip() for pool in string.split(',')],
+                        required=True,
+                        help='A comma-separated list of pools to report statistics for, or "all" for every imported pool. \
+                              All pools are collected by the same commands, one row each. For example:  --pool tank,backup ')
+
+    # Construct args.OUTPUT string from --output (-o) flag
+    parser.add_argument('--output', '-o', dest="OUTPUT", choices=("csv", "jsonl", "influx"), default=None,
+                        help='Instead of the interactive display, write one record per pool per interval in this format, \
+                              for piping into other tools. csv and jsonl records contain both the raw value of every key \
+                              and the formatted value of each of --columns. influx records contain the raw values. ')
+
+    # Construct args.OUTPUT_FILE string from --output-file flag
+    parser.add_argument('--output-file', dest="OUTPUT_FILE", default=None,
+                        help='Append --output records to this file, instead of stdout. For example:  --output-file zfs.csv ')
+
+    # Construct args.FLUSH float from --flush flag
+    parser.add_argument('--flush', dest="FLUSH", type=float, default=10.0,
+                        help='How often (in seconds) --output and --record records are flushed from memory to the output. \
+                              0 flushes every record. For example:  --flush 60 ')
+
+    # Construct args.ROTATE_SIZE integer from --rotate-size flag
+    parser.add_argument('--rotate-size', dest="ROTATE_SIZE", type=lambda string: parse_size(string), default=None,
+                        help='Rotate --output-file once it grows beyond this size, keeping 5 previous files \
+                              (FILE.1 being the newest). Optionally specify a K, M or G suffix. For example:  --rotate-size 100M ')
+
+    # Construct args.SERVE tuple from --serve flag
+    parser.add_argument('--serve', dest="SERVE", type=lambda string: parse_address(string), default=None,
+                        help='Instead of the interactive display, serve every statistic as Prometheus/OpenMetrics \
+                              metrics over HTTP, at /metrics on [ADDRESS]:PORT. For example:  --serve :9100 ')
+
+    # Construct args.FRESHNESS float from --freshness flag
+    parser.add_argument('--freshness', dest="FRESHNESS", type=float, default=None,
+                        help='With --serve, how long (in seconds) a collection is reused for later scrapes, rather than \
+                              collecting again. Scrapes which arrive during a collection always share it. \
+                              Defaults to --interval. For example:  --freshness 5 ')
+
+    # Construct args.RECORD string from --record flag
+    parser.add_argument('--record', dest="RECORD", default=None,
+                        help='Append the raw output of every command run, with its timing, to this compressed log, \
+                              for replaying later with --replay. For example:  --record incident.log.gz ')
+
+    # Construct args.REPLAY string from --replay flag
+    parser.add_argument('--replay', dest="REPLAY", default=None,
+                        help='Instead of running any commands, replay the output recorded by --record, from every \
+                              host it was recorded from. Use the same --pool and --interval as the recording. \
+                              For example:  --replay incident.log.gz ')
+
+    # Construct args.SPEED float from --speed flag
+    parser.add_argument('--speed', dest="SPEED", type=float, default=1.0,
+                        help='With --replay, replay this many times faster than real time, or 0 for as fast as possible. \
+                              The output of --stream is paced by time alone, so it can only be replayed at a speed above 0. \
+                              For example:  --speed 10 ')
+
+    # Construct args.PROFILE boolean from --profile flag
+    parser.add_argument('--profile', dest="PROFILE", action='store_true',
+                        help='Time each source command, parsing, conversion and rendering on every tick, and how late each \
+                              tick started. The timings can be selected as columns: _t_<source> (such as _t_iostat), \
+                              _t_collect, _t_parse, _t_convert, _t_render and _drift. A summary of each is printed on exit. ')
+
+    # Construct args.HISTORY integer from --history flag
+    parser.add_argument('--history', dest="HISTORY", type=int, default=1000,
+                        help='The number of previous rows to keep, for redrawing the screen after it is resized. \
+                              For example:  --history 5000 ')
+
+    # Construct args.HOSTS list from --host (-H) flag
+    parser.add_argument('--host', '-H', dest="HOSTS", type=lambda string: [host.strip() for host in string.split(',')],
+                        default=None,
+                        help='A comma-separated list of SSH destinations to collect statistics from, instead of this machine. \
+                              Each host keeps its own persistent connection. For example:  --host root@192.168.1.33,nas2 ')
+
+    # Construct args.TRANSPORT string from --transport flag
+    parser.add_argument('--transport', dest="TRANSPORT", choices=("ssh", "agent"), default="ssh",
+                        help='How commands are run. "ssh" runs each command as its own process (multiplexed over one \
+                              SSH connection, when using --host). "agent" keeps a few shells running on each host, and \
+                              sends them commands one line at a time, so no process is started per command. ')
+
+    # Construct args.VDEVS boolean from --vdevs flag
+    parser.add_argument('--vdevs', dest="VDEVS", action='store_true',
+                        help='Also show every vdev and disk of each pool, as a tree under its row, with the operations, \
+                              bandwidth and latency of each, and the p50 and p99 of its disk latency (from `zpool iostat -w`). \
+                              Press V to collapse or expand the tree. ')
+
+    # Construct args.DATASETS integer from --datasets flag
+    parser.add_argument('--datasets', dest="DATASETS", type=int, default=None,
+                        help='Also show the top N datasets of the pools in a panel above the columns, ranked by --datasets-by. \
+                              `zfs list` is re-run every 30 seconds by default (see --refresh datasets:N), and rates are \
+                              measured between runs. For example:  --datasets 10 ')
+
+    # Construct args.DATASETS_BY string from --datasets-by flag
+    parser.add_argument('--datasets-by', dest="DATASETS_BY", choices=DatasetIndex.rankings, default="written",
+                        help='What --datasets are ranked by: "growth" of used space per second, bytes "written" per second, \
+                              or space used by "snaps"hots. For example:  --datasets-by growth ')
+
+    # Construct args.STREAM boolean from --stream (-s) flag
+    parser.add_argument('--stream', '-s', dest="STREAM", action='store_true',
+                        help='Keep a single `zpool iostat` process running in the background and read each new sample \
+                              from it, instead of starting a new `zpool iostat` on every refresh. ')
+
+    # Construct args.EVENTS boolean from --events flag
+    parser.add_argument('--events', dest="EVENTS", action='store_true',
+                        help='Follow `zpool events` in the background, and re-run only the sources affected by each event \
+                              (such as a disk faulting, or a scrub starting or finishing) on the next tick. In between events, \
+                              `zpool status` is only run every 300 seconds by default, or at its usual refresh while a scrub, \
+                              resilver or removal is in progress. ')
+
+    # Construct args.KSTAT string from --kstat flag
+    parser.add_argument('--kstat', dest="KSTAT", nargs='?', const="/proc/spl/kstat/zfs", default=None,
+                        help='Calculate operations and bandwidth from the kstat counters of ZFS on Linux, instead of \
+                              running `zpool iostat`. This also adds the OpsReadBoot, OpsWriteBoot, BwReadBoot and \
+                              BwWriteBoot columns (totals since import). Optionally specify the kstat directory. \
+                              For example:  --kstat  or  --kstat /proc/spl/kstat/zfs ')
+
+    # Construct args.TIMEOUTS dictionary from --timeouts flag
+    parser.add_argument('--timeouts', dest="TIMEOUTS", type=parse_complex_arg, default={},
+                        help='The time (in seconds) to wait for each source command before using its previous values. \
+                              Sources are: iostat, capacity, snaps, health, status (and boot, with --kstat, and datasets, with --datasets). By default, each source may take \
+                              up to one interval. For example:  --timeouts status:5,snaps:30 ')
+
+    # Construct args.REFRESH dictionary from --refresh (-r) flag
+    parser.add_argument('--refresh', '-r', dest="REFRESH", type=parse_complex_arg, default={},
+                        help='How often to re-run each source command, either every "tick", every N seconds, or only on \
+                              "demand" (at startup, and whenever R is pressed). Accepts source names or column names; \
+                              a column name sets the tier of the source it comes from. Values reused from a previous run \
+                              are marked with their age. For example:  --refresh status:demand,capacity:30,StateHealth:tick ')
+
+    return parser
+
+
+#####  Print output  #####
+
+
+def interrupt(signum, frame):
+    """Handle SIGTERM (from `timeout`, systemd or `kill`) the same as ^C, so every file is closed on the way out."""
+    raise KeyboardInterrupt
+
+
+def main(argv=None):
+    """Parse the flags, then collect and output statistics until interrupted.
+
+    Args:
+        argv: A list of the flags to parse, instead of sys.argv.
+    """
+    parser = make_parser()
+    args = parser.parse_args(argv)  # Expose args.COLUMNS, args.INTERVAL, etc. for use
+
+    try:
+        refresh = parse_refresh(args.REFRESH, {**zpool_source_refresh, **zpool_event_refresh} if args.EVENTS else zpool_source_refresh)
+    except ValueError as error:
+        parser.error(str(error))
+
+    # Compile --columns once, rejecting any which don't exist.
+    try:
+        plan = ColumnPlan(args.COLUMNS)
+    except ValueError as error:
+        parser.error(str(error))
+
+    if args.SERVE and args.OUTPUT:
+        parser.error("--serve and --output can't be combined.")
+
+    if args.VDEVS and (args.SERVE or args.OUTPUT):
+        parser.error("--vdevs is only shown by the interactive display, and can't be combined with --serve or --output.")
+
+    if args.DATASETS is not None and (args.SERVE or args.OUTPUT):
+        parser.error("--datasets is only shown by the interactive display, and can't be combined with --serve or --output.")
+
+    if args.DATASETS is not None and args.DATASETS < 1:
+        parser.error("--datasets must show at least 1 dataset.")
+
+    if not args.PROFILE and any(plan.keys[name] in zpool_profile_keys for name in plan.names):
+        parser.error("The timing columns (_t_<source>, _t_collect, _t_parse, _t_convert, _t_render and _drift) require --profile.")
+
+    if args.KSTAT and args.HOSTS:
+        parser.error("--kstat can only read the kstats of this machine, and can't be combined with --host.")
+
+    if args.REPLAY and (args.RECORD or args.HOSTS or args.KSTAT):
+        parser.error("--replay replays the hosts it was recorded from, and can't be combined with --record, --host or --kstat.")
+
+    if args.RECORD and args.KSTAT:
+        parser.error("--record only records commands, and kstats are read without any, so it can't be combined with --kstat.")
+
+    # Optionally replay recorded command output, rather than running any commands.
+    replay = ReplayLog(args.REPLAY, args.SPEED) if args.REPLAY else None
+    record = CommandLog(args.RECORD, args.FLUSH) if args.RECORD else None
+
+    # The time between ticks. A replay runs faster (or slower) than the recording by --speed, and ticks
+    # as fast as possible at a speed of 0. Timeouts are scaled the same way, while refresh intervals follow
+    # the clock of the recording.
+    speed = args.SPEED if replay is not None else 1.0
+    interval = max(args.INTERVAL / speed, 0.01) if speed > 0 else 0
+
+    # Optionally read kstat counters instead of running `zpool iostat` at all.
+    kstat = KstatReader(args.KSTAT) if args.KSTAT else None
+
+    # Optionally time every stage of every tick.
+    profiler = Profiler() if args.PROFILE else None
+
+    # Keep the recent history of each pool, if any columns have an aggregate.
+    history = HistoryStore(plan.aggregates, args.INTERVAL, replay.clock if replay is not None else time.monotonic) \
+        if plan.aggregates else None
+
+    # Wait up to one interval for each source by default. `zpool iostat` itself takes a whole interval to sample
+    # the pool (unless streamed), so give it some leeway.
+    timeouts = {name: args.INTERVAL for name in zpool_source_keys}
+    if not args.STREAM and kstat is None:
+        timeouts["iostat"] += 0.5
+    if args.VDEVS:  # These always run `zpool iostat` for a whole interval.
+        timeouts.update({"tree": args.INTERVAL, "vdevs": args.INTERVAL + 0.5, "latency": args.INTERVAL + 0.5})
+    if args.DATASETS is not None:
+        timeouts["datasets"] = args.INTERVAL
+    try:
+        timeouts = parse_timeouts(args.TIMEOUTS, timeouts)
+    except ValueError as error:
+        parser.error(str(error))
+    if speed > 0:
+        timeouts = {name: timeout / speed for name, timeout in timeouts.items()}
+
+    # Each host gets its own transport (and so its own connection), pools, stream and collector.
+    # A host of None means this machine.
+    monitors = []  # A list of (host, transport, pools, stream, collector)
+    followers = []  # The EventFollower of each host, with --events.
+    for host in replay.hosts if replay is not None else args.HOSTS or [None]:
+        transport = ReplayTransport(replay, host) if replay is not None else make_transport(host, args.TRANSPORT)
+        if record is not None:
+            transport = RecordingTransport(transport, record, host)
+
+        # Expand "all" into every imported pool.
+        pools = list_pools(transport, kstat) if args.POOL == ["all"] else args.POOL
+
+        # Optionally keep `zpool iostat` running in the background, rather than starting it on every refresh.
+        stream = IostatStream(pools, args.INTERVAL, transport, clock=replay.clock if replay is not None else time.monotonic) \
+            if args.STREAM and kstat is None else None
+
+        sources = make_sources(args.INTERVAL, transport, stream, kstat)
+        if args.VDEVS:
+            sources.update(make_vdev_sources(args.INTERVAL, transport))
+        if args.DATASETS is not None:  # Each host keeps its own index of datasets between runs of `zfs list`.
+            sources.update(make_dataset_sources(transport, DatasetIndex(args.DATASETS, args.DATASETS_BY),
+                                                replay.clock if replay is not None else time.monotonic))
+
+        # Each collector gets its own copy of the refresh intervals, since --events changes them per host.
+        collector = SourceCollector(sources, timeouts, dict(refresh),
+                                    replay.clock if replay is not None else time.monotonic,
+                                    profiler.add if profiler is not None else None)
+        monitors.append((host, transport, pools, stream, collector))
+
+        # Optionally re-run only the sources affected by each `zpool events` event, instead of polling them as often.
+        if args.EVENTS:
+            followers.append(EventFollower(pools, transport, collector.invalidate))
+
+    def refresh_stats():
+        """Collect the statistics of every pool of every host.
+
+        Returns:
+            A list of (host, pool, zpool, ages) tuples, one per pool, where zpool is as returned by
+            get_stats() and ages is as returned by SourceCollector.ages().
+        """
+        if replay is not None and replay.finished:
+            raise ReplayFinished()
+
+        results = []
+        for host, transport, pools, stream, collector in monitors:
+            start = time.monotonic()
+            stats = get_stats(pools, collector)
+            ages = collector.ages()
+            if args.EVENTS and refresh["status"] is not None:
+                # No event marks the progress of a scan or removal, so follow it at the usual refresh until it ends.
+                busy = any(in_progress(str(zpool.get(('StateText', 'label'), ""))) for zpool in stats.values())
+                collector.refresh["status"] = min(refresh["status"], zpool_source_refresh["status"]) if busy else refresh["status"]
+            if profiler is not None:
+                profiler.add("collect", collector.wait_time)
+                profiler.add("parse", time.monotonic() - start - collector.wait_time)
+                timings = profiler.columns(collector.durations)
+            for pool, zpool in stats.items():
+                if len(monitors) > 1:  # Tell apart pools of the same name on different hosts.
+                    zpool[('PoolName', 'label')] = f"{host}:{pool}"
+                if profiler is not None:
+                    zpool.update(timings)
+                if history is not None:
+                    history.add((host, pool), zpool)
+                results.append((host, pool, zpool, ages))
+        return results
+
+    def refresh_columns():
+        """Collect and render the statistics to be output on each tick, one row and status per pool (per host),
+        and the panel of --datasets."""
+        rows = []
+        statuses = []
+        panel = []
+        results = refresh_stats()
+        collectors = {host: collector for host, transport, pools, stream, collector in monitors}
+        start = time.monotonic()
+        pool_rows = plan.render_rows([zpool for host, pool, zpool, ages in results],
+                                     [ages for host, pool, zpool, ages in results], args.INTERVAL)
+        for (host, pool, zpool, ages), row in zip(results, pool_rows):
+            rows.append(row)
+            if args.VDEVS and vdevs_expanded:
+                latest = collectors[host].results
+                rows.extend(render_vdev_rows(*(latest.get(name, {}).get(pool) for name in ("tree", "vdevs", "latency"))))
+            # Until `zfs get` and `zpool status` have answered, show their keys as "-" (never as zeros).
+            statuses.append((zpool[('PoolName', 'label')], zpool.get(('StateHealth', 'label'), "-"), zpool.get(('StateText', 'label'), "-")))
+        if args.DATASETS is not None:
+            ranked = []
+            for host, transport, pools, stream, collector in monitors:
+                for pool in pools:
+                    entries = collector.results.get("datasets", {}).get(pool) or []
+                    if len(monitors) > 1:  # Tell apart datasets of the same name on different hosts.
+                        entries = [(value, f"{host}:{name}", *values) for value, name, *values in entries]
+                    ranked.append(entries)
+            panel = render_dataset_panel(ranked, args.DATASETS, args.DATASETS_BY)
+        if profiler is not None:
+            profiler.add("convert", time.monotonic() - start)
+        return plan.header, rows, statuses, panel
+
+    def refresh_records():
+        """Collect the records to be written on each tick, one per pool (per host)."""
+        results = refresh_stats()
+        start = time.monotonic()
+        formatted = conv_dicts_notation([zpool for host, pool, zpool, ages in results], args.COLUMNS, plan.keys)
+        records = [(host, pool, zpool, output) for (host, pool, zpool, ages), output in zip(results, formatted)]
+        if profiler is not None:
+            profiler.add("convert", time.monotonic() - start)
+        return records
+
+    def refresh_demand():
+        """Re-run every source of every host on the next tick."""
+        for host, transport, pools, stream, collector in monitors:
+            collector.demand()
+
+    # Whether the tree of vdevs is shown under each pool, with --vdevs.
+    vdevs_expanded = True
+
+    def toggle_vdevs():
+        """Collapse or expand the tree of vdevs under each pool."""
+        nonlocal vdevs_expanded
+        vdevs_expanded = not vdevs_expanded
+
+    # Give every key its CSV column from the first record, even if its source hasn't answered by then.
+    raw_fields = [key[0] for name, keys in zpool_source_keys.items() if name in sources for key in keys] + \
+                 [key[0] for key, name in zpool_derived_keys.items() if name in sources] + \
+                 ([key[0] for key in zpool_profile_keys] if profiler is not None else []) + \
+                 [aggregate_key[0] for key, aggregate_key, function, seconds in plan.aggregates]
+    writer = OutputWriter(args.OUTPUT, args.OUTPUT_FILE, args.FLUSH, args.ROTATE_SIZE,
+                          raw_fields=raw_fields, formatted_fields=list(args.COLUMNS)) if args.OUTPUT else None
+
+    signal.signal(signal.SIGTERM, interrupt)
+    try:
+        if writer is not None:
+            write_records(refresh_records, writer, interval, profiler)
+        elif args.SERVE:
+            serve_metrics(StatsCache(refresh_stats, args.INTERVAL if args.FRESHNESS is None else args.FRESHNESS), args.SERVE)
+        else:
+            from .display import print_columns  # Only imported when shown, since curses is slow to import.
+
+            # Draw the header and the pools straight away, rather than a blank screen until the first collection.
+            first_frame = (plan.header, [], [(f"{host}:{pool}" if len(monitors) > 1 else pool, "-", "")
+                                             for host, transport, pools, stream, collector in monitors for pool in pools],
+                           render_dataset_panel([], args.DATASETS, args.DATASETS_BY) if args.DATASETS is not None else [])
+            print_columns(refresh_columns, interval, on_refresh=refresh_demand, history=args.HISTORY, profiler=profiler,
+                          on_expand=toggle_vdevs if args.VDEVS else None, first_frame=first_frame)
+    except KeyboardInterrupt:  # Exit gracefully on ^C (SIGINT)
+        exit
+    except ReplayFinished:  # Every recorded tick has been replayed.
+        pass
+    except BrokenPipeError:  # The reader of stdout went away, such as `head`.
+        sys.stdout = None
+    finally:
+        # A second SIGTERM (such as from a service manager which is impatient) would interrupt the cleanup
+        # part way, and leave the --record log without its gzip trailer.
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        if writer is not None and sys.stdout is not None:
+            writer.close()
+        for follower in followers:
+            follower.stop()
+        for host, transport, pools, stream, collector in monitors:
+            collector.stop()
+            if stream is not None:
+                stream.stop()
+            transport.close()
+        if record is not None:
+            record.close()
+        if profiler is not None and profiler.samples:
+            print(profiler.summary(), file=sys.stderr)
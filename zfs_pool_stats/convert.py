@@ -0,0 +1,403 @@
+""" Converting raw values into readable notations, and rendering them as rows of columns. """
+import bisect
+
+from .history import parse_aggregate
+from .keys import zpool_key_sources, zpool_keys_index
+
+
+def conv_float(value):
+    """Try to convert string to float, otherwise pass through original input.
+
+    Args:
+        value: The value (string or int) to convert to float.
+
+    Returns:
+        The float representation of value.
+    """
+    try:
+        value = value.strip('-%')  # Remove undesired chars
+        return float(value) if value else 0  # Convert eligible strings to floats. Convert empty strings to 0.
+    except ValueError:  # If failed to convert to float, return as original type.
+        return value
+
+
+def conv_str(input, notation=None):
+    """Accepts any valid input and returns a string.
+    This function is used instead of the built-in str() because str()
+    will error when receiving an invalid second parameter.
+
+    Args:
+        input: The input value to convert to a string.
+        notation: Does nothing. Exists for compatibility reasons.
+
+    Returns:
+        input formatted as a string.
+    """
+
+    return str(input)
+
+
+def conv_perc(input, notation=None):
+    """Accepts any valid input and returns a percentage value as a string.
+
+    Args:
+        input: The input value to convert to a string.
+        notation: Does nothing. Exists for compatibility reasons.
+
+    Returns:
+        input formatted as a string, with a '%' appended.
+    """
+
+    # Handle strings (such as '-' before a source has answered). Return them unmodified.
+    if isinstance(input, str):
+        return input
+
+    # Return a string with no leading/trailing decimals, and append a '%'
+    return f"{input:.0%}"
+
+
+# The automatic notations of sizes and times, in ascending order, with the divisor of each.
+size_notations = ("B", "K", "M", "G", "T", "P", "E")
+size_divisors = [1024 ** i for i in range(len(size_notations))]
+time_notations = ("us", "ms", "s", "m", "h", "d")
+time_divisors = [1, 1000, 1000000, 60000000, 3600000000, 86400000000]
+
+# The value at which each automatic notation starts. A value moves up to the next notation as soon as it
+# would round to a whole one of it, rather than once it reaches it, so the rounded number never outgrows
+# its notation: 59.7s is '1m' rather than '60s', and 1023.6K is '1M' rather than '1024K'.
+size_thresholds = [0] + [divisor - lower / 2 for lower, divisor in zip(size_divisors, size_divisors[1:])]
+time_thresholds = [0] + [divisor - lower / 2 for lower, divisor in zip(time_divisors, time_divisors[1:])]
+
+
+def size_notation(bytes):
+    """Return the index of the automatic notation of a byte value, in {size_notations}.
+
+    The notation is found from the bit length of the value (every notation is 10 bits more than the
+    last), then moved up one if the value would round to a whole one of the next notation.
+    """
+    i = min(max((int(bytes).bit_length() - 1) // 10, 0), len(size_notations) - 1)
+    if i + 1 < len(size_notations) and bytes >= size_thresholds[i + 1]:
+        i += 1
+    return i
+
+
+def time_notation(microseconds):
+    """Return the index of the automatic notation of a microsecond value, in {time_notations}."""
+    return max(bisect.bisect_right(time_thresholds, microseconds) - 1, 0)
+
+
+def conv_bytes(bytes, notation=None):
+    """Convert byte values to a specified notation. Uses powers of 1024 as output by `zfs get`.
+
+    Args:
+        bytes: The byte value (int or float) to convert.
+        notation: The desired notation ('B', 'K', 'M', 'G', 'T', 'P', 'E').
+            If unspecified, automatically chooses the highest notation.
+
+    Returns:
+        A string representing the byte value expressed in the chosen notation."""
+
+    # Handle 0 and strings. Return them unmodified.
+    if bytes == 0 or isinstance(bytes, str):
+        return bytes
+
+    if notation is None:  # Automatic unit scaling, if not specified.
+        i = size_notation(bytes)
+        return f"{round(bytes / size_divisors[i])}{size_notations[i]}"
+
+    try:  # Manual unit scaling, if specified.
+        notation = str(notation[0])
+        index = size_notations.index(notation.upper())  # Find index of target notation
+        return f"{round(bytes / size_divisors[index])}{notation}"
+    except ValueError:
+        print(f"ValueError: {notation} is not one of: {size_notations}")
+
+
+def conv_microseconds(microseconds, notation=None):
+    """Convert microsecond values to a specified notation. Uses microseconds to align with `zpool iostat -p`.
+
+    Args:
+        microseconds: The microsecond value (int or float) to convert.
+        notation: The desired notation ('d', 'h', 'm', 's', 'ms', 'us').
+            If unspecified, automatically chooses the highest notation.
+
+    Returns:
+        A string representing the time value expressed in the chosen notation."""
+
+    # Handle 0 and strings. Return them unmodified.
+    if microseconds == 0 or isinstance(microseconds, str):
+        return microseconds
+
+    if notation is None:  # Automatic unit scaling, if not specified.
+        i = time_notation(microseconds)
+        return f"{round(microseconds / time_divisors[i])}{time_notations[i]}"
+
+    try:  # Manual unit scaling, if specified.
+        notation = str(notation[0])
+        return f"{round(microseconds / time_divisors[time_notations.index(notation)])}{notation}"
+    except ValueError:
+        print(f"ValueError: {notation} is not one of: {time_notations}")
+
+
+# Map each key type to the function which converts it, and the notations that function accepts.
+# This allows us to intelligently convert to higher notations by
+# constructing the key name as a tuple, with the first value in the
+# tuple being the key name, and the second value being the type.
+zpool_keys_types = ('size', 'time', 'label', 'perc')
+zpool_keys_map = {'size': conv_bytes, 'time': conv_microseconds, 'label': conv_str, 'perc': conv_perc}
+zpool_keys_notations = {'size': ("B", "K", "M", "G", "T", "P", "E"), 'time': ("d", "h", "m", "s", "ms", "us")}
+
+
+def conv_column(values, key_type, notation=None):
+    """Convert a whole column of values of one key type at once, such as one key across many samples.
+
+    The same as calling the function of {zpool_keys_map} on each value, but the notation, divisor and
+    tables are looked up once per column rather than once per value.
+
+    Args:
+        values: A list of raw values (int, float or string).
+        key_type: The type of every value, one of {zpool_keys_types}.
+        notation: An optional list of sub-arguments, as in --columns (e.g. ['M']). Otherwise, each value
+                  gets its own automatic notation.
+
+    Returns:
+        A list of converted values, in the same order.
+
+    Raises:
+        ValueError if the notation doesn't exist for key_type.
+    """
+    if key_type == 'label':
+        return [str(value) for value in values]
+    if key_type == 'perc':
+        return [value if isinstance(value, str) else f"{value:.0%}" for value in values]
+
+    names, divisors = (size_notations, size_divisors) if key_type == 'size' else (time_notations, time_divisors)
+    if notation is not None:  # One notation, so one divisor, for the whole column.
+        notation = str(notation[0])
+        if (notation.upper() if key_type == 'size' else notation) not in names:
+            raise ValueError(f"ERROR: Invalid notation '{notation}'. Choose from: {', '.join(names)}")
+        divisor = divisors[names.index(notation.upper() if key_type == 'size' else notation)]
+        return [value if value == 0 or isinstance(value, str) else f"{round(value / divisor)}{notation}"
+                for value in values]
+
+    find = size_notation if key_type == 'size' else time_notation
+    output = []
+    for value in values:
+        if value == 0 or isinstance(value, str):
+            output.append(value)
+        else:
+            i = find(value)
+            output.append(f"{round(value / divisors[i])}{names[i]}")
+    return output
+
+
+def conv_dict_notation(ref_keys, conv_keys, keys_index=zpool_keys_index):
+    """Convert the values in a dictionary from raw integer/time values to human-readable notation.
+
+    Args:
+        ref_keys:  A dictionary containing raw values to be converted to human-readable notation.
+                   Dictionary keys must be in a nested tuple format, as returned by get_stats().
+        conv_keys: A dictionary containing keys to be matched against {ref_keys}. Keys found in
+                   both dictionaries will have their corresponding values in {ref_keys} converted.
+                   Keys found in both dictionaries will have their values extracted from {ref_keys},
+                   converted to human-readable notation, and returned as a new dictionary.
+        keys_index: A dictionary of key names to their full tuples, such as ColumnPlan.keys, which also
+                    holds the keys of aggregate columns. Defaults to {zpool_keys_index}.
+
+    Returns:
+        A dictionary of keys common to both {ref_keys} and {conv_keys}, with values converted."""
+
+    output = {}
+
+    for key_name, notation in conv_keys.items():
+        # Each key of {ref_keys} is a tuple of (key_name, key_type), but we want to access
+        # the key by just key_name, so look up the full tuple in {keys_index}.
+        key_match = keys_index.get(key_name)
+        if key_match in ref_keys:
+            # Check which function to use for conversion.
+            key_use_func = zpool_keys_map.get(key_match[1])
+
+            # Calculate notation and append the key from {conv_keys} to {output}:
+            # An empty notation (such as 'BwRead:' or 'BwRead::avg5m') chooses the notation automatically.
+            output.update({key_name: key_use_func(ref_keys[key_match], notation if notation and notation[0] else None)})
+
+    return (output)
+
+
+def conv_dicts_notation(ref_keys_list, conv_keys, keys_index=zpool_keys_index):
+    """The same as conv_dict_notation(), for many dictionaries at once (such as one per pool).
+    Each key is converted across every dictionary in one call of conv_column().
+
+    Returns:
+        A list of dictionaries, one per dictionary of {ref_keys_list}."""
+    outputs = [{} for _ in ref_keys_list]
+
+    for key_name, notation in conv_keys.items():
+        # Each key of {ref_keys} is a tuple of (key_name, key_type), but we want to access
+        # the key by just key_name, so look up the full tuple in {keys_index}.
+        key_match = keys_index.get(key_name)
+        present = [(output, ref_keys[key_match]) for output, ref_keys in zip(outputs, ref_keys_list) if key_match in ref_keys]
+        if not present:
+            continue
+
+        # An empty notation (such as 'BwRead:' or 'BwRead::avg5m') chooses the notation automatically.
+        values = conv_column([value for output, value in present], key_match[1], notation if notation and notation[0] else None)
+        for (output, raw), value in zip(present, values):
+            output[key_name] = value
+
+    return outputs
+
+
+def get_keys_width(input_dict):
+    """For each key and value pair in input_dict, calculate the maximum length of both. Return a new dictionary.
+
+    Args:
+        input_dict: The input dictionary to perform length calculations on.
+
+    Returns:
+        A new dictionary. Keys are identical to those in input_dict. Values are integers indicating
+        the maximum length in characters of each (key, value) of input_dict, whichever was greater."""
+    column_widths = {}
+
+    # Construct a dictionary, where:
+    # keys = same as {input_dict}
+    # values = the maximum string length of each (key and value) in {input_dict}
+    for key, value in input_dict.items():
+        max_width = max(len(str(key)), len(str(value)))
+        column_widths[key] = max_width + 2
+    return column_widths
+
+
+class ColumnPlan:
+    """The --columns flag, compiled once into everything needed to render each row.
+
+    For each column, the plan holds its full key, conversion function, notation, source and width,
+    and a single format string joins them all. Rendering a row is then a single pass over the columns,
+    without searching for keys or re-measuring the header.
+    """
+
+    # The usual width of a converted value of each type, used as the starting width of its columns.
+    type_widths = {'size': 5, 'time': 5, 'perc': 4, 'label': 6}
+
+    def __init__(self, columns):
+        """Compile the plan.
+
+        Args:
+            columns: A dictionary of column names to sub-arguments, as returned by parse_columns().
+
+        Raises:
+            ValueError if a column, notation or aggregate doesn't exist.
+        """
+        self.names = []
+        # The full key of every column name, as {zpool_keys_index} along with the keys of aggregate columns.
+        # Pass it to conv_dict_notation() to convert aggregate columns.
+        self.keys = dict(zpool_keys_index)
+        self.columns = []  # A list of (key, conversion function, notation, source name), one per column.
+        self.aggregates = []  # A list of (key, aggregate key, function, window seconds), for HistoryStore.
+        for name, sub_args in columns.items():
+            name = name.strip()
+            base, _, aggregate = name.partition(':')
+            key = zpool_keys_index.get(base)
+            source = zpool_key_sources.get(base)
+            if key is None:
+                raise ValueError(f"ERROR: Invalid column '{base}'. Choose from: {', '.join(zpool_keys_index)}")
+
+            # A column with an aggregate (such as 'BwWrite:avg5m') is a new key, which HistoryStore fills in.
+            if aggregate:
+                function, seconds = parse_aggregate(aggregate)
+                if key[1] == 'label':
+                    raise ValueError(f"ERROR: Column '{base}' isn't a number, so it can't have an aggregate.")
+                self.aggregates.append((key, (name, key[1]), function, seconds))
+                key = self.keys[name] = (name, key[1])
+
+            # An empty notation (such as 'BwRead:') chooses the notation automatically, the same as none at all.
+            notation = sub_args if sub_args and sub_args[0] else None
+            valid_notations = zpool_keys_notations.get(key[1])
+            if notation is not None and valid_notations is None:  # Percentages and labels are always shown as is.
+                raise ValueError(f"ERROR: Column '{name}' has no notations, so '{notation[0]}' can't be used.")
+            if notation is not None:
+                if (notation[0].upper() if key[1] == 'size' else notation[0]) not in valid_notations:
+                    raise ValueError(f"ERROR: Invalid notation '{notation[0]}' for column '{name}'. "
+                                     f"Choose from: {', '.join(valid_notations)}")
+
+            self.names.append(name)
+            self.columns.append((key, zpool_keys_map[key[1]], notation, source))
+
+        # Start each column as wide as its name, or the usual width of its values, whichever is greater.
+        usual_values = {name: "0" * self.type_widths[key[1]]
+                        for name, (key, func, notation, source) in zip(self.names, self.columns)}
+        self.widths = list(get_keys_width(usual_values).values())
+        self.compile_format()
+
+    def compile_format(self):
+        """Build the format string (and header) from the current column widths."""
+        self.format = "".join(f"{{:<{width}}}" for width in self.widths)
+        self.header = self.format.format(*self.names)
+
+    def render(self, sample, ages=None, interval=1.0):
+        """Convert and format a sample as one row of aligned columns.
+
+        Args:
+            sample: A dictionary of ZFS pool statistics, as returned by get_stats() for one pool.
+            ages: An optional dictionary of source names to ages in seconds, as returned by SourceCollector.ages().
+                  Values reused from an earlier tick have their age appended, such as '12T~8s'.
+            interval: The delay in seconds (float) between outputs. Values younger than this aren't marked.
+
+        Returns:
+            A string. If a value was wider than its column, the column is widened and {header} is updated.
+        """
+        values = []
+        for key, func, notation, source in self.columns:
+            value = func(sample.get(key, "-"), notation)
+            if ages and key[0] != "PoolName":
+                value = self.mark_age(value, ages.get(source), interval)
+            values.append(value)
+
+        # Widen any column which is now too narrow, so later rows stay aligned.
+        widths = [max(width, len(str(value)) + 2) for width, value in zip(self.widths, values)]
+        if widths != self.widths:
+            self.widths = widths
+            self.compile_format()
+
+        return self.format.format(*values)
+
+    @staticmethod
+    def mark_age(value, age, interval):
+        """Append the age of a value to it (such as '12T~8s'), if it was reused from an earlier tick."""
+        if age is not None and age >= max(interval, 1):
+            return f"{value}~{conv_microseconds(age * 1000000)}"
+        return value
+
+    def widen(self, columns):
+        """Widen any column which is too narrow for its new values (a list of values per column), as render() does for one row."""
+        widths = [max(width, max(len(str(value)) + 2 for value in values)) for width, values in zip(self.widths, columns)]
+        if widths != self.widths:
+            self.widths = widths
+            self.compile_format()
+
+    def render_rows(self, samples, ages=None, interval=1.0):
+        """Convert and format many samples (such as one per pool) as rows of aligned columns.
+        Each column is converted across every sample at once, by conv_column().
+
+        Args:
+            samples: A list of dictionaries of ZFS pool statistics, as returned by get_stats() for each pool.
+            ages: An optional list of dictionaries of source names to ages in seconds, one per sample, as returned
+                  by SourceCollector.ages(). Values reused from an earlier tick have their age appended, such as '12T~8s'.
+            interval: The delay in seconds (float) between outputs. Values younger than this aren't marked.
+
+        Returns:
+            A list of strings, one per sample. If a value was wider than its column, the column is widened and
+            {header} is updated.
+        """
+        if not samples:
+            return []
+
+        columns = []
+        for key, func, notation, source in self.columns:
+            values = conv_column([sample.get(key, "-") for sample in samples], key[1], notation)
+            if ages and key[0] != "PoolName":
+                values = [self.mark_age(value, sample_ages.get(source), interval) if sample_ages else value
+                          for value, sample_ages in zip(values, ages)]
+            columns.append(values)
+        self.widen(columns)
+        return [self.format.format(*row) for row in zip(*columns)]
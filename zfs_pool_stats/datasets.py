@@ -0,0 +1,152 @@
+""" The top datasets of each pool by growth, write rate or snapshot usage, for --datasets. """
+import heapq
+import itertools
+import subprocess
+import time
+
+from .convert import conv_bytes
+
+
+class DatasetIndex:
+    """Keep the latest values of every dataset, and rank them by growth, write rate or space used by snapshots.
+
+    Each pass over `zfs list` output is parsed line by line as it arrives, and diffed against the previous
+    pass in a hash index keyed by dataset name. Lines which didn't change since the previous pass aren't
+    parsed again. As each dataset is read, it's offered to a bounded min-heap of its pool, so the top
+    {top} of each pool are found during the pass itself, in O(n log top), without sorting every dataset.
+    """
+
+    # The properties listed by `zfs list`, after the name.
+    properties = ("used", "written", "usedbysnapshots", "logicalused")
+
+    # What datasets can be ranked by: the growth of `used` per second, bytes written per second, or `usedbysnapshots`.
+    rankings = ("growth", "written", "snaps")
+
+    def __init__(self, top=10, by="written"):
+        """
+        Args:
+            top: The number of datasets to rank in each pool.
+            by: What datasets are ranked by, one of {rankings}.
+        """
+        self.top = top
+        self.by = by
+        # The latest values of each dataset, as {dataset name: (line, used, written, usedbysnapshots, logicalused,
+        # growth per second, written per second)}. The rates are None until a dataset has been seen twice.
+        self.datasets = {}
+        self.time = None  # The time of the previous pass, in seconds.
+        self.ranked = {}  # The top datasets of each pool, as {pool name: [entry, ...]}, highest first. See update().
+
+    def update(self, lines, now):
+        """Apply one pass of `zfs list -Hp -o name,used,written,usedbysnapshots,logicalused` output, and rank it.
+
+        Args:
+            lines: An iterable of tab-separated lines, such as the stdout of a transport's popen().
+            now: The time of the pass, in seconds (float).
+
+        Returns:
+            A set of the dataset names seen during this pass. {ranked} is replaced by the ranking of this pass,
+            as lists of (value ranked by, dataset name, growth per second, written per second, usedbysnapshots,
+            used, logicalused) tuples.
+        """
+        elapsed = now - self.time if self.time is not None else None
+        rank = self.rankings.index(self.by)
+        heaps = {}  # A bounded min-heap of (value ranked by, dataset name) per pool.
+        seen = set()
+        for line in lines:
+            line = line.rstrip('\n')
+            name, _, values = line.partition('\t')
+            previous = self.datasets.get(name)
+
+            if previous is not None and previous[0] == line:  # Unchanged, so nothing grew or was written.
+                entry = previous if previous[5:] == (0.0, 0.0) else previous[:5] + (0.0, 0.0)
+            else:
+                try:
+                    used, written, snaps, logical = (int(value) for value in values.split('\t'))
+                except ValueError:  # Ignore blank or garbled lines.
+                    continue
+                growth = rate = None
+                if previous is not None and elapsed:
+                    growth = (used - previous[1]) / elapsed
+                    # `written` counts from the latest snapshot, so it starts again from 0 when one is taken.
+                    rate = (written - previous[2] if written >= previous[2] else written) / elapsed
+                entry = (line, used, written, snaps, logical, growth, rate)
+            self.datasets[name] = entry
+            seen.add(name)
+
+            value = (entry[5], entry[6], entry[3])[rank]
+            if value is None:
+                continue
+            heap = heaps.setdefault(name.partition('/')[0], [])
+            if len(heap) < self.top:
+                heapq.heappush(heap, (value, name))
+            elif value > heap[0][0]:
+                heapq.heapreplace(heap, (value, name))
+
+        self.time = now
+        self.ranked = {pool: [self.entry(value, name) for value, name in sorted(heap, reverse=True)]
+                       for pool, heap in heaps.items()}
+        return seen
+
+    def entry(self, value, name):
+        """Return the ranked entry of a dataset, as described in update()."""
+        line, used, written, snaps, logical, growth, rate = self.datasets[name]
+        return (value, name, growth, rate, snaps, used, logical)
+
+    def prune(self, seen):
+        """Forget datasets which no longer exist.
+
+        Args:
+            seen: A set of the dataset names seen during the latest complete pass, as returned by update().
+        """
+        for name in self.datasets.keys() - seen:
+            del self.datasets[name]
+
+
+def make_dataset_sources(transport, index, clock=time.monotonic):
+    """Construct the source of --datasets, which runs alongside (and in the same way as) those of make_sources().
+
+    Args:
+        transport: The transport used to run `zfs list`, as returned by make_transport().
+        index: The DatasetIndex which keeps the datasets between passes.
+        clock: The function which returns the current time in seconds, against which rates are measured.
+
+    Returns:
+        A dictionary of the source name to a function. The function accepts a tuple of pool names and
+        returns a dictionary of pool names to their top datasets, as in DatasetIndex.ranked.
+    """
+    def source_datasets(pools):
+        cmdline = f"zfs list -Hp -r -t filesystem,volume -o name,{','.join(index.properties)} {' '.join(pools)}"
+        with transport.popen(cmdline) as process:
+            seen = index.update(process.stdout, clock())
+        if process.returncode != 0:  # Keep what was read, but don't forget datasets based on a partial list.
+            raise subprocess.CalledProcessError(process.returncode, cmdline)
+        index.prune(seen)
+        return {pool: index.ranked.get(pool, []) for pool in pools}
+
+    return {"datasets": source_datasets}
+
+
+def render_dataset_panel(ranked, top, by):
+    """Render the top datasets of every pool as the lines of a panel, always {top} + 1 lines long.
+
+    Args:
+        ranked: A list of the ranked lists of each pool (and host), as in DatasetIndex.ranked. Dataset names
+                may have been prefixed with their host.
+        top: The number of datasets to show.
+        by: What datasets are ranked by, one of DatasetIndex.rankings.
+
+    Returns:
+        A list of strings: a title, then one line per dataset (blank where there are fewer).
+    """
+    titles = {"growth": "growth of used space", "written": "bytes written", "snaps": "space used by snapshots"}
+    entries = heapq.nlargest(top, itertools.chain.from_iterable(ranked))
+    width = max((len(entry[1]) for entry in entries), default=0) + 2
+
+    def rate(value):
+        return "-" if value is None else f"{conv_bytes(value)}/s"
+
+    lines = [f"Top {top} datasets by {titles[by]}" + ("" if entries else " (ranked once `zfs list` has run)")]
+    for value, name, growth, written, snaps, used, logical in entries:
+        lines.append(f"  {name:<{width}}grow {rate(growth):<8}write {rate(written):<8}"
+                     f"snaps {conv_bytes(snaps):<6}used {conv_bytes(used):<6}logical {conv_bytes(logical)}")
+    return lines + [""] * (top + 1 - len(lines))
@@ -0,0 +1,196 @@
+""" The interactive curses display. Only imported when it's shown, since curses is slow to import. """
+import collections
+import curses
+import time
+
+
+class Renderer:
+    """Draw the sticky status lines, an optional panel, the columns header and a scrolling history of rows with curses.
+
+    The screen is laid out top to bottom as: one status line per pool (with its health in color), the
+    lines of the panel (such as the top datasets of --datasets), the columns header, and the history region. Status and header lines are compared against what was drawn
+    on the previous frame, and only the parts which changed are redrawn. New rows scroll the history
+    region, so the rows already on screen are never rewritten. The last rows are kept in a bounded ring
+    buffer, so the whole screen can be redrawn after the terminal is resized.
+    """
+
+    # The color of each pool health, as (color pair number, curses color).
+    health_colors = {"ONLINE": (1, curses.COLOR_GREEN), "DEGRADED": (2, curses.COLOR_YELLOW),
+                     "FAULTED": (3, curses.COLOR_RED), "OFFLINE": (3, curses.COLOR_RED),
+                     "UNAVAIL": (3, curses.COLOR_RED), "REMOVED": (3, curses.COLOR_RED),
+                     "SUSPENDED": (3, curses.COLOR_RED)}
+
+    def __init__(self, stdscr, history=1000):
+        """Prepare the screen.
+
+        Args:
+            stdscr: The curses window covering the whole screen, as passed by curses.wrapper().
+            history: The number of rows to keep in the ring buffer.
+        """
+        self.stdscr = stdscr
+        self.history = collections.deque(maxlen=history)
+        self.lines = {}  # What was drawn on each sticky line, as {y: [(text, attr), ...]}
+        self.top = 0  # The first line of the history region.
+        self.filled = 0  # The number of lines of the history region which have been drawn on.
+        self.region = None
+        self.last = None  # The header, statuses and panel of the previous frame, as (header, statuses, panel).
+
+        curses.curs_set(0)  # Hide the cursor
+        if curses.has_colors():
+            curses.use_default_colors()
+            for pair, color in self.health_colors.values():
+                curses.init_pair(pair, color, -1)
+        self.resize()
+
+    def resize(self):
+        """Adapt to the current terminal size, and redraw everything."""
+        curses.update_lines_cols()
+        self.height, self.width = self.stdscr.getmaxyx()
+        self.stdscr.clear()
+        self.lines = {}
+        self.region = None  # Re-created by draw(), once the number of status lines is known.
+        if self.last is not None:
+            self.draw(self.last[0], [], self.last[1], self.last[2])
+
+    def health_attr(self, health):
+        """Return the curses attribute used to draw a pool health."""
+        pair = self.health_colors.get(str(health))
+        return curses.color_pair(pair[0]) | curses.A_BOLD if pair and curses.has_colors() else curses.A_BOLD
+
+    def draw_line(self, y, segments):
+        """Draw a sticky line, redrawing only the segments which differ from the previous frame.
+
+        Args:
+            y: The line number on the screen.
+            segments: A list of (text, curses attribute) tuples, drawn one after another.
+        """
+        old = self.lines.get(y, [])
+        if segments == old or y >= self.height:
+            return
+
+        x = 0
+        moved = False  # Once a segment changes length, everything after it has moved and must be redrawn.
+        for i, (text, attr) in enumerate(segments):
+            if moved or i >= len(old) or old[i] != (text, attr):
+                if x < self.width - 1:
+                    self.stdscr.addstr(y, x, text[:self.width - 1 - x], attr)
+                moved = moved or i >= len(old) or len(old[i][0]) != len(text)
+            x += len(text)
+
+        if sum(len(text) for text, attr in old) > x and x < self.width - 1:
+            self.stdscr.move(y, x)
+            self.stdscr.clrtoeol()
+        self.lines[y] = segments
+
+    def make_region(self, top):
+        """Create the scrolling history region below the sticky lines, and fill it from the ring buffer."""
+        self.top = top
+        self.region = None
+        self.filled = 0
+        self.lines = {y: segments for y, segments in self.lines.items() if y < top}  # Now part of the region.
+        if self.height - top <= 0:
+            return
+        self.region = self.stdscr.derwin(self.height - top, self.width, top, 0)
+        self.region.scrollok(True)
+        self.region.idlok(True)  # Let the terminal scroll lines itself, rather than redrawing them.
+        self.region.erase()
+        for row in list(self.history)[-(self.height - top):]:
+            self.add_row(row)
+
+    def add_row(self, row):
+        """Draw a row at the bottom of the history region, scrolling it up once it is full."""
+        region_height = self.height - self.top
+        if self.filled < region_height:
+            y = self.filled
+            self.filled += 1
+        else:
+            self.region.scroll(1)
+            y = region_height - 1
+        self.region.addstr(y, 0, row[:self.width - 1])
+
+    def draw(self, header, rows, statuses, panel=()):
+        """Draw one frame.
+
+        Args:
+            header: The columns header, as a string.
+            rows: A list of the new rows, as strings.
+            statuses: A list of (pool name, health, status text) tuples, one per pool.
+            panel: A list of the lines of the panel, as strings. The first line is drawn as its title.
+        """
+        self.last = (header, statuses, panel)
+
+        for y, (pool, health, text) in enumerate(statuses):
+            self.draw_line(y, [(f"{pool}  ", curses.A_NORMAL), (str(health), self.health_attr(health)),
+                               (f"  {text}", curses.A_NORMAL)])
+        for y, line in enumerate(panel, len(statuses)):
+            self.draw_line(y, [(line, curses.A_BOLD if y == len(statuses) else curses.A_NORMAL)])
+        top = len(statuses) + len(panel)
+        self.draw_line(top, [(header, curses.A_BOLD | curses.A_UNDERLINE)])
+
+        if self.region is None or self.top != top + 1:
+            self.make_region(top + 1)
+
+        for row in rows:
+            self.history.append(row)
+            if self.region is not None:
+                self.add_row(row)
+
+        # Send every change to the terminal at once.
+        self.stdscr.noutrefresh()
+        if self.region is not None:
+            self.region.noutrefresh()
+        curses.doupdate()
+
+
+def print_columns(get_input, interval=1.0, on_refresh=None, history=1000, profiler=None, on_expand=None, first_frame=None):
+    """On a loop, print out rows in columns format.
+
+    Args:
+        get_input: A function which returns a tuple of (header, rows, statuses) or (header, rows, statuses, panel)
+                   to be output, called once per interval. See Renderer.draw() for their format.
+        interval: The delay in seconds (float) between outputs.
+        on_refresh: An optional function, called whenever R is pressed.
+        history: The number of rows to keep for redrawing the screen after it is resized.
+        profiler: An optional Profiler, to time each tick and each drawing of the screen.
+        on_expand: An optional function, called whenever V is pressed.
+        first_frame: An optional tuple of (header, rows, statuses[, panel]), drawn before the first call to get_input().
+    """
+
+    # Cast some curses
+    def stdscr(stdscr):
+        renderer = Renderer(stdscr, history)
+        if first_frame is not None:
+            renderer.draw(*first_frame)
+
+        # Schedule each output against the clock, rather than sleeping a whole interval after
+        # each one, so the time spent collecting and printing isn't added to the interval.
+        next_tick = time.monotonic()
+
+        while True:
+            if profiler is None:
+                renderer.draw(*get_input())
+            else:
+                profiler.tick(interval)
+                frame = get_input()
+                start = time.monotonic()
+                renderer.draw(*frame)
+                profiler.add("render", time.monotonic() - start)
+
+            # If a tick ran late, don't try to catch up by outputting several at once.
+            next_tick = max(next_tick + interval, time.monotonic())
+
+            # Wait for the next tick, while handling key presses and terminal resizes (SIGWINCH) as they happen.
+            while (remaining := next_tick - time.monotonic()) > 0:
+                stdscr.timeout(max(int(remaining * 1000), 1))
+                key = stdscr.getch()
+                if key == curses.KEY_RESIZE:
+                    renderer.resize()
+                elif key in (ord('r'), ord('R')) and on_refresh is not None:
+                    on_refresh()
+                elif key in (ord('v'), ord('V')) and on_expand is not None:
+                    on_expand()
+                elif key in (ord('q'), ord('Q')):
+                    return
+
+    # Call stdscr() sub-function
+    curses.wrapper(stdscr)
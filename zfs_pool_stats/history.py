@@ -0,0 +1,147 @@
+""" Rolling-window aggregates (min, max, avg and p95) of columns, such as 'BwWrite:M:avg5m'. """
+import array
+import bisect
+import collections
+import math
+import time
+
+
+# The aggregates which can be appended to a column, such as 'BwWrite:M:avg5m'.
+aggregate_functions = ("min", "max", "avg", "p95")
+
+
+def parse_duration(string):
+    """Parse a duration such as '30s', '5m' or '1h' into seconds (float)."""
+    units = {"s": 1, "m": 60, "h": 3600}
+    try:
+        return float(string[:-1]) * units[string[-1]]
+    except (IndexError, KeyError, ValueError):
+        raise ValueError(f"ERROR: Invalid duration '{string}'. For example: 30s, 5m, 1h ")
+
+
+def parse_aggregate(string):
+    """Parse an aggregate such as 'avg5m' or 'p95_1m' into its function and window.
+
+    Returns:
+        A tuple of (function name, window in seconds).
+    """
+    for function in aggregate_functions:
+        window = string[len(function):].lstrip('_')
+        if string.startswith(function) and window:  # A function without a window (such as 'max') is invalid.
+            return function, parse_duration(window)
+    raise ValueError(f"ERROR: Invalid aggregate '{string}'. Use one of {', '.join(aggregate_functions)} "
+                     f"followed by a window. For example: avg5m, p95_1m ")
+
+
+class RollingWindow:
+    """One aggregate of one key of one pool, kept up to date as samples enter and leave its window.
+
+    The samples themselves stay in the ring buffer of HistoryStore. The window only keeps what its
+    aggregate needs, and each sample is added once and removed once:
+        avg  A running sum and count.
+        min  A deque of sample numbers, whose values only increase from oldest to newest.
+        max  The same, but decreasing.
+        p95  A sorted list of the values in the window.
+    """
+
+    def __init__(self, function, seconds):
+        self.function = function
+        self.seconds = seconds
+        self.first = 0  # The sample number of the oldest sample in the window.
+        self.total = 0.0
+        self.count = 0
+        self.extremes = collections.deque()  # For min and max.
+        self.ordered = []  # For p95.
+
+    def add(self, number, value):
+        """Add a sample to the window."""
+        if self.function == "avg":
+            self.total += value
+            self.count += 1
+        elif self.function == "p95":
+            bisect.insort(self.ordered, value)
+        else:  # Older samples which can no longer be the min (or max) are dropped.
+            while self.extremes and (self.extremes[-1][1] >= value if self.function == "min" else self.extremes[-1][1] <= value):
+                self.extremes.pop()
+            self.extremes.append((number, value))
+
+    def remove(self, number, value):
+        """Remove a sample, which must be the oldest in the window."""
+        if self.function == "avg":
+            self.total -= value
+            self.count -= 1
+            if not self.count:
+                self.total = 0.0  # Don't let rounding errors accumulate.
+        elif self.function == "p95":
+            del self.ordered[bisect.bisect_left(self.ordered, value)]
+        elif self.extremes and self.extremes[0][0] == number:
+            self.extremes.popleft()
+
+    def value(self):
+        """Return the aggregate of the window, or '-' if it has no samples."""
+        if self.function == "avg":
+            return self.total / self.count if self.count else "-"
+        if self.function == "p95":
+            return self.ordered[math.ceil(0.95 * len(self.ordered)) - 1] if self.ordered else "-"
+        return self.extremes[0][1] if self.extremes else "-"
+
+
+class HistoryStore:
+    """Keep the recent samples of each pool, for the rolling aggregates of --columns (such as 'BwWrite:avg5m').
+
+    Each pool has a ring buffer: one fixed-size array of floats per key being aggregated, plus an array of
+    sample times. Its size is fixed by the longest window and the interval, so memory stays the same however
+    long the tool runs. If samples arrive faster than the interval, windows are cut short at that size.
+    Values which aren't numbers are kept as NaN, and left out of every aggregate.
+    """
+
+    def __init__(self, aggregates, interval, clock=time.monotonic):
+        """Prepare the store. Each pool's buffer is created when its first sample is added.
+
+        Args:
+            aggregates: A list of (key, aggregate key, function, window seconds), as in ColumnPlan.aggregates.
+            interval: The time in seconds (float) between samples.
+            clock: The function which returns the current time in seconds. See SourceCollector.
+        """
+        self.aggregates = aggregates
+        self.keys = list(dict.fromkeys(key for key, aggregate_key, function, seconds in aggregates))
+        self.size = int(max((seconds for *rest, seconds in aggregates), default=0) / max(interval, 0.01)) + 2
+        self.clock = clock
+        self.pools = {}  # {pool: (times array, {key: values array}, [number of samples added], [RollingWindow])}
+
+    def add(self, pool, sample):
+        """Add a sample to a pool's history, and fill in the aggregate keys of the sample.
+
+        Args:
+            pool: Anything identifying the pool, such as a (host, pool name) tuple.
+            sample: A dictionary of ZFS pool statistics, as returned by get_stats() for one pool.
+        """
+        if pool not in self.pools:
+            self.pools[pool] = (array.array('d', [0.0] * self.size), {key: array.array('d', [math.nan] * self.size) for key in self.keys},
+                                [0], [RollingWindow(function, seconds) for key, aggregate_key, function, seconds in self.aggregates])
+        times, values, counter, windows = self.pools[pool]
+
+        now = self.clock()
+        number = counter[0]
+        counter[0] += 1
+        slot = number % self.size
+
+        # Remove samples which have left each window, including the one about to be overwritten.
+        for (key, aggregate_key, function, seconds), window in zip(self.aggregates, windows):
+            column = values[key]
+            while window.first < number and (window.first <= number - self.size or times[window.first % self.size] <= now - seconds):
+                value = column[window.first % self.size]
+                if not math.isnan(value):
+                    window.remove(window.first, value)
+                window.first += 1
+
+        times[slot] = now
+        for key in self.keys:
+            value = sample.get(key)
+            values[key][slot] = value if isinstance(value, (int, float)) else math.nan
+
+        for (key, aggregate_key, function, seconds), window in zip(self.aggregates, windows):
+            value = values[key][slot]
+            if not math.isnan(value):
+                window.add(number, value)
+            sample[aggregate_key] = window.value()
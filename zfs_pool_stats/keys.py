@@ -0,0 +1,57 @@
+""" The keys of each pool's statistics, which source command each comes from, and how often each source is re-run. """
+
+
+# The keys assigned from the output of each source command, in the order the command outputs them.
+#   NOTE: In case the output sequence from any of these underlying commands ever changes in a future version,
+#         the keys and values will be misaligned, requiring source code adjustment.
+zpool_source_keys = {
+    "iostat": [("PoolName", "label"), ("LogicCapUsed", "size"), ("LogicCapFree", "size"), ("OpsRead", "size"), ("OpsWrite", "size"), ("BwRead", "size"), ("BwWrite", "size"), ("TotalwaitRead", "time"), ("TotalwaitWrite", "time"), ("DiskwaitRead", "time"), ("DiskwaitWrite", "time"), ("SyncqwaitRead", "time"), ("SyncqwaitWrite", "time"),
+               ("AsyncqwaitRead", "time"), ("AsyncqwaitWrite", "time"), ("ScrubWait", "time"), ("TrimWait", "time")],
+    "capacity": [("VirtCapUsed", "size"), ("VirtCapFree", "size"), ("VirtCompRatio", "label"), ("VirtCapUsedByChilds", "size")],
+    "snaps": [("VirtCapUsedBySnaps", "size")],
+    "health": [("StateHealth", "label"), ("StateFragPerc", "perc")],
+    "status": [("StateText", "label")],
+    # Only available from the kstat collector (--kstat):
+    "boot": [("OpsReadBoot", "size"), ("OpsWriteBoot", "size"), ("BwReadBoot", "size"), ("BwWriteBoot", "size")]}
+
+# The keys derived in get_stats(), and the sources they are calculated from (so their age can be shown).
+zpool_derived_keys = {("VirtCapTot", "size"): "capacity", ("VirtCapUsedPerc", "perc"): "capacity",
+                      ("VirtCompPerc", "perc"): "capacity", ("TotalwaitBoth", "time"): "iostat"}
+
+# The timings measured by --profile, in microseconds: the time each source command took, the time spent
+# waiting for them, parsing, converting and rendering, and how late the tick started.
+zpool_profile_keys = [(f"_t_{name}", "time") for name in zpool_source_keys] + \
+                     [("_t_collect", "time"), ("_t_parse", "time"), ("_t_convert", "time"), ("_t_render", "time"), ("_drift", "time")]
+
+# Look up the full (key_name, key_type) tuple and the source of any key, by just its key_name.
+zpool_keys_index = {key[0]: key for keys in zpool_source_keys.values() for key in keys}
+zpool_keys_index.update({key[0]: key for key in zpool_derived_keys})
+zpool_keys_index.update({key[0]: key for key in zpool_profile_keys})
+zpool_key_sources = {key[0]: name for name, keys in zpool_source_keys.items() for key in keys}
+zpool_key_sources.update({key[0]: name for key, name in zpool_derived_keys.items()})
+
+# How often each source is re-run by default, in seconds. 0 means every tick, and None means only on demand.
+#   Most values besides `zpool iostat` are extremely unlikely to change +/- 1% from one second to the next.
+zpool_source_refresh = {"iostat": 0, "capacity": 10, "snaps": 15, "health": 5, "status": 15, "boot": 0,
+                        # The sources of --vdevs (see make_vdev_sources()):
+                        "tree": 15, "vdevs": 0, "latency": 0,
+                        # The source of --datasets (see make_dataset_sources()), which lists every dataset:
+                        "datasets": 30}
+
+# With --events, `zpool status` only changes when an event says so (besides the progress of a scan),
+# so it can be re-run very rarely in between.
+zpool_event_refresh = {"status": 300, "tree": 300}
+
+# The sources to re-run after each class of `zpool events`, by the last part of the class name
+# (e.g. "sysevent.fs.zfs.scrub_finish"). Every "ereport" class re-runs `zpool status`, and others are ignored.
+zpool_event_sources = {
+    "statechange": ("health", "status", "tree"),  # A vdev faulted, degraded, was removed or came back online.
+    "scrub_start": ("status",), "scrub_finish": ("status",), "scrub_abort": ("status",),
+    "scrub_paused": ("status",), "scrub_resume": ("status",),
+    "resilver_start": ("health", "status"), "resilver_finish": ("health", "status"),
+    "vdev_add": ("capacity", "status", "tree"), "vdev_attach": ("health", "status", "tree"),
+    "vdev_remove": ("capacity", "health", "status", "tree"), "vdev_remove_dev": ("capacity", "health", "status", "tree"),
+    "vdev_spare": ("health", "status", "tree"), "vdev_clear": ("health", "status"), "vdev_online": ("health", "status"),
+    "vdev_autoexpand": ("capacity", "status"), "config_sync": ("status", "tree"),
+    "pool_import": ("capacity", "health", "status", "tree"), "pool_export": ("capacity", "health", "status", "tree"),
+    "pool_destroy": ("capacity", "health", "status", "tree")}
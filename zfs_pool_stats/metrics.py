@@ -0,0 +1,183 @@
+""" Serving the statistics as Prometheus/OpenMetrics metrics over HTTP, for --serve. """
+import threading
+import time
+
+from .keys import zpool_key_sources, zpool_keys_index, zpool_profile_keys
+from .sources import progress_done
+
+
+class StatsCache:
+    """Share one collection between every scrape which asks for it at about the same time.
+
+    A scrape which arrives while a collection is running waits for that collection, rather than
+    starting its own. A scrape which arrives within {freshness} seconds of the last collection is
+    served that collection. So however many scrapers there are, the system commands are only ever
+    run once at a time, and at most about once per {freshness} seconds.
+    """
+
+    def __init__(self, collect, freshness):
+        """Prepare the cache. Nothing is collected until the first scrape.
+
+        Args:
+            collect: A function which collects and returns a new sample, such as refresh_stats().
+            freshness: The time in seconds (float) for which a sample is reused.
+        """
+        self.collect = collect
+        self.freshness = freshness
+        self.lock = threading.Lock()
+        self.sample = None
+        self.collected = None  # The time the sample finished collecting, in monotonic seconds.
+        self.duration = 0.0  # The time the last collection took, in seconds.
+        self.collections = 0
+        self.scrapes = 0
+
+    def get(self):
+        """Return the cached sample, collecting a new one first if it has expired."""
+        requested = time.monotonic()
+        with self.lock:  # Only one scrape collects. The others wait here, and then reuse its sample.
+            self.scrapes += 1
+            if self.collected is None or (self.collected < requested and requested - self.collected >= self.freshness):
+                start = time.monotonic()
+                self.sample = self.collect()
+                self.collected = time.monotonic()
+                self.duration = self.collected - start
+                self.collections += 1
+            return self.sample
+
+
+def metric_name(key_name):
+    """Convert a key name such as 'TotalwaitRead' into a metric name such as 'zfs_pool_totalwait_read'."""
+    return "zfs_pool_" + "".join(f"_{char.lower()}" if char.isupper() and i else char.lower()
+                                 for i, char in enumerate(key_name))
+
+
+# Each key as a metric, as {key: (metric name, metric type, divisor, help text)}.
+#   Times are converted to seconds and percentages are fractions of 1. Values which count up from the
+#   import of the pool are counters, and every other number is a gauge. Labels (such as StateHealth) are
+#   exposed as a label of an "info" metric, whose value is always 1, and never as a number. The exception is
+#   VirtCompRatio, a label only so that it's displayed as is, which is a gauge like any other number.
+#   StateText isn't, since the progress of a scan changes it on every scrape, and each new label value is
+#   a new time series. The progress itself is exposed as zfs_pool_progress_ratio instead (see format_metrics()).
+zpool_metric_families = {}
+for key_name, key in zpool_keys_index.items():
+    if key_name in ("PoolName", "StateText"):  # PoolName is already the "pool" label of every metric.
+        continue
+    help_text = f"{key_name} of the ZFS pool ({key[1]})"
+    if key in zpool_profile_keys:
+        zpool_metric_families[key] = ("zfs_pool_stats_" + key_name.lstrip("_") + "_seconds", "gauge", 1000000,
+                                      f"{key_name} timing of --profile")
+    elif key[1] == "time":
+        zpool_metric_families[key] = (metric_name(key_name) + "_seconds", "gauge", 1000000, help_text)
+    elif key[1] == "label" and key_name != "VirtCompRatio":
+        zpool_metric_families[key] = (metric_name(key_name), "info", 1, help_text)
+    elif zpool_key_sources.get(key_name) == "boot":
+        zpool_metric_families[key] = (metric_name(key_name), "counter", 1, help_text + ", since the pool was imported")
+    else:
+        zpool_metric_families[key] = (metric_name(key_name), "gauge", 1, help_text)
+
+
+def format_metrics(results, cache, openmetrics=False):
+    """Format a sample in the Prometheus text exposition format, or OpenMetrics.
+
+    Args:
+        results: A list of (host, pool, zpool, ages) tuples, as returned by refresh_stats().
+        cache: The StatsCache the sample came from, whose counters are included.
+        openmetrics: If True, format as OpenMetrics instead of the Prometheus text format.
+
+    Returns:
+        A string.
+    """
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    def labels(host, **extra):
+        pairs = ([("host", host)] if host else []) + list(extra.items())
+        return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in pairs) + "}"
+
+    families = {}  # The samples of each metric, as {metric name: (metric type, help text, [lines])}
+
+    def add(name, kind, help_text, suffix, label_text, value):
+        # OpenMetrics names a metric without the "_total" or "_info" suffix of its samples, while the
+        # Prometheus text format names it with the suffix, and has no "info" type.
+        family, kind = (name, kind) if openmetrics else (name + suffix, "gauge" if kind == "info" else kind)
+        families.setdefault(family, (kind, help_text, []))[2].append(f"{name}{suffix}{label_text} {value}")
+
+    ages_seen = set()
+    for host, pool, zpool, ages in results:
+        for activity, done in progress_done(str(zpool.get(('StateText', 'label'), ""))).items():
+            add("zfs_pool_progress_ratio", "gauge", "Fraction done of each scrub, resilver or removal in progress", "",
+                labels(host, pool=pool, activity=activity), repr(done))
+        for key, value in zpool.items():
+            family = zpool_metric_families.get(key)
+            if family is None:
+                continue
+            name, kind, divisor, help_text = family
+            # Keys which weren't collected are absent, rather than exported as zeros.
+            if kind == "info":
+                if isinstance(value, str):
+                    add(name, kind, help_text, "_info", labels(host, pool=pool, **{name[len("zfs_pool_"):]: value}), 1)
+            elif isinstance(value, (int, float)):
+                add(name, kind, help_text, "_total" if kind == "counter" else "", labels(host, pool=pool),
+                    repr(value / divisor if divisor != 1 else value))
+
+        if host not in ages_seen:  # Every pool of a host shares the same sources.
+            ages_seen.add(host)
+            for source, age in ages.items():
+                if age is not None:
+                    add("zfs_pool_stats_source_age_seconds", "gauge", "Time since each source command last finished",
+                        "", labels(host, source=source), f"{age:.3f}")
+
+    add("zfs_pool_stats_collections", "counter", "Collections run, each shared by every waiting scrape",
+        "_total", "", cache.collections)
+    add("zfs_pool_stats_scrapes", "counter", "Scrapes served, including those served from the cache",
+        "_total", "", cache.scrapes)
+    add("zfs_pool_stats_collection_seconds", "gauge", "Time the last collection took", "", "", f"{cache.duration:.3f}")
+
+    lines = []
+    for family, (kind, help_text, samples) in families.items():
+        lines.append(f"# HELP {family} {help_text}")
+        lines.append(f"# TYPE {family} {kind}")
+        lines.extend(samples)
+    if openmetrics:
+        lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+def serve_metrics(cache, address):
+    """Serve metrics over HTTP at /metrics until interrupted. Each request is handled by its own thread.
+
+    Args:
+        cache: The StatsCache to serve samples from.
+        address: A tuple of (address, port) to listen on, as returned by parse_address().
+    """
+    # Imported here, since http.server takes longer to import than the rest of the package.
+    import http.server
+    import socket
+
+    class MetricsHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.partition('?')[0] not in ("/", "/metrics"):
+                self.send_error(404, "Metrics are served at /metrics")
+                return
+            openmetrics = "application/openmetrics-text" in self.headers.get("Accept", "")
+            try:
+                body = format_metrics(cache.get(), cache, openmetrics).encode()
+            except Exception as error:  # Report the failure to the scraper, rather than dropping the connection.
+                self.send_error(500, f"Collection failed: {error}")
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/openmetrics-text; version=1.0.0; charset=utf-8" if openmetrics
+                             else "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):  # Don't print a line per scrape.
+            pass
+
+    class MetricsServer(http.server.ThreadingHTTPServer):
+        address_family = socket.AF_INET6 if ":" in address[0] else socket.AF_INET
+        daemon_threads = True
+
+    with MetricsServer(address, MetricsHandler) as server:
+        server.serve_forever()
@@ -0,0 +1,152 @@
+""" Writing one record per pool per tick in csv, jsonl or influx format, for --output. """
+import csv
+import json
+import os
+import sys
+import time
+
+
+class OutputWriter:
+    """Write records for other tools to read, as CSV, JSON Lines or InfluxDB line protocol.
+
+    Records are written through a large buffer, and only flushed every {flush_interval} seconds, so that
+    running for days costs as little I/O as possible. A file can optionally be rotated once it grows
+    beyond {rotate_size}: FILE becomes FILE.1, FILE.1 becomes FILE.2, and so on, up to {keep} files.
+    """
+
+    def __init__(self, kind, path=None, flush_interval=10.0, rotate_size=None, keep=5, raw_fields=None, formatted_fields=None):
+        """Open the output.
+
+        Args:
+            kind: The record format, one of "csv", "jsonl" or "influx".
+            path: The file to append to, or None for stdout.
+            flush_interval: How often (in seconds) to flush buffered records. 0 flushes every record.
+            rotate_size: The size in bytes at which to rotate the file, or None to never rotate it.
+            keep: The number of rotated files to keep.
+            raw_fields: The names of the raw keys given a CSV column, in order. None takes them from the first
+                        record written, which may be missing the keys of sources which haven't answered yet.
+            formatted_fields: The names of the formatted keys given a CSV column, in order, the same as raw_fields.
+        """
+        self.kind = kind
+        self.path = path
+        self.flush_interval = flush_interval
+        self.rotate_size = rotate_size if path else None  # stdout can't be rotated.
+        self.keep = keep
+        self.raw_fields = raw_fields
+        self.formatted_fields = formatted_fields
+        self.last_flush = time.monotonic()
+        self.open()
+
+    def open(self):
+        """Open (or re-open, after rotating) the output."""
+        if self.path is None:
+            self.file = sys.stdout
+            self.size = 0
+        else:
+            self.file = open(self.path, "a", buffering=1024 * 1024, newline="")
+            self.size = os.path.getsize(self.path)
+        self.csv = csv.writer(self.file, lineterminator="\n") if self.kind == "csv" else None
+        self.fields = None  # The CSV header of raw and formatted keys, as a tuple of two lists. See write().
+
+    def rotate(self):
+        """Close the file, shift the older files along, and start a new one."""
+        self.file.close()
+        for i in range(self.keep - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+        self.open()
+
+    def write(self, timestamp, host, pool, zpool, formatted):
+        """Write one record.
+
+        Args:
+            timestamp: The time the record was collected, in seconds since the epoch (float).
+            host: The host the pool belongs to, or None for this machine.
+            pool: The name of the pool.
+            zpool: A dictionary of raw ZFS pool statistics, as returned by get_stats() for one pool.
+            formatted: A dictionary of formatted values, as returned by conv_dict_notation().
+
+        Keys which weren't collected are left out of the record (or left empty, in CSV), rather than written as 0.
+        """
+        raw = {key[0]: int(value) if isinstance(value, float) and value.is_integer() else value
+               for key, value in zpool.items()}
+
+        if self.kind == "csv":
+            if self.fields is None:
+                self.fields = (list(self.raw_fields or raw), list(self.formatted_fields or formatted))
+                if self.size == 0:  # Only write the header at the start of a file.
+                    self.csv.writerow(["time", "host", "pool"] + self.fields[0] + [f"{name}_fmt" for name in self.fields[1]])
+            line_values = [f"{timestamp:.3f}", host or "", pool] + [raw.get(field, "") for field in self.fields[0]] \
+                + [formatted.get(field, "") for field in self.fields[1]]
+            self.csv.writerow(line_values)
+            self.size += sum(len(str(value)) + 1 for value in line_values)
+        else:
+            if self.kind == "jsonl":
+                line = json.dumps({"time": round(timestamp, 3), "host": host, "pool": pool,
+                                   "raw": raw, "formatted": formatted}, default=str) + "\n"
+            else:
+                line = self.format_influx(timestamp, host, pool, zpool)
+            self.file.write(line)
+            self.size += len(line)
+
+        if self.rotate_size is not None and self.size >= self.rotate_size:
+            self.rotate()
+        elif time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    @staticmethod
+    def format_influx(timestamp, host, pool, zpool):
+        """Format one record as a line of InfluxDB line protocol, with numbers as fields and labels as string fields.
+
+        Each field must keep one type across every line, so labels are always strings (except VirtCompRatio,
+        which is always a number), and values which don't fit the type of their key are left out."""
+        def escape_tag(value):
+            return str(value).replace("\\", "\\\\").replace(",", "\\,").replace("=", "\\=").replace(" ", "\\ ")
+
+        tags = f"pool={escape_tag(pool)}" + (f",host={escape_tag(host)}" if host else "")
+        fields = []
+        for (name, key_type), value in zpool.items():
+            if key_type == "label" and name != "VirtCompRatio":
+                value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+                fields.append(f'{name}="{value}"')
+            elif isinstance(value, (int, float)):
+                fields.append(f"{name}={int(value) if isinstance(value, float) and value.is_integer() else value}")
+        return f"zfs_pool,{tags} {','.join(fields)} {int(timestamp * 1000000000)}\n"
+
+    def flush(self):
+        """Send buffered records to the output."""
+        self.file.flush()
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        """Flush buffered records, and close the file (if not stdout)."""
+        self.flush()
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+def write_records(get_records, writer, interval=1.0, profiler=None):
+    """On a loop, write records for every pool, without any interactive display.
+
+    Args:
+        get_records: A function which returns a list of (host, pool, zpool, formatted) tuples to be written,
+                     called once per interval. See OutputWriter.write() for their format.
+        writer: The OutputWriter to write to.
+        interval: The delay in seconds (float) between records.
+        profiler: An optional Profiler, to time each tick and the writing of its records.
+    """
+    next_tick = time.monotonic()
+    while True:
+        if profiler is not None:
+            profiler.tick(interval)
+        timestamp = time.time()
+        records = get_records()
+        start = time.monotonic()
+        for host, pool, zpool, formatted in records:
+            writer.write(timestamp, host, pool, zpool, formatted)
+        if profiler is not None:
+            profiler.add("render", time.monotonic() - start)
+
+        next_tick = max(next_tick + interval, time.monotonic())
+        time.sleep(max(next_tick - time.monotonic(), 0))
@@ -0,0 +1,57 @@
+""" Timing each stage of every tick, for --profile. """
+import collections
+import time
+
+from .keys import zpool_profile_keys
+
+
+class Profiler:
+    """Time each stage of every tick, for --profile.
+
+    The latest timing of each stage is kept to be shown as a column, and the last {keep} timings of
+    each stage are kept for the summary printed on exit.
+    """
+
+    def __init__(self, keep=100000):
+        self.samples = collections.defaultdict(lambda: collections.deque(maxlen=keep))  # {stage: seconds}
+        self.latest = {}  # The latest timing of each stage, as {stage: seconds}
+        self.last_tick = None  # The time the previous tick started, in monotonic seconds.
+
+    def add(self, stage, seconds):
+        """Keep a timing of a stage. Safe to call from the collector's worker threads."""
+        self.samples[stage].append(seconds)
+        self.latest[stage] = seconds
+
+    def tick(self, interval):
+        """Mark the start of a tick, and keep how far the time since the previous tick deviated from interval."""
+        now = time.monotonic()
+        if self.last_tick is not None:
+            # A tick after a late one may start a little early, to get back on schedule. The lateness was already counted.
+            self.add("drift", max(now - self.last_tick - interval, 0))
+        self.last_tick = now
+
+    def columns(self, durations=None):
+        """Return the latest timings as values for the keys of {zpool_profile_keys}, in microseconds.
+        Stages which haven't been timed yet are left out.
+
+        Args:
+            durations: An optional dictionary of source names to the time in seconds their command last took,
+                       as kept by SourceCollector. Otherwise, the latest time of any host's command is used.
+        """
+        latest = dict(self.latest)
+        latest.update(durations or {})
+        columns = {}
+        for key in zpool_profile_keys:
+            seconds = latest.get(key[0].removeprefix("_t_").removeprefix("_"))
+            if seconds is not None:
+                columns[key] = seconds * 1000000
+        return columns
+
+    def summary(self):
+        """Return a table of the p50, p95 and maximum of each stage, as a string."""
+        lines = [f"{'Stage':<12}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'count':>8}"]
+        for stage, samples in list(self.samples.items()):
+            ordered = sorted(samples)
+            values = [ordered[round(0.5 * (len(ordered) - 1))], ordered[round(0.95 * (len(ordered) - 1))], ordered[-1]]
+            lines.append(f"{stage:<12}" + "".join(f"{value * 1000:>10.2f}" for value in values) + f"{len(ordered):>8}")
+        return "\n".join(lines)
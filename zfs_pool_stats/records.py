@@ -0,0 +1,90 @@
+""" Fixed-layout records of the statistics of one pool, as returned by collect().
+
+Only the library API (collect()) returns Samples. The display, --output, --serve and the history of --columns
+aggregates work on the dictionaries of get_stats() directly, since they also carry keys which aren't fields
+of a Sample: the aggregate columns of --columns, and host-prefixed pool names.
+"""
+from .convert import conv_column, zpool_keys_map
+from .keys import zpool_derived_keys, zpool_profile_keys, zpool_source_keys
+
+# The keys held by each Sample, in a fixed order: the keys of each source (in the order of {zpool_source_keys}),
+# then the keys derived from them, then the timings of --profile.
+zpool_record_keys = tuple(key for keys in zpool_source_keys.values() for key in keys) + \
+                    tuple(zpool_derived_keys) + tuple(zpool_profile_keys)
+
+
+class Sample:
+    """The statistics of one pool, collected at one point in time.
+
+    Each statistic is an attribute named after its key, such as sample.BwWrite or sample.StateHealth.
+    Sizes are in bytes, times in microseconds and percentages are fractions of 1, all as floats.
+    Labels are strings (or floats, where they are numbers). The keys of sources which weren't
+    collected are unset, and raise AttributeError.
+
+    Every key has a slot, in the order of {zpool_record_keys}, so a sample has no dictionary of its own,
+    and holds its values in a fixed layout rather than a dictionary keyed by (key name, key type) tuples.
+    """
+
+    fields = tuple(key[0] for key in zpool_record_keys)
+    __slots__ = ("host", "pool", "time", "ages") + fields
+
+    def __init__(self, host, pool, collected, stats, ages=None):
+        """
+        Args:
+            host: The SSH destination the pool was collected from, or None for this machine.
+            pool: The name of the pool.
+            collected: The time the sample was collected, in seconds since the epoch (float).
+            stats: A dictionary of the pool's statistics, as returned by get_stats() for one pool.
+            ages: A dictionary of source names to the age in seconds of their values, as returned by SourceCollector.ages().
+        """
+        self.host = host
+        self.pool = pool
+        self.time = collected
+        self.ages = ages
+        for key in zpool_record_keys:
+            value = stats.get(key)
+            if value is not None:
+                setattr(self, key[0], value)
+
+    def values(self):
+        """Return the value of every key, in the order of {fields}. Keys which are unset are None."""
+        return tuple(getattr(self, name, None) for name in self.fields)
+
+    def as_dict(self):
+        """Return every statistic of the sample which is set, as a dictionary of key names to values."""
+        return {name: value for name, value in zip(self.fields, self.values()) if value is not None}
+
+    def format(self, name, notation=None):
+        """Return a statistic converted to a readable string, the same as a column of the display (e.g. '1.2G').
+
+        Args:
+            name: The name of the key, such as 'BwWrite'.
+            notation: An optional list of sub-arguments, as in --columns (e.g. ['M']). Otherwise, the notation is chosen automatically.
+        """
+        key_type = zpool_record_keys[self.fields.index(name)][1]
+        return zpool_keys_map[key_type](getattr(self, name, "-"), notation)
+
+    def __repr__(self):
+        return f"Sample(host={self.host!r}, pool={self.pool!r}, time={self.time!r})"
+
+
+def format_samples(samples, columns):
+    """Convert the same statistics of many samples to readable strings, one column at a time.
+
+    Args:
+        samples: A list of Sample.
+        columns: A dictionary of key names to notations (a list of sub-arguments, or None), as in --columns.
+
+    Returns:
+        A list of dictionaries of key names to strings, one per sample. Unset keys are '-'.
+
+    Raises:
+        ValueError if a notation doesn't exist for its key. See conv_column().
+    """
+    outputs = [{} for _ in samples]
+    for name, notation in columns.items():
+        key_type = zpool_record_keys[Sample.fields.index(name)][1]
+        values = conv_column([getattr(sample, name, "-") for sample in samples], key_type, notation or None)
+        for output, value in zip(outputs, values):
+            output[name] = value
+    return outputs
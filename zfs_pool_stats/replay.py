@@ -0,0 +1,257 @@
+""" Recording the raw output of every command run (--record), and replaying it later (--replay). """
+import collections
+import gzip
+import json
+import subprocess
+import threading
+import time
+import zlib
+
+
+class CommandLog:
+    """An append-only, gzip-compressed log of the raw output of every command run, for --record.
+
+    Each line of the log is a JSON event. Every run starts with a header event, and each command is
+    numbered, so its events can be told apart from those of commands running at the same time:
+        {"n": 3, "t": 1.02, "host": null, "cmd": "...", "out": "...", "rc": 0}   A command run by run().
+        {"n": 4, "t": 1.05, "host": null, "cmd": "..."}                          A command started by popen(),
+        {"n": 4, "t": 2.05, "line": "..."}                                       each line of its output,
+        {"n": 4, "t": 9.31, "rc": -15}                                           and its exit code.
+    Times are in seconds since the header, from the monotonic clock.
+    """
+
+    def __init__(self, path, flush_interval=10.0):
+        """Open the log and write the header event.
+
+        Args:
+            path: The file to append to.
+            flush_interval: How often (in seconds) to flush buffered events. 0 flushes every event.
+        """
+        self.file = gzip.open(path, "at", encoding="utf-8")
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()  # Commands run from several threads at once.
+        self.start = time.monotonic()
+        self.last_flush = self.start
+        self.count = 0
+        self.write({"start": time.time()})
+
+    def begin(self):
+        """Return a new command number."""
+        with self.lock:
+            self.count += 1
+            return self.count
+
+    def write(self, event):
+        """Append an event, stamped with the current time."""
+        line = json.dumps({"t": round(time.monotonic() - self.start, 6), **event}, separators=(",", ":")) + "\n"
+        with self.lock:
+            if self.file is None:  # A background command which outlived the log.
+                return
+            self.file.write(line)
+            if time.monotonic() - self.last_flush >= self.flush_interval:
+                self.file.flush()
+                self.last_flush = time.monotonic()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+            self.file = None
+
+
+class RecordedProcess:
+    """Wrap a subprocess.Popen object, and log each line of its stdout as it is read."""
+
+    def __init__(self, process, log, number):
+        self.process = process
+        self.log = log
+        self.number = number
+        self.stdout = self.read_lines()
+
+    def read_lines(self):
+        for line in self.process.stdout:
+            self.log.write({"n": self.number, "line": line})
+            yield line
+
+    def wait(self, *args, **kwargs):
+        returncode = self.process.wait(*args, **kwargs)
+        self.log.write({"n": self.number, "rc": returncode})
+        return returncode
+
+    def __getattr__(self, name):  # Everything else (poll(), terminate(), returncode) is the process's own.
+        return getattr(self.process, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        with self.process:
+            pass
+        self.log.write({"n": self.number, "rc": self.process.returncode})
+
+
+class RecordingTransport:
+    """Run commands through another transport, and log their output to a CommandLog."""
+
+    def __init__(self, transport, log, host=None):
+        """Args:
+            transport: The transport which really runs the commands.
+            log: The CommandLog to append to.
+            host: The host the transport runs commands on, or None for this machine.
+        """
+        self.transport = transport
+        self.log = log
+        self.host = host
+
+    def run(self, cmdline):
+        number = self.log.begin()
+        try:
+            output = self.transport.run(cmdline)
+        except subprocess.CalledProcessError as error:
+            self.log.write({"n": number, "host": self.host, "cmd": cmdline, "out": error.output or "", "rc": error.returncode})
+            raise
+        self.log.write({"n": number, "host": self.host, "cmd": cmdline, "out": output, "rc": 0})
+        return output
+
+    def popen(self, cmdline):
+        number = self.log.begin()
+        process = self.transport.popen(cmdline)
+        self.log.write({"n": number, "host": self.host, "cmd": cmdline})
+        return RecordedProcess(process, self.log, number)
+
+    def close(self):
+        self.transport.close()
+
+
+class ReplayFinished(Exception):
+    """Raised once the recorded output of a command has all been replayed."""
+
+
+class ReplayLog:
+    """The commands of a CommandLog, loaded for replaying.
+
+    Each time a command is run, the output of its next recorded run is returned, at the time it was
+    recorded (divided by {speed}). Commands are matched by host and command line, so the pools and
+    interval must be the same as when recording.
+    """
+
+    def __init__(self, path, speed=1.0):
+        """Load the log.
+
+        Args:
+            path: The file written by a CommandLog. Several recordings appended to the same file are replayed one after another.
+            speed: How many times faster than real time to replay, or 0 for as fast as possible.
+        """
+        self.speed = speed
+        self.runs = {}  # The recorded runs of each command, as {(host, command line): deque of runs}
+        self.hosts = []  # Every host recorded, in the order they first appear.
+        self.finished = False
+        self.now = 0.0  # The recorded time reached so far, when replaying as fast as possible.
+
+        runs = {}  # The runs of the current recording, as {command number: run}
+        offset = end = 0.0  # Recordings appended to the same file continue from where the previous one ended.
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            try:
+                for line in file:
+                    if not line.endswith("\n"):  # The last event was cut off part way through writing it.
+                        break
+                    event = json.loads(line)
+                    if "start" in event:
+                        runs, offset = {}, end
+                        continue
+                    end = offset + event["t"]
+                    if "cmd" in event:
+                        run = runs[event["n"]] = {"t": end, "out": event.get("out"), "lines": [], "rc": event.get("rc")}
+                        self.runs.setdefault((event["host"], event["cmd"]), collections.deque()).append(run)
+                        if event["host"] not in self.hosts:
+                            self.hosts.append(event["host"])
+                    elif event["n"] in runs:
+                        if "line" in event:
+                            runs[event["n"]]["lines"].append((end, event["line"]))
+                        else:
+                            runs[event["n"]]["rc"] = event["rc"]
+            except (EOFError, gzip.BadGzipFile, zlib.error, UnicodeDecodeError, json.JSONDecodeError):
+                # The recorder was killed before closing the log, so it has no gzip trailer, or the log was
+                # damaged later on. Replay what was read before then.
+                pass
+        self.start = time.monotonic()
+
+    def next_run(self, host, cmdline):
+        """Return the next recorded run of a command. Raises ReplayFinished if there are none left."""
+        try:
+            return self.runs[host, cmdline].popleft()
+        except (KeyError, IndexError):
+            self.finished = True
+            raise ReplayFinished(f"No more recorded output for `{cmdline}`" + (f" on {host}" if host else ""))
+
+    def clock(self):
+        """Return the recorded time the replay has reached, in seconds. See SourceCollector."""
+        return (time.monotonic() - self.start) * self.speed if self.speed > 0 else self.now
+
+    def wait_until(self, recorded_time):
+        """Sleep until the replay reaches a recorded time. As fast as possible, it is reached at once."""
+        if self.speed > 0:
+            time.sleep(max(self.start + recorded_time / self.speed - time.monotonic(), 0))
+        else:
+            self.now = max(self.now, recorded_time)
+
+
+class ReplayProcess:
+    """Stand in for a subprocess.Popen object, replaying each recorded line of stdout at the time it was read."""
+
+    def __init__(self, log, run):
+        self.log = log
+        self.run = run
+        self.returncode = None
+        self.stopped = threading.Event()
+        self.stdout = self.read_lines()
+
+    def read_lines(self):
+        for recorded_time, line in self.run["lines"]:
+            self.log.wait_until(recorded_time)
+            if self.stopped.is_set():
+                return
+            yield line
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self, timeout=None):
+        self.returncode = self.run["rc"] if self.run["rc"] is not None else 0
+        return self.returncode
+
+    def terminate(self):
+        self.stopped.set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.wait()
+
+
+class ReplayTransport:
+    """Return the recorded output of commands from a ReplayLog, instead of running them."""
+
+    def __init__(self, log, host=None):
+        """Args:
+            log: The ReplayLog to replay.
+            host: The host whose commands to replay, or None for this machine.
+        """
+        self.log = log
+        self.host = host
+
+    def run(self, cmdline):
+        run = self.log.next_run(self.host, cmdline)
+        self.log.wait_until(run["t"])
+        if run["rc"]:
+            raise subprocess.CalledProcessError(run["rc"], cmdline, run["out"])
+        return run["out"]
+
+    def popen(self, cmdline):
+        try:
+            return ReplayProcess(self.log, self.log.next_run(self.host, cmdline))
+        except ReplayFinished as error:
+            raise OSError(str(error))  # The same as a command which failed to start.
+
+    def close(self):
+        pass
@@ -0,0 +1,658 @@
+""" The source commands, and the collection of their output into the statistics of each pool. """
+import concurrent.futures
+import math
+import os
+import re
+import subprocess
+import threading
+import time
+
+from .convert import conv_float
+from .keys import zpool_event_sources, zpool_key_sources, zpool_source_keys, zpool_source_refresh
+
+
+class IostatStream:
+    """Keep one `zpool iostat -Hypl <pools> <interval>` process running, and remember its latest output.
+
+    Without a count argument, `zpool iostat` prints a new line every interval until it is killed,
+    so we only pay for starting the process (and the SSH session) once. A background thread reads
+    each line as it arrives and keeps the latest one per pool. If the process dies, it is restarted.
+    A line older than {max_intervals} intervals (such as while `zpool iostat` can't be restarted) is
+    no longer returned, so old bandwidth is never shown as live.
+    """
+
+    max_intervals = 2
+
+    def __init__(self, pools, interval, transport, restart_delay=1.0, clock=time.monotonic):
+        """Start the background reader.
+
+        Args:
+            pools: A list of the ZFS pools to collect statistics on. `zpool iostat` prints one line per pool.
+            interval: The delay in seconds (float) between samples printed by `zpool iostat`.
+            transport: The transport used to run `zpool iostat`, as returned by make_transport().
+            restart_delay: The delay in seconds (float) before restarting `zpool iostat` if it exits.
+            clock: The function which returns the current time in seconds, against which the age of each line
+                   is measured. Replays use the time of the recording instead.
+        """
+        self.pools = pools
+        self.interval = interval
+        self.transport = transport
+        self.restart_delay = restart_delay
+        self.clock = clock
+        self.samples = {}  # The latest line of `zpool iostat` as (time read, values split from it), keyed by pool name.
+        self.process = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._reader, daemon=True)
+        self._thread.start()
+
+    def _reader(self):
+        """Read lines from `zpool iostat` until stop() is called, restarting it whenever it exits."""
+        while not self._stopped.is_set():
+            try:
+                self.process = self.transport.popen(f"zpool iostat -Hypl {' '.join(self.pools)} {self.interval:g}")
+                for line in self.process.stdout:
+                    values = line.rstrip('\n').split('\t')  # `-H` separates values with tabs.
+                    if len(values) > 1:  # Ignore blank or garbled lines.
+                        self.samples[values[0]] = (self.clock(), values)
+                self.process.wait()
+            except OSError:  # Failed to start the process at all (e.g. `ssh` is missing).
+                pass
+            # Wait a bit before restarting, so a command which keeps failing doesn't spin the CPU.
+            self._stopped.wait(self.restart_delay)
+
+    def latest(self, pool):
+        """Return the latest sample read for pool, as a list of strings, or None if there isn't a recent one."""
+        sample = self.samples.get(pool)
+        if sample is None or self.clock() - sample[0] > self.max_intervals * self.interval:
+            return None
+        return sample[1]
+
+    def stop(self):
+        """Stop reading, and terminate the `zpool iostat` process."""
+        self._stopped.set()
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+
+
+class EventFollower:
+    """Keep one `zpool events -f -H -v` process running, and report which sources each new event affects.
+
+    `zpool events -f` prints the events already in the kernel's buffer, then waits for new ones. With -v,
+    each event is a line of its time and class, followed by its fields (including the pool) and a blank line.
+    A background thread parses each event as it ends, and passes the sources it affects (from
+    {zpool_event_sources}) to on_event(). If the process dies, it is restarted, and the buffer is read again.
+    """
+
+    def __init__(self, pools, transport, on_event, restart_delay=1.0):
+        """Start the background reader.
+
+        Args:
+            pools: A list of the ZFS pools to follow. Events of other pools are ignored.
+            transport: The transport used to run `zpool events`, as returned by make_transport().
+            on_event: A function called with a tuple of source names, for each event which affects any.
+            restart_delay: The delay in seconds (float) before restarting `zpool events` if it exits.
+        """
+        self.pools = set(pools)
+        self.transport = transport
+        self.on_event = on_event
+        self.restart_delay = restart_delay
+        self.count = 0  # The number of events read which affected any source.
+        self.process = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._reader, daemon=True)
+        self._thread.start()
+
+    def _reader(self):
+        """Read events from `zpool events` until stop() is called, restarting it whenever it exits."""
+        while not self._stopped.is_set():
+            try:
+                self.process = self.transport.popen("zpool events -f -H -v")
+                event_class = pool = None
+                for line in self.process.stdout:
+                    if line.strip() == "":  # The end of an event.
+                        self.dispatch(event_class, pool)
+                        event_class = pool = None
+                    elif not line[0].isspace():  # The time and class of a new event, separated by a tab.
+                        self.dispatch(event_class, pool)
+                        event_class, pool = line.split()[-1], None
+                    elif line.lstrip().startswith("pool = "):
+                        pool = line.split("=", 1)[1].strip().strip('"')
+                self.dispatch(event_class, pool)  # The last event, if the output ended without a blank line.
+                self.process.wait()
+            except OSError:  # Failed to start the process at all (e.g. `ssh` is missing).
+                pass
+            # Wait a bit before restarting, so a command which keeps failing doesn't spin the CPU.
+            self._stopped.wait(self.restart_delay)
+
+    def dispatch(self, event_class, pool):
+        """Pass the sources affected by an event to on_event(), unless it concerns another pool."""
+        if event_class is None or (pool is not None and pool not in self.pools):
+            return
+        name = event_class.rpartition(".")[2]
+        sources = zpool_event_sources.get(name, ("status",) if event_class.startswith("ereport.") else None)
+        if sources:
+            self.count += 1
+            self.on_event(sources)
+
+    def stop(self):
+        """Stop reading, and terminate the `zpool events` process."""
+        self._stopped.set()
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+
+
+def parse_refresh(refresh, defaults=zpool_source_refresh):
+    """Convert the --refresh flag into a refresh interval for each source.
+
+    Args:
+        refresh: A dictionary of source or column names to sub-arguments, as returned by parse_complex_arg().
+        defaults: A dictionary of source names to their refresh intervals when not mentioned.
+
+    Returns:
+        A dictionary of source names to refresh intervals (float seconds), where 0 is every tick
+        and None is only on demand. Sources not mentioned keep their default from {defaults}.
+
+    Raises:
+        ValueError if a name isn't a source or column, or its refresh isn't tick, demand or a number of seconds (0 or more).
+    """
+    intervals = dict(defaults)
+    explicit = {}
+    for key, value in refresh.items():
+        name = key if key in intervals else zpool_key_sources.get(key)
+        try:
+            tier = value[0].lower()
+            seconds = 0 if tier == "tick" else None if tier == "demand" else float(tier)
+            if seconds is not None and not 0 <= seconds < math.inf:  # Also rejects "nan".
+                raise ValueError(tier)
+        except (TypeError, ValueError):
+            name = None
+        if name is None:
+            raise ValueError(f"ERROR: Invalid --refresh entry '{key}'. Use Source:Seconds, Source:tick or Source:demand.")
+        # If several columns of one source are given, the most frequent refresh wins.
+        if name in explicit and (seconds is None or (explicit[name] is not None and explicit[name] < seconds)):
+            continue
+        explicit[name] = seconds
+    intervals.update(explicit)
+    return intervals
+
+
+def parse_timeouts(timeouts, defaults):
+    """Convert the --timeouts flag into a timeout for each source.
+
+    Args:
+        timeouts: A dictionary of source names to sub-arguments, as returned by parse_complex_arg().
+        defaults: A dictionary of the names of the sources being run to their timeouts when not mentioned.
+
+    Returns:
+        A dictionary of source names to timeouts (float seconds). Sources not mentioned keep their default from {defaults}.
+
+    Raises:
+        ValueError if a source isn't being run, or its timeout isn't a positive number of seconds.
+    """
+    seconds = dict(defaults)
+    for name, value in timeouts.items():
+        try:
+            if name not in defaults:
+                raise ValueError(name)
+            seconds[name] = float(value[0])
+            if not 0 < seconds[name] < math.inf:  # Also rejects "nan".
+                raise ValueError(value[0])
+        except (TypeError, ValueError):
+            raise ValueError(f"ERROR: Invalid --timeouts entry '{name}'. Use Source:Seconds, where Source is one of: "
+                             f"{', '.join(defaults)}")
+    return seconds
+
+
+def make_sources(interval, transport, stream=None, kstat=None):
+    """Construct the functions which run each source command and split its output into values.
+
+    Each source runs a single command for all pools at once, so monitoring more pools doesn't start more processes.
+
+    Args:
+        interval: The delay in seconds (float) over which `zpool iostat` samples the pool.
+        transport: The transport used to run the commands, as returned by make_transport().
+        stream: An optional IostatStream. If given, the `zpool iostat` values are taken from its
+                latest sample, instead of running `zpool iostat` again.
+        kstat: An optional KstatReader. If given, the `zpool iostat` values are calculated from
+               kstat counters instead, and the "boot" source is added.
+
+    Returns:
+        A dictionary of source names (matching {zpool_source_keys}) to functions. Each function accepts
+        a tuple of pool names and returns a dictionary of pool names to lists of strings. Pools which
+        have no values available yet may be missing.
+    """
+
+    def source_iostat(pools):
+        if kstat is not None:
+            return {pool: kstat.sample(pool) for pool in pools}
+        if stream is not None:
+            return {pool: stream.latest(pool) for pool in pools}
+        lines = transport.run(f"zpool iostat -Hypl {' '.join(pools)} {interval:g} 1").splitlines()
+        return {values[0]: values for values in (line.split('\t') for line in lines)}
+
+    def source_capacity(pools):
+        properties = ("used", "available", "compressratio", "usedbychildren")
+        lines = transport.run(f"zfs get {','.join(properties)} {' '.join(pools)} -Hp -d 0 -o name,property,value").splitlines()
+        values = {}
+        for name, prop, value in (line.split('\t') for line in lines):
+            values.setdefault(name, {})[prop] = value
+        return {pool: [values[pool].get(prop, "-") for prop in properties] for pool in values}
+
+    # Only list filesystems and volumes, because `usedbysnapshots` of a dataset already accounts for all of
+    # its snapshots. Listing every snapshot as well (as `zfs get -r` does) is what used to make this so slow.
+    snapshot_index = SnapshotIndex()
+
+    def source_snaps(pools):
+        cmdline = f"zfs list -Hp -r -t filesystem,volume -o name,usedbysnapshots {' '.join(pools)}"
+        with transport.popen(cmdline) as process:
+            seen = snapshot_index.update(process.stdout)
+        if process.returncode != 0:  # Keep what was read, but don't forget datasets based on a partial list.
+            raise subprocess.CalledProcessError(process.returncode, cmdline)
+        snapshot_index.prune(seen)
+        return {pool: [str(snapshot_index.totals.get(pool, 0))] for pool in pools}
+
+    def source_health(pools):
+        lines = transport.run(f"zpool list -H -o name,health,frag {' '.join(pools)}").splitlines()
+        return {values[0]: values[1:] for values in (line.split('\t') for line in lines)}
+
+    def source_status(pools):
+        return {pool: [text] for pool, text in parse_status(transport.run(f"zpool status {' '.join(pools)}")).items()}
+
+    def source_boot(pools):
+        return {pool: kstat.totals(pool) for pool in pools}
+
+    sources = {"iostat": source_iostat, "capacity": source_capacity, "snaps": source_snaps,
+               "health": source_health, "status": source_status}
+    if kstat is not None:
+        sources["boot"] = source_boot
+    return sources
+
+
+def list_pools(transport, kstat=None):
+    """Return a list of the names of every imported pool.
+
+    Args:
+        transport: The transport used to run `zpool list`, as returned by make_transport().
+        kstat: An optional KstatReader. If given, pools are listed from its kstat directory instead of `zpool list`.
+    """
+    if kstat is not None:
+        return sorted(name for name in os.listdir(kstat.root) if os.path.isdir(os.path.join(kstat.root, name)))
+    return transport.run("zpool list -H -o name").split()
+
+
+def parse_status(text):
+    """Condense `zpool status` output into one line of text per pool.
+
+    For each pool, the lines after "pool:" and "state:" are joined together (e.g. "scan:", "remove:",
+    "status:" and "action:"), up to but not including the "config:" section. The "scan:" and "remove:"
+    sections are shortened by parse_progress().
+
+    Args:
+        text: The output of `zpool status`, for one or more pools.
+
+    Returns:
+        A dictionary of pool names to strings.
+    """
+    statuses = {}
+    lines = None  # The lines of the pool currently being read, or None while skipping its config.
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("pool: "):
+            lines = statuses[line[6:]] = []
+        elif line == "config:":
+            lines = None
+        elif lines is not None and line and not line.startswith("state: "):
+            lines.append(line)
+
+    output = {}
+    for pool, lines in statuses.items():
+        sections = []  # Each section starts with its heading (e.g. "scan:"), and continues over the lines which don't.
+        for line in lines:
+            if re.match(r"[a-z]+: ", line) or not sections:
+                sections.append([line])
+            else:
+                sections[-1].append(line)
+        output[pool] = " ".join(parse_progress(section) if section[0].startswith(("scan: ", "remove: ")) else " ".join(section)
+                                for section in sections)
+    return output
+
+
+def parse_progress(lines):
+    """Shorten the "scan:" or "remove:" section of `zpool status` to its activity and progress.
+
+    A finished scan or removal is a single line, which is kept as is. One in progress is followed by lines
+    of counters, of which only the percentage done and the time to go are kept. For example:
+        scan: scrub in progress since Sun Jul 25 16:07:49 2021
+            1.23T scanned at 1.2G/s, 345G issued at 345M/s, 2.00T total
+            0B repaired, 16.85% done, 01:23:45 to go
+    becomes "scan: scrub in progress, 16.85% done, 01:23:45 to go".
+
+    Args:
+        lines: The stripped lines of the section, starting with its heading.
+
+    Returns:
+        A string.
+    """
+    heading, since, _ = lines[0].partition(" since ")
+    if not since:
+        return " ".join(lines)
+    progress = re.search(r"([\d.]+% done)(?:, (.+ to go|no estimated completion time))?", " ".join(lines[1:]))
+    if progress is None:  # The counters are still being calculated.
+        return heading
+    return ", ".join(part for part in (heading, *progress.groups()) if part)
+
+
+def in_progress(text):
+    """Return True if a pool's status (as returned by parse_status()) shows a scan or removal in progress."""
+    return re.search(r"(scan|remove): [^,]* in progress", text) is not None
+
+
+def progress_done(text):
+    """Return the fraction done of each scan or removal in progress in a pool's status (as returned by parse_status()).
+
+    Returns:
+        A dictionary of activities to fractions of 1, where the activity is the kind of scan (such as "scrub"
+        or "resilver"), or "removal". Empty if nothing is in progress, or its progress isn't known yet.
+    """
+    return {heading.split()[0] if section == "scan" else "removal": float(percent) / 100
+            for section, heading, percent in re.findall(r"(scan|remove): ([^,]*) in progress, ([\d.]+)% done", text)}
+
+
+class SourceCollector:
+    """Run all source commands at the same time, and gather whichever have finished.
+
+    Each source has its own timeout, counted from the start of the tick. A source which hasn't
+    finished by then is left running in the background, and its last finished values are used
+    in the meantime. It isn't started again until it finishes, so a slow command never piles up.
+
+    Each source also has a refresh interval. Until it expires, the source isn't run at all, and
+    its cached values are used instead.
+    """
+
+    def __init__(self, sources, timeouts, refresh=None, clock=time.monotonic, on_timing=None):
+        """Start the worker threads.
+
+        Args:
+            sources: A dictionary of source names to functions, as returned by make_sources().
+            timeouts: A dictionary of source names to the time in seconds (float) to wait for each source.
+            refresh: A dictionary of source names to refresh intervals, as returned by parse_refresh().
+                     Sources not mentioned are run every tick.
+            clock: The function which returns the current time in seconds, against which refresh intervals
+                   and ages are measured. Replays use the time of the recording instead.
+            on_timing: An optional function, called with (source name, seconds) whenever a source finishes.
+        """
+        self.sources = sources
+        self.timeouts = timeouts
+        self.refresh = refresh or {}
+        self.clock = clock
+        self.on_timing = on_timing
+        self.durations = {}  # The time each source took to run last time, as {source name: seconds}
+        self.wait_time = 0.0  # The time the last collect() spent waiting for sources, in seconds.
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(sources))
+        self.pending = {}  # Sources which are still running, as {source name: Future}
+        self.results = {}  # The last finished values of each source, as {source name: {pool: [values]}}
+        self.updated = {}  # The time each source last finished, as {source name: seconds of clock()}
+        self.demanded = 0.0  # Sources which finished before this time are re-run, whatever their refresh interval.
+        self.invalidated = set()  # Sources to re-run on the next tick, whatever their refresh interval. See invalidate().
+
+    def is_stale(self, name, now):
+        """Return True if the cached values of a source have expired, and it should be run again."""
+        updated = self.updated.get(name)
+        if updated is None or updated < self.demanded or name in self.invalidated:
+            return True
+        interval = self.refresh.get(name, 0)
+        return interval is not None and now - updated >= interval
+
+    def demand(self):
+        """Re-run every source on the next tick, including those which are only refreshed on demand."""
+        self.demanded = self.clock()
+
+    def invalidate(self, names):
+        """Re-run only the given sources on the next tick, such as after an event which changed their values.
+
+        A source which is already running is re-run once it finishes, since it may have missed the change.
+        Names of sources which this collector doesn't run are ignored.
+        """
+        self.invalidated.update(name for name in names if name in self.sources)
+
+    def ages(self):
+        """Return the age in seconds (float) of the values of each source, or None if there are none."""
+        now = self.clock()
+        return {name: now - self.updated[name] if name in self.updated else None for name in self.sources}
+
+    def collect(self, pools):
+        """Run every expired source (unless it is still running from a previous tick) and wait for them.
+
+        Args:
+            pools: A list of the ZFS pools to collect statistics on.
+
+        Returns:
+            A dictionary of pool names to dictionaries of source names to their latest list of values,
+            or None where a source has never finished.
+        """
+        start = time.monotonic()
+        now = self.clock()
+
+        for name, func in self.sources.items():
+            if name not in self.pending and self.is_stale(name, now):
+                self.invalidated.discard(name)
+                self.pending[name] = self.executor.submit(self.timed, name, func, tuple(pools))
+
+        for name in self.sources:
+            future = self.pending.get(name)
+            if future is None:  # Not expired yet. Use its cached values.
+                continue
+            try:
+                self.results[name] = future.result(timeout=max(start + self.timeouts[name] - time.monotonic(), 0))
+                self.updated[name] = self.clock()
+            except concurrent.futures.TimeoutError:  # Still running. Leave it be, and use its last values.
+                continue
+            except Exception:  # The command failed. Use its last values, and try again next tick.
+                pass
+            del self.pending[name]
+
+        self.wait_time = time.monotonic() - start
+        return {pool: {name: self.results.get(name, {}).get(pool) for name in self.sources} for pool in pools}
+
+    def timed(self, name, func, pools):
+        """Run a source, and keep the time it took (whether it finished or failed)."""
+        start = time.monotonic()
+        try:
+            return func(pools)
+        finally:
+            self.durations[name] = time.monotonic() - start
+            if self.on_timing is not None:
+                self.on_timing(name, self.durations[name])
+
+    def stop(self):
+        """Stop the worker threads, without waiting for running sources to finish."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def parse_kstat(text):
+    """Parse the contents of a kstat file from /proc/spl/kstat/zfs into a dictionary.
+
+    Two layouts are understood. "Named" kstats list one 'name type data' row per value, while
+    "io" kstats have a single row of column names, followed by a single row of values.
+
+    Args:
+        text: The whole contents of the kstat file, including its first (header) line.
+
+    Returns:
+        A dictionary of value names to values, as strings.
+    """
+    lines = text.splitlines()[1:]  # Skip the kstat header (kid, type, flags, ndata, etc.)
+    if not lines:
+        return {}
+    if lines[0].split()[:2] == ["name", "type"]:  # Named kstat
+        return {fields[0]: fields[2] for fields in (line.split(None, 2) for line in lines[1:]) if len(fields) == 3}
+    return dict(zip(lines[0].split(), lines[1].split())) if len(lines) > 1 else {}
+
+
+class KstatReader:
+    """Calculate `zpool iostat` style rates from the cumulative counters in /proc/spl/kstat/zfs/<pool>/.
+
+    Reading these files costs no subprocess at all, and doesn't wait for a sampling interval: rates are
+    calculated against the counters read on the previous call, over the real time elapsed in between.
+
+    The pool-wide "io" kstat is used where it exists. Newer OpenZFS versions removed it, in which case
+    the "objset-*" kstats of every dataset are summed instead. Those count the I/O of datasets rather than
+    disks, and no kstat has latency or capacity, so those keys are left empty.
+    """
+
+    # The kstat counters behind OpsRead, OpsWrite, BwRead and BwWrite, in that order.
+    counter_names = ("reads", "writes", "nread", "nwritten")
+
+    def __init__(self, root="/proc/spl/kstat/zfs", clock=time.monotonic):
+        """Prepare to read kstat counters.
+
+        Args:
+            root: The kstat directory, containing one sub-directory per pool.
+            clock: The function which returns the current time in seconds, against which rates are calculated.
+        """
+        self.root = root
+        self.clock = clock
+        self.previous = {}  # The counters read on the previous call, as {pool: (seconds of clock(), [counters])}
+        self.lock = threading.Lock()  # The "iostat" and "boot" sources run on different threads.
+
+    def read_counters(self, pool):
+        """Read the cumulative counters of pool.
+
+        Returns:
+            A list of ints, in the order of {counter_names}.
+        """
+        path = os.path.join(self.root, pool)
+        if os.path.exists(os.path.join(path, "io")):
+            with open(os.path.join(path, "io")) as file:
+                files = [file.read()]
+        else:
+            files = []
+            for name in os.listdir(path):
+                if name.startswith("objset-"):
+                    with open(os.path.join(path, name)) as file:
+                        files.append(file.read())
+
+        counters = [0] * len(self.counter_names)
+        for text in files:
+            values = parse_kstat(text)
+            for i, name in enumerate(self.counter_names):
+                counters[i] += int(values.get(name, 0))
+        return counters
+
+    def sample(self, pool):
+        """Return values for the keys of the "iostat" source, with rates since the previous call.
+
+        The first call for a pool has nothing to compare against, so its rates are 0.
+        """
+        with self.lock:
+            now = self.clock()
+            counters = self.read_counters(pool)
+            then, previous = self.previous.get(pool, (now, counters))
+            self.previous[pool] = (now, counters)
+
+        elapsed = now - then
+        rates = [f"{(new - old) / elapsed:.0f}" if elapsed > 0 else "0" for new, old in zip(counters, previous)]
+
+        iostat_len = len(zpool_source_keys["iostat"])
+        return [pool, "-", "-"] + rates + ["-"] * (iostat_len - 3 - len(rates))
+
+    def totals(self, pool):
+        """Return values for the keys of the "boot" source: the counters since the pool was imported.
+
+        The counters are read afresh, rather than reused from sample(), which may not have run yet this tick.
+        """
+        return [str(counter) for counter in self.read_counters(pool)]
+
+
+class SnapshotIndex:
+    """Keep the space used by snapshots of each dataset, and the total for each pool.
+
+    Each pass over `zfs list` output is parsed line by line as it arrives, and only datasets whose
+    value changed since the previous pass are applied to the running totals.
+    """
+
+    def __init__(self):
+        self.datasets = {}  # Space used by snapshots, in bytes, as {dataset name: int}
+        self.totals = {}  # Space used by snapshots of all datasets, in bytes, as {pool name: int}
+
+    def update(self, lines):
+        """Apply one pass of `zfs list -Hp -o name,usedbysnapshots` output.
+
+        Args:
+            lines: An iterable of tab-separated lines, such as the stdout of a transport's popen().
+
+        Returns:
+            A set of the dataset names seen during this pass.
+        """
+        seen = set()
+        for line in lines:
+            name, _, used = line.rstrip('\n').partition('\t')
+            if not used.isdigit():  # Ignore blank or garbled lines.
+                continue
+            seen.add(name)
+            used = int(used)
+            previous = self.datasets.get(name)
+            if used != previous:
+                pool = name.partition('/')[0]
+                self.totals[pool] = self.totals.get(pool, 0) + used - (previous or 0)
+                self.datasets[name] = used
+        return seen
+
+    def prune(self, seen):
+        """Forget datasets which no longer exist.
+
+        Args:
+            seen: A set of the dataset names seen during the latest complete pass, as returned by update().
+        """
+        for name in self.datasets.keys() - seen:
+            self.totals[name.partition('/')[0]] -= self.datasets.pop(name)
+
+
+def get_stats(pools, collector):
+    """Ingest ZFS pool statistics from `iostat`, `zfs get` and `zpool status` system commands.
+    Args:
+        pools: A list of the ZFS pools to collect statistics on.
+        collector: The SourceCollector which runs the system commands.
+
+    Returns:
+        A dictionary of pool names to dictionaries of ZFS pool statistics, formatted as floats or strings.
+        The keys of a source which hasn't finished yet (or output too few values) are left unset, along with
+        the keys derived from them, so they are never mistaken for zeros. Displays show them as "-"."""
+
+    stats = {}
+    for pool, results in collector.collect(pools).items():
+        # Merge the keys and values of each source into a dictionary.
+        #   Starting from ["Name"], the values of `zpool iostat` are assigned. Starting from ["VirtCapUsed"], the values of `zfs get` are assigned.
+        #   Starting from ["StateHealth"], the values of `zfs get` (again) are assigned. Starting from ["StateText"], the values of `zpool status` are assigned.
+        zpool = {}
+        for name, values in results.items():
+            keys = zpool_source_keys.get(name)
+            if keys is None:  # The sources of --vdevs and --datasets aren't keys of the pool. See render_vdev_rows().
+                continue
+            # If a source hasn't finished yet, or output too few values, leave its keys unset.
+            if values is None or len(values) < len(keys):
+                continue
+            # zip() only keeps as many values as we have keys for. Newer versions of `zpool iostat`
+            # may print extra columns, which would otherwise misalign every key after them.
+            zpool.update(zip(keys, values))
+
+        # Convert all eligible values to floats, so we can do math.
+        zpool = {key: conv_float(value) for key, value in zpool.items()}
+
+        # Always name the pool, even before `zpool iostat` has answered.
+        zpool[('PoolName', 'label')] = pool
+
+        # Create some more dictionary entries, but only from keys which were collected.
+        # Correctly reference keys by their full tuple names
+        if ('VirtCapUsed', 'size') in zpool:
+            zpool.update({('VirtCapTot', 'size'): zpool[('VirtCapUsed', 'size')] + zpool[('VirtCapFree', 'size')]})
+            zpool.update({('VirtCapUsedPerc', 'perc'): (zpool['VirtCapUsed', 'size'] / zpool['VirtCapTot', 'size']) if zpool['VirtCapTot', 'size'] else 0,
+                          ('VirtCompPerc', 'perc'): max(zpool['VirtCompRatio', 'label'] - 1, 0)})
+        if ('TotalwaitRead', 'time') in zpool:
+            zpool.update({('TotalwaitBoth', 'time'): zpool['TotalwaitRead', 'time'] + zpool['TotalwaitWrite', 'time']})
+        if ('StateFragPerc', 'perc') in zpool:
+            zpool.update({('StateFragPerc', 'perc'): zpool['StateFragPerc', 'perc'] * 0.01})
+
+        stats[pool] = zpool
+
+    return stats
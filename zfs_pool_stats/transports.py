@@ -0,0 +1,261 @@
+""" Transports, which run the source commands on this machine or on a remote host. """
+import os
+import secrets
+import shlex
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+
+
+def kill_process(process, group=True):
+    """Kill a process if it's still running, along with every command it started if it has its own session.
+
+    Killing a shell alone isn't enough, since the commands it started keep its stdout open until they exit.
+    """
+    if process.returncode is None:  # Not reaped yet, so its pid (and process group) can't have been reused.
+        try:
+            if group:
+                os.killpg(process.pid, signal.SIGKILL)
+            else:
+                process.kill()
+        except (ProcessLookupError, PermissionError):
+            pass
+
+
+class LocalTransport:
+    """Run shell commands on this machine.
+
+    Each command is started in its own session, so close() can kill the commands which are still running
+    (such as a `zpool status` hung on a suspended pool), rather than waiting for them at exit.
+    """
+
+    # Whether each command is started in its own session. See SSHTransport.
+    own_session = True
+
+    def __init__(self):
+        self.processes = set()  # The processes started by run() and popen(), until they have been reaped.
+        self.lock = threading.Lock()
+
+    def argv(self, cmdline):
+        """Return the argument list which runs cmdline through a shell."""
+        return ["sh", "-c", cmdline]
+
+    def run(self, cmdline):
+        """Run a shell command and return its output.
+
+        Args:
+            cmdline: The shell command to run on the system.
+
+        Returns:
+            A string of the command's stdout. Raises subprocess.CalledProcessError if the command fails.
+        """
+        process = self.start(cmdline, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        try:
+            stdout, stderr = process.communicate()
+        finally:
+            with self.lock:
+                self.processes.discard(process)
+        if process.returncode != 0:
+            raise subprocess.CalledProcessError(process.returncode, cmdline, stdout, stderr)
+        return stdout
+
+    def popen(self, cmdline):
+        """Start a long-running shell command, without waiting for it to finish.
+
+        Args:
+            cmdline: The shell command to run on the system.
+
+        Returns:
+            A subprocess.Popen object, whose stdout can be read line by line as text.
+        """
+        return self.start(cmdline, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                          text=True, bufsize=1)
+
+    def start(self, cmdline, **kwargs):
+        """Start a shell command in its own session, and keep it until it has been reaped. See close()."""
+        process = subprocess.Popen(self.argv(cmdline), start_new_session=self.own_session, **kwargs)
+        with self.lock:
+            # Forget the processes which have finished (and been waited for) since.
+            self.processes = {running for running in self.processes if running.returncode is None}
+            self.processes.add(process)
+        return process
+
+    def close(self):
+        """Release anything held open by the transport, and kill every command which is still running."""
+        with self.lock:
+            processes, self.processes = self.processes, set()
+        for process in processes:
+            kill_process(process, self.own_session)
+
+
+class SSHTransport(LocalTransport):
+    """Run shell commands on another machine via SSH, sharing one persistent connection between them.
+
+    The first command opens an SSH ControlMaster connection, and every later command is multiplexed
+    over it, so only the first pays for the TCP and crypto handshake.
+    """
+
+    # ssh is run directly rather than through a shell, so killing it is enough, and it keeps the
+    # terminal to ask for a password or passphrase.
+    own_session = False
+
+    def __init__(self, host, persist=60):
+        """Prepare the connection. It is opened by the first command.
+
+        Args:
+            host: The SSH destination, such as 'root@192.168.1.33'.
+            persist: The time in seconds (int) to keep the connection open after it was last used.
+        """
+        super().__init__()
+        self.host = host
+        self.control_dir = tempfile.mkdtemp(prefix="zfs-pool-stats-")
+        self.options = ["-o", "ControlMaster=auto", "-o", f"ControlPath={self.control_dir}/%C",
+                        "-o", f"ControlPersist={persist}"]
+
+    def argv(self, cmdline):
+        return ["ssh"] + self.options + [self.host, cmdline]
+
+    def close(self):
+        super().close()
+        subprocess.run(["ssh"] + self.options + ["-O", "exit", self.host], capture_output=True)
+        shutil.rmtree(self.control_dir, ignore_errors=True)
+
+
+class AgentSession:
+    """A shell kept running on the system, which runs one command at a time as they are sent to it.
+
+    Each command is written as a single line. After its output, the shell prints an end marker line
+    containing a random token and the command's exit code, which frames the response.
+    """
+
+    # The token is passed as $0, so it never has to be quoted into the script itself.
+    script = 'while IFS= read -r cmd; do sh -c "$cmd" </dev/null 2>/dev/null; printf "\\n%s %d\\n" "$0" $?; done'
+
+    def __init__(self, shell):
+        """Start the shell.
+
+        Args:
+            shell: The LocalTransport or SSHTransport used to start the shell.
+        """
+        self.token = secrets.token_hex(16)
+        self.process = subprocess.Popen(shell.argv(f"sh -c {shlex.quote(self.script)} {self.token}"),
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.DEVNULL, text=True, bufsize=1,
+                                        start_new_session=shell.own_session)
+        self.own_session = shell.own_session
+
+    def request(self, cmdline):
+        """Run a shell command in the session and return its output.
+
+        Raises subprocess.CalledProcessError if the command fails, or ConnectionError if the session has ended.
+        """
+        if "\n" in cmdline:
+            raise ValueError("Commands sent to an agent session must be a single line.")
+        try:
+            self.process.stdin.write(cmdline + "\n")
+            self.process.stdin.flush()
+        except (BrokenPipeError, ValueError):  # ValueError if the session was closed, along with its stdin.
+            raise ConnectionError("The agent session has ended.")
+
+        lines = []
+        while True:
+            line = self.process.stdout.readline()
+            if not line:
+                raise ConnectionError("The agent session has ended.")
+            if line.startswith(self.token + " "):
+                returncode = int(line.split()[1])
+                break
+            lines.append(line)
+
+        output = "".join(lines)[:-1]  # Remove the newline printed before the end marker.
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, cmdline, output)
+        return output
+
+    def close(self):
+        """End the session, and kill the command it's running, if any."""
+        if self.process.poll() is None:
+            kill_process(self.process, self.own_session)
+            try:
+                self.process.stdin.close()
+            except OSError:
+                pass
+
+
+class AgentTransport:
+    """Run shell commands through a pool of long-lived agent sessions, rather than a new process each.
+
+    Commands which run concurrently each get their own session, and sessions are reused afterwards.
+    Long-running commands (popen()) can't share a session, so they are started through the underlying shell.
+    """
+
+    def __init__(self, shell, max_idle=8):
+        """Prepare the pool. Sessions are started as they are needed.
+
+        Args:
+            shell: The LocalTransport or SSHTransport used to start sessions. Using a LocalTransport runs the
+                   agent on this machine, which behaves the same as a remote agent.
+            max_idle: The maximum number of idle sessions to keep open.
+        """
+        self.shell = shell
+        self.max_idle = max_idle
+        self.idle = []
+        self.busy = set()  # The sessions which are running a command, so close() can end them too.
+        self.lock = threading.Lock()
+
+    def run(self, cmdline):
+        with self.lock:
+            session = self.idle.pop() if self.idle else None
+        if session is None:
+            session = AgentSession(self.shell)
+        with self.lock:
+            self.busy.add(session)
+
+        try:
+            output = session.request(cmdline)
+        except (OSError, ValueError):  # The session is unusable. Don't return it to the pool.
+            with self.lock:
+                self.busy.discard(session)
+            session.close()
+            raise
+        except subprocess.CalledProcessError:  # The command failed, but the session is fine.
+            self.release(session)
+            raise
+        self.release(session)
+        return output
+
+    def release(self, session):
+        """Return a session to the pool, or end it if the pool is full."""
+        with self.lock:
+            self.busy.discard(session)
+            if len(self.idle) < self.max_idle:
+                self.idle.append(session)
+                return
+        session.close()
+
+    def popen(self, cmdline):
+        return self.shell.popen(cmdline)
+
+    def close(self):
+        with self.lock:
+            sessions, self.idle, self.busy = self.idle + list(self.busy), [], set()
+        for session in sessions:
+            session.close()
+        self.shell.close()
+
+
+def make_transport(host=None, kind="ssh"):
+    """Construct the transport used to run commands on a host.
+
+    Args:
+        host: The SSH destination, or None to run commands on this machine.
+        kind: Either "ssh" to run each command separately (over a shared SSH connection, if remote),
+              or "agent" to run them through long-lived agent sessions.
+
+    Returns:
+        A LocalTransport, SSHTransport or AgentTransport.
+    """
+    shell = SSHTransport(host) if host else LocalTransport()
+    return AgentTransport(shell) if kind == "agent" else shell
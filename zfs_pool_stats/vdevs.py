@@ -0,0 +1,193 @@
+""" The per-vdev and per-disk tree of --vdevs, with the latency percentiles of each disk. """
+import array
+import bisect
+import itertools
+import math
+
+from .convert import conv_bytes, conv_float, conv_microseconds
+from .keys import zpool_source_keys
+
+
+def parse_vdev_tree(text):
+    """Read the layout of each pool's vdevs and disks from the "config:" section of `zpool status`.
+
+    `zpool iostat -v -H` prints device names without any indentation, so the tree is taken from here,
+    where each level is indented by two more spaces. Section headings such as "logs" and "cache" are
+    kept, at the same depth as the pool's top-level vdevs.
+
+    Args:
+        text: The output of `zpool status`, for one or more pools.
+
+    Returns:
+        A dictionary of pool names to lists of (depth, device name) tuples, in order, not including the pool itself.
+        Top-level vdevs have a depth of 1.
+    """
+    trees = {}
+    pool = devices = None  # The pool being read, and its devices, or None outside of a config section.
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("pool: "):
+            pool, devices = stripped[6:], None
+        elif stripped == "config:" and pool is not None:
+            devices = trees[pool] = []
+        elif devices is not None:
+            if stripped.startswith("errors:"):
+                devices = None
+            elif stripped and not stripped.startswith("NAME "):
+                depth = (len(line.lstrip('\t')) - len(line.lstrip())) // 2
+                name = stripped.split()[0]
+                if name != pool:
+                    devices.append((max(depth, 1), name))
+    return trees
+
+
+def parse_vdev_iostat(text, pools):
+    """Split `zpool iostat -v -Hypl` output into the values of each device, per pool.
+
+    Each pool's block of lines starts with the pool itself, followed by each of its devices.
+
+    Args:
+        text: The output of `zpool iostat -v -Hypl`.
+        pools: The names of the pools it was run for.
+
+    Returns:
+        A dictionary of pool names to dictionaries of device names to lists of strings, in the
+        order of the "iostat" keys of {zpool_source_keys}.
+    """
+    devices = {}
+    current = None
+    for line in text.splitlines():
+        values = line.split('\t')
+        if len(values) < 2:
+            continue
+        if values[0] in pools:
+            current = devices[values[0]] = {}
+        elif current is not None and any(value != "-" for value in values[1:]):  # Not a heading, such as "logs".
+            current[values[0]] = values
+    return devices
+
+
+# The columns of each bucket line of `zpool iostat -w`, after the bucket itself.
+#   Newer versions add a "rebuild" column on the end, which isn't used.
+histogram_columns = ("total_wait_read", "total_wait_write", "disk_wait_read", "disk_wait_write", "syncq_wait_read",
+                     "syncq_wait_write", "asyncq_wait_read", "asyncq_wait_write", "scrub", "trim")
+
+
+def parse_latency_histograms(text, pools, columns=("disk_wait_read", "disk_wait_write")):
+    """Parse `zpool iostat -w -v -Hyp` output into one flat array of bucket counts, per pool.
+
+    The output is a block per device (the pool first), each starting with a line holding the device's
+    name, followed by one line per latency bucket. The counts of {columns} are summed into each bucket,
+    and the counts of every device of a pool are packed one after another into a single array, so
+    reading them is a single pass over the lines.
+
+    Args:
+        text: The output of `zpool iostat -w -v -Hyp`.
+        pools: The names of the pools it was run for.
+        columns: The histogram columns to add together, from {histogram_columns}.
+
+    Returns:
+        A dictionary of pool names to (device names, bucket bounds, counts) tuples, where counts is an
+        array of len(device names) * len(bucket bounds) ints, and bucket bounds are the upper bound of
+        each bucket in microseconds, as floats. (`zpool iostat -p` prints the bounds in nanoseconds.)
+    """
+    indexes = [histogram_columns.index(column) + 1 for column in columns]
+    histograms = {}
+    current = None  # The (device names, bucket bounds, counts) of the pool being read.
+    for line in text.splitlines():
+        values = line.split('\t')
+        if len(values) == 1 or not values[0].isdigit():  # A device name (which may be a GUID), starting its block.
+            name = values[0].strip()
+            if not name:
+                continue
+            if name in pools:
+                current = histograms[name] = ([], [], array.array('Q'))
+            if current is not None:
+                current[0].append(name)
+        elif current is not None:
+            names, bounds, counts = current
+            if len(names) == 1 and len(counts) == len(bounds):  # The buckets are the same for every device.
+                bounds.append(int(values[0]) / 1000)  # Nanoseconds to microseconds, as conv_microseconds() expects.
+            counts.append(sum(int(values[i]) for i in indexes if i < len(values) and values[i].isdigit()))
+    return histograms
+
+
+def histogram_percentiles(counts, bounds, quantiles=(0.5, 0.99)):
+    """Calculate percentiles from the packed bucket counts of several devices, in one pass.
+
+    Each percentile is the upper bound of the bucket which it falls into.
+
+    Args:
+        counts: An array of bucket counts, as returned by parse_latency_histograms().
+        bounds: The upper bound of each bucket, in microseconds.
+        quantiles: The percentiles to calculate, as fractions of 1.
+
+    Returns:
+        A list with one list of percentiles per device (in microseconds), in the order of quantiles.
+        Devices without any I/O have percentiles of 0.
+    """
+    buckets = len(bounds)
+    percentiles = []
+    for start in range(0, len(counts) - buckets + 1, buckets) if buckets else ():
+        cumulative = list(itertools.accumulate(counts[start:start + buckets]))
+        total = cumulative[-1]
+        percentiles.append([bounds[bisect.bisect_left(cumulative, math.ceil(quantile * total))] if total else 0
+                            for quantile in quantiles])
+    return percentiles
+
+
+def make_vdev_sources(interval, transport):
+    """Construct the sources of --vdevs, which run alongside (and in the same way as) those of make_sources().
+
+    Returns:
+        A dictionary of source names to functions. Each function accepts a tuple of pool names and returns a
+        dictionary of pool names to a single value: the tree of devices, the values of each device, or
+        the (p50, p99) of each device's disk latency.
+    """
+    def source_tree(pools):
+        return parse_vdev_tree(transport.run(f"zpool status {' '.join(pools)}"))
+
+    def source_vdevs(pools):
+        return parse_vdev_iostat(transport.run(f"zpool iostat -v -Hypl {' '.join(pools)} {interval:g} 1"), pools)
+
+    def source_latency(pools):
+        histograms = parse_latency_histograms(transport.run(f"zpool iostat -w -v -Hyp {' '.join(pools)} {interval:g} 1"), pools)
+        return {pool: dict(zip(names, histogram_percentiles(counts, bounds)))
+                for pool, (names, bounds, counts) in histograms.items()}
+
+    return {"tree": source_tree, "vdevs": source_vdevs, "latency": source_latency}
+
+
+def render_vdev_rows(tree, devices=None, latency=None):
+    """Render the devices of a pool as rows of an indented tree, to be shown under the pool's row.
+
+    Args:
+        tree: A list of (depth, device name) tuples, as returned by parse_vdev_tree() for one pool.
+        devices: A dictionary of device names to lists of `zpool iostat -v` values, as returned by parse_vdev_iostat().
+        latency: A dictionary of device names to their (p50, p99) disk latency, as returned by histogram_percentiles().
+
+    Returns:
+        A list of strings, one per device. Devices without statistics (such as the "logs" heading) only show their name.
+    """
+    devices = devices or {}
+    latency = latency or {}
+    if tree is None:  # `zpool status` hasn't answered yet. Show the devices without their layout.
+        tree = [(1, name) for name in devices]
+    iostat_keys = [key[0] for key in zpool_source_keys["iostat"]]
+    names = [f"{'  ' * depth}{name}" for depth, name in tree]
+    width = max(map(len, names), default=0) + 2
+
+    rows = []
+    for label, (depth, name) in zip(names, tree):
+        row = f"  {label:<{width}}"
+        values = devices.get(name)
+        if values is not None:
+            value = dict(zip(iostat_keys, map(conv_float, values)))
+            ops = [f"{value[key]:.0f}" if isinstance(value[key], float) else str(value[key]) for key in ("OpsRead", "OpsWrite")]
+            row += (f"ops {ops[0]}/{ops[1]}  bw {conv_bytes(value['BwRead'])}/{conv_bytes(value['BwWrite'])}  "
+                    f"wait {conv_microseconds(value['TotalwaitRead'])}/{conv_microseconds(value['TotalwaitWrite'])}")
+        if name in latency:
+            p50, p99 = latency[name]
+            row += f"  p50 {conv_microseconds(p50)}  p99 {conv_microseconds(p99)}"
+        rows.append(row.rstrip())
+    return rows